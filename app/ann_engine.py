@@ -0,0 +1,227 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+import json
+import time
+import threading
+
+# Third-party library imports
+import numpy as np
+from sqlalchemy import select
+
+# Local application imports
+from . import models
+from .search_cache import get_generation
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration du moteur ANN en mémoire ------------------------------------------------|
+# Collections servies par le moteur HNSW en mémoire (identifiants séparés par des virgules, vide = désactivé)
+ANN_ENGINE_COLLECTIONS = {int(collection_id) for collection_id in os.getenv("ANN_ENGINE_COLLECTIONS", "").split(",") if collection_id.strip()}
+# Dossier local des snapshots (un fichier d'index et un fichier de métadonnées par collection)
+ANN_SNAPSHOT_DIR = os.getenv("ANN_SNAPSHOT_DIR", "data/ann")
+# Paramètres HNSW de hnswlib
+ANN_M = int(os.getenv("ANN_M", 16))
+ANN_EF_CONSTRUCTION = int(os.getenv("ANN_EF_CONSTRUCTION", 200))
+ANN_EF_SEARCH = int(os.getenv("ANN_EF_SEARCH", 64))
+# Intervalle minimal (secondes) entre deux vérifications du compteur de génération de la collection en base
+ANN_SYNC_INTERVAL = float(os.getenv("ANN_SYNC_INTERVAL", 1.0))
+# Proportion des recherches également exécutées sur pgvector pour mesurer le rappel du moteur en mémoire
+ANN_COMPARE_SAMPLE_RATE = float(os.getenv("ANN_COMPARE_SAMPLE_RATE", 0.01))
+
+EMBEDDING_DIM = 1024
+SYNC_BATCH_SIZE = 1000
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Index HNSW d'une collection -----------------------------------------------------------|
+def embedding_to_numpy(embedding):
+    """Embedding lu en base en tableau float32 (en stockage halfvec, pgvector renvoie des objets HalfVector)."""
+    if hasattr(embedding, "to_numpy"):
+        embedding = embedding.to_numpy()
+    return np.asarray(embedding, dtype=np.float32)
+
+def import_hnswlib():
+    try:
+        import hnswlib
+    except ImportError:
+        raise RuntimeError("Le moteur ANN en mémoire nécessite le paquet hnswlib (pip install hnswlib).")
+    return hnswlib
+
+class CollectionAnnIndex:
+    """Index hnswlib (distance L2) des chunks d'une collection, étiquetés par chunk_id."""
+
+    def __init__(self, index, chunk_ids=(), generation=None, ef_search=ANN_EF_SEARCH):
+        self.index = index
+        self.index.set_ef(ef_search)
+        self.ef_search = ef_search
+        self.chunk_ids = set(chunk_ids)
+        self.generation = generation
+        self.checked_at = 0.0
+        # lock protège l'index hnswlib (requêtes, ajouts, redimensionnements) ; sync_lock sérialise les synchronisations
+        # avec la base, qui ne bloquent ainsi les requêtes que le temps d'appliquer chaque lot
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+
+    @classmethod
+    def create(cls, capacity=1024, m=ANN_M, ef_construction=ANN_EF_CONSTRUCTION, ef_search=ANN_EF_SEARCH):
+        index = import_hnswlib().Index(space="l2", dim=EMBEDDING_DIM)
+        index.init_index(max_elements=capacity, M=m, ef_construction=ef_construction, allow_replace_deleted=True)
+        return cls(index, ef_search=ef_search)
+
+    @classmethod
+    def load(cls, path, ef_search=ANN_EF_SEARCH):
+        """Recharge un snapshot écrit par save()."""
+        with open(f"{path}.json") as meta_file:
+            meta = json.load(meta_file)
+        index = import_hnswlib().Index(space="l2", dim=EMBEDDING_DIM)
+        index.load_index(f"{path}.bin", allow_replace_deleted=True)
+        return cls(index, chunk_ids=meta["chunk_ids"], generation=meta["generation"], ef_search=ef_search)
+
+    def save(self, path):
+        """Écrit l'index et ses métadonnées (chunk_ids, génération) ; les fichiers sont remplacés atomiquement."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self.lock:
+            self.index.save_index(f"{path}.bin.tmp")
+            meta = {"chunk_ids": sorted(self.chunk_ids), "generation": self.generation}
+        with open(f"{path}.json.tmp", "w") as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(f"{path}.bin.tmp", f"{path}.bin")
+        os.replace(f"{path}.json.tmp", f"{path}.json")
+
+    def add(self, chunk_ids, embeddings):
+        if not len(chunk_ids):
+            return
+        with self.lock:
+            needed = self.index.get_current_count() + len(chunk_ids)
+            if needed > self.index.get_max_elements():
+                self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+            self.index.add_items(np.asarray(embeddings, dtype=np.float32), np.asarray(chunk_ids), replace_deleted=True)
+            self.chunk_ids.update(chunk_ids)
+
+    def remove(self, chunk_ids):
+        with self.lock:
+            for chunk_id in set(chunk_ids) & self.chunk_ids:
+                self.index.mark_deleted(chunk_id)
+                self.chunk_ids.discard(chunk_id)
+
+    def search(self, embedding, top_n):
+        """Retourne les chunk_ids des top_n plus proches voisins et leurs distances L2."""
+        # La requête tient le verrou : hnswlib ne permet pas de redimensionner l'index (add) pendant une recherche
+        with self.lock:
+            top_n = min(top_n, len(self.chunk_ids))
+            if top_n == 0:
+                return [], []
+            if top_n > self.ef_search:
+                # ef doit être au moins égal au nombre de voisins demandés
+                self.ef_search = top_n
+                self.index.set_ef(top_n)
+            labels, distances = self.index.knn_query(np.asarray(embedding, dtype=np.float32)[None, :], k=top_n)
+        # hnswlib renvoie le carré de la distance L2, pgvector la distance elle-même
+        return labels[0].tolist(), np.sqrt(distances[0]).tolist()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Moteur ANN par collection -------------------------------------------------------------|
+class AnnEngine:
+    """
+    Index HNSW en mémoire pour les collections listées dans ANN_ENGINE_COLLECTIONS.
+
+    PostgreSQL reste la source de vérité : chaque index garde la génération de la collection (voir search_cache.py)
+    qu'il reflète, et se resynchronise par différence de chunk_ids quand elle change (upload, suppression,
+    déplacement), y compris quand l'écriture a eu lieu dans un autre worker.
+    """
+    name = "hnswlib"
+
+    def __init__(self, collection_ids=ANN_ENGINE_COLLECTIONS, snapshot_dir=ANN_SNAPSHOT_DIR, sync_interval=ANN_SYNC_INTERVAL):
+        self.collection_ids = set(collection_ids)
+        self.snapshot_dir = snapshot_dir
+        self.sync_interval = sync_interval
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def enabled_for(self, collection_id):
+        return collection_id in self.collection_ids
+
+    def snapshot_path(self, collection_id):
+        return os.path.join(self.snapshot_dir, f"collection-{collection_id}")
+
+    def load(self, db):
+        """Démarrage : recharge les snapshots (ou construit les index), puis rattrape les écritures faites depuis."""
+        for collection_id in self.collection_ids:
+            path = self.snapshot_path(collection_id)
+            if os.path.exists(f"{path}.bin") and os.path.exists(f"{path}.json"):
+                print(f"\033[94mChargement du snapshot ANN de la collection {collection_id}...\033[0m")
+                self.indexes[collection_id] = CollectionAnnIndex.load(path)
+            self.sync(db, collection_id, force=True)
+            self.indexes[collection_id].save(path)
+            print(f"\033[92mIndex ANN de la collection {collection_id} prêt ({len(self.indexes[collection_id].chunk_ids)} chunks).\033[0m")
+
+    def sync(self, db, collection_id, force=False):
+        """
+        Met l'index de la collection à jour si sa génération en base a changé (au plus une vérification par sync_interval).
+        La vérification et l'application de la différence se font sous sync_lock : deux requêtes concurrentes
+        ne peuvent pas appliquer deux fois la même différence.
+        """
+        with self.lock:
+            index = self.indexes.get(collection_id)
+            if index is None:
+                index = self.indexes[collection_id] = CollectionAnnIndex.create()
+
+        with index.sync_lock:
+            now = time.time()
+            if not force and now - index.checked_at < self.sync_interval:
+                return index
+            index.checked_at = now
+
+            # Lire la génération avant les chunks : une écriture concurrente sera rattrapée à la prochaine vérification
+            generation = get_generation(db, collection_id)
+            if generation == index.generation and not force:
+                return index
+
+            db_chunk_ids = set(db.scalars(
+                select(models.Chunk.chunk_id).where(
+                    models.Chunk.collection_id == collection_id, models.Chunk.embedding_solon.isnot(None)
+                )
+            ))
+            index.remove(index.chunk_ids - db_chunk_ids)
+
+            added = sorted(db_chunk_ids - index.chunk_ids)
+            for i in range(0, len(added), SYNC_BATCH_SIZE):
+                rows = db.execute(
+                    select(models.Chunk.chunk_id, models.Chunk.embedding_solon).where(
+                        models.Chunk.chunk_id.in_(added[i:i + SYNC_BATCH_SIZE])
+                    )
+                ).fetchall()
+                index.add([row.chunk_id for row in rows], [embedding_to_numpy(row.embedding_solon) for row in rows])
+
+            index.generation = generation
+        return index
+
+    def search(self, db, collection_id, query_embedding, top_n):
+        return self.sync(db, collection_id).search(query_embedding, top_n)
+
+    def drop(self, collection_id):
+        """Supprime l'index et le snapshot d'une collection supprimée."""
+        with self.lock:
+            self.indexes.pop(collection_id, None)
+        for extension in ("bin", "json"):
+            path = f"{self.snapshot_path(collection_id)}.{extension}"
+            if os.path.exists(path):
+                os.remove(path)
+
+    def snapshot_all(self):
+        with self.lock:
+            indexes = list(self.indexes.items())
+        for collection_id, index in indexes:
+            index.save(self.snapshot_path(collection_id))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Mesure du rappel ----------------------------------------------------------------------|
+def recall_at_k(reference_ids, candidate_ids):
+    """Proportion des chunks du chemin pgvector retrouvés par le moteur en mémoire."""
+    if not reference_ids:
+        return 1.0
+    return len(set(reference_ids) & set(candidate_ids)) / len(reference_ids)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -0,0 +1,69 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+
+# Third-party library imports
+from sqlalchemy import select, bindparam, text
+from pgvector.sqlalchemy import Vector
+
+# Local application imports
+from . import models
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration du routage --------------------------------------------------------------|
+# Proportion des recherches routées rejouées sans routage pour mesurer la précision du routage et la latence économisée
+ROUTING_COMPARE_SAMPLE_RATE = float(os.getenv("ROUTING_COMPARE_SAMPLE_RATE", 0.01))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Centroïdes des collections ------------------------------------------------------------|
+# Expressions SET de l'ajout et du retrait des chunks d'un document (les valeurs de droite sont celles avant la mise à jour)
+CENTROID_UPDATES = {
+    1: ("COALESCE(collections.embedding_sum + document.embedding_sum, document.embedding_sum)",
+        "collections.chunk_count + document.chunk_count"),
+    -1: ("CASE WHEN collections.chunk_count <= document.chunk_count THEN NULL ELSE collections.embedding_sum - document.embedding_sum END",
+         "GREATEST(collections.chunk_count - document.chunk_count, 0)"),
+}
+
+def shift_document_centroid(db, document_id, collection_id, sign):
+    """
+    Ajoute (sign = 1) ou retire (sign = -1) les embeddings des chunks d'un document à la somme de sa collection,
+    en une mise à jour SQL atomique (PostgreSQL uniquement). À appeler avant la suppression ou le déplacement des chunks.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    embedding_sum, chunk_count = CENTROID_UPDATES[sign]
+    db.execute(
+        text(
+            f"""
+            UPDATE collections SET embedding_sum = {embedding_sum}, chunk_count = {chunk_count}
+            FROM (
+                SELECT sum(embedding_solon::vector) AS embedding_sum, count(*) AS chunk_count
+                FROM chunks WHERE document_id = :document_id AND embedding_solon IS NOT NULL
+            ) AS document
+            WHERE collections.collection_id = :collection_id AND document.chunk_count > 0
+            """
+        ),
+        {"document_id": document_id, "collection_id": collection_id}
+    )
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Routage des recherches ----------------------------------------------------------------|
+def build_routing_statement(query_embedding, top_k):
+    """Les top_k collections dont le centroïde est le plus proche de la requête (distance cosinus, indépendante du nombre de chunks)."""
+    query_param = bindparam("routing_embedding", query_embedding, type_=Vector(1024))
+    return (
+        select(models.Collection.collection_id, models.Collection.name)
+        .where(models.Collection.chunk_count > 0, models.Collection.embedding_sum.isnot(None))
+        .order_by(models.Collection.embedding_sum.cosine_distance(query_param))
+        .limit(top_k)
+    )
+
+def route_collections(db, query_embedding, top_k):
+    """Retourne {collection_id: nom} des collections retenues (vide hors PostgreSQL ou sans centroïde)."""
+    if db.get_bind().dialect.name != "postgresql":
+        return {}
+    return {row.collection_id: row.name for row in db.execute(build_routing_statement(query_embedding, top_k))}
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
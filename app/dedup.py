@@ -0,0 +1,148 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+import re
+import hashlib
+
+# Third-party library imports
+import numpy as np
+from sqlalchemy import select, cast
+from pgvector.sqlalchemy import Vector
+
+# Local application imports
+from . import models
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration de la déduplication -----------------------------------------------------|
+# Traitement des chunks quasi dupliqués à l'upload :
+# "off" (aucune détection), "keep" (stockés et vectorisés, liés à l'original), "link" (stockés et liés, embedding de l'original réutilisé),
+# "skip" (non stockés : ni embedding, ni place dans les index)
+DEDUP_POLICY = os.getenv("DEDUP_POLICY", "off").lower()
+# Similarité de Jaccard (estimée par MinHash) à partir de laquelle deux chunks sont des quasi-doublons
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.9))
+# Signature MinHash : nombre de permutations, découpé en DEDUP_LSH_BANDS bandes pour l'index LSH
+MINHASH_PERMUTATIONS = int(os.getenv("MINHASH_PERMUTATIONS", 128))
+DEDUP_LSH_BANDS = int(os.getenv("DEDUP_LSH_BANDS", 16))
+# Taille des shingles (n-grammes de mots)
+DEDUP_SHINGLE_SIZE = int(os.getenv("DEDUP_SHINGLE_SIZE", 3))
+
+MERSENNE_PRIME = (1 << 31) - 1
+LOOKUP_BATCH_SIZE = 1000
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Signatures MinHash --------------------------------------------------------------------|
+# Permutations a * x + b mod p, tirées une fois avec une graine fixe : les signatures restent comparables entre workers et redémarrages
+_rng = np.random.default_rng(20240601)
+PERMUTATION_A = _rng.integers(1, MERSENNE_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+PERMUTATION_B = _rng.integers(0, MERSENNE_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+def shingles(text, size=DEDUP_SHINGLE_SIZE):
+    """n-grammes de mots du texte normalisé (minuscules, ponctuation et espaces ignorés)."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def minhash_signature(text):
+    """Signature MinHash (uint32, MINHASH_PERMUTATIONS valeurs) des shingles du texte, None pour un texte vide."""
+    hashed = np.array(
+        [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=4).digest(), "little") for shingle in shingles(text)],
+        dtype=np.uint64
+    )
+    if not len(hashed):
+        return None
+    # a < 2^31 et x < 2^32 : le produit tient dans un uint64
+    permuted = (PERMUTATION_A[:, None] * (hashed[None, :] % MERSENNE_PRIME) + PERMUTATION_B[:, None]) % MERSENNE_PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+def estimated_jaccard(signature, other):
+    """Proportion des permutations dont les minima coïncident : estimation de la similarité de Jaccard."""
+    return float(np.mean(signature == other))
+
+def signature_bytes(signature):
+    return signature.astype("<u4").tobytes()
+
+def signature_from_bytes(data):
+    return np.frombuffer(data, dtype="<u4")
+
+def lsh_band_keys(signature, bands=DEDUP_LSH_BANDS):
+    """Une clé entière (BIGINT) par bande : deux chunks partagent une clé si tous les minima de la bande coïncident."""
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([band]) + signature_bytes(rows), digest_size=8).digest(), "little", signed=True)
+        for band, rows in enumerate(np.array_split(signature, bands))
+    ]
+
+def lsh_band_rows(chunk_id, signature):
+    """Entrées de l'index LSH d'un chunk (une ligne par bande)."""
+    return [
+        models.ChunkLshBand(chunk_id=chunk_id, band=band, band_key=band_key)
+        for band, band_key in enumerate(lsh_band_keys(signature))
+    ]
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Détection des quasi-doublons ----------------------------------------------------------|
+def find_near_duplicates(db, collection_id, texts, threshold=DEDUP_THRESHOLD):
+    """
+    Calcule la signature de chaque chunk et cherche son original, par l'index LSH de la collection (table chunk_lsh_bands)
+    puis parmi les chunks précédents du même upload. Retourne (signatures, doublons), où chaque doublon vaut None,
+    ("chunk", chunk_id) pour un chunk déjà en base ou ("upload", i) pour le i-ème chunk de l'upload.
+    Seuls les originaux sont indexés : un doublon renvoie toujours vers un chunk qui n'en est pas un.
+    """
+    signatures = [minhash_signature(text) for text in texts]
+    keys = [lsh_band_keys(signature) if signature is not None else [] for signature in signatures]
+
+    # Candidats en base : chunks de la collection qui partagent au moins une bande, en quelques requêtes
+    all_keys = sorted({key for chunk_keys in keys for key in chunk_keys})
+    chunks_by_key = {}
+    for i in range(0, len(all_keys), LOOKUP_BATCH_SIZE):
+        rows = db.execute(
+            select(models.ChunkLshBand.band_key, models.ChunkLshBand.chunk_id)
+            .join(models.Chunk, models.Chunk.chunk_id == models.ChunkLshBand.chunk_id)
+            .where(models.Chunk.collection_id == collection_id, models.ChunkLshBand.band_key.in_(all_keys[i:i + LOOKUP_BATCH_SIZE]))
+        )
+        for row in rows:
+            chunks_by_key.setdefault(row.band_key, set()).add(row.chunk_id)
+
+    candidate_ids = sorted(set().union(*chunks_by_key.values())) if chunks_by_key else []
+    stored_signatures = {}
+    for i in range(0, len(candidate_ids), LOOKUP_BATCH_SIZE):
+        rows = db.execute(
+            select(models.Chunk.chunk_id, models.Chunk.minhash)
+            .where(models.Chunk.chunk_id.in_(candidate_ids[i:i + LOOKUP_BATCH_SIZE]), models.Chunk.minhash.isnot(None))
+        )
+        stored_signatures.update({row.chunk_id: signature_from_bytes(row.minhash) for row in rows})
+
+    duplicates = []
+    upload_by_key = {}
+    for index, (signature, chunk_keys) in enumerate(zip(signatures, keys)):
+        candidates = [("chunk", chunk_id) for key in chunk_keys for chunk_id in chunks_by_key.get(key, ())]
+        candidates += [("upload", other) for key in chunk_keys for other in upload_by_key.get(key, ())]
+        best, best_similarity = None, threshold
+        for candidate in dict.fromkeys(candidates):
+            other = stored_signatures.get(candidate[1]) if candidate[0] == "chunk" else signatures[candidate[1]]
+            if other is None:
+                continue
+            similarity = estimated_jaccard(signature, other)
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        duplicates.append(best)
+        if best is None:
+            for key in chunk_keys:
+                upload_by_key.setdefault(key, []).append(index)
+    return signatures, duplicates
+
+def load_chunk_embeddings(db, chunk_ids):
+    """Embeddings (listes de floats) des chunks originaux réutilisés par la politique "link"."""
+    chunk_ids = sorted(set(chunk_ids))
+    embeddings = {}
+    for i in range(0, len(chunk_ids), LOOKUP_BATCH_SIZE):
+        rows = db.execute(
+            select(models.Chunk.chunk_id, cast(models.Chunk.embedding_solon, Vector(1024)).label("embedding"))
+            .where(models.Chunk.chunk_id.in_(chunk_ids[i:i + LOOKUP_BATCH_SIZE]))
+        )
+        embeddings.update({row.chunk_id: np.asarray(row.embedding, dtype=np.float32).tolist() for row in rows})
+    return embeddings
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
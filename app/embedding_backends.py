@@ -0,0 +1,141 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+from abc import ABC, abstractmethod
+
+# Third-party library imports
+import numpy as np
+import httpx
+from starlette.concurrency import run_in_threadpool
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration des backends ------------------------------------------------------------|
+# Backend utilisé par l'API : "mlflow" (pyfunc), "torch" (PyTorch configurable), "onnx" (onnxruntime) ou "http" (service distant)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "mlflow")
+# Nombre maximum de textes envoyés au modèle en un seul appel
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+# Backend ONNX : chemin du modèle exporté et nombre de threads intra-op (0 = valeur par défaut)
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH", "models/solon-embeddings-large.onnx")
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", 0))
+# Backend HTTP : URL du service d'embedding et timeout en secondes
+EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL", "http://localhost:8081/embed")
+EMBEDDING_SERVICE_TIMEOUT = float(os.getenv("EMBEDDING_SERVICE_TIMEOUT", 30))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Interface commune ---------------------------------------------------------------------|
+class EmbeddingBackend(ABC):
+    """
+    Interface commune des backends d'embedding : embed() calcule un batch de textes,
+    embed_batch() découpe une liste arbitraire en batchs, aembed() ne bloque pas la boucle d'événements.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def embed(self, texts):
+        """Retourne un tableau numpy (len(texts), dim) pour un batch de textes."""
+
+    def embed_batch(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        """Calcule les embeddings d'une liste de textes de taille quelconque, par batchs de batch_size."""
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.vstack([self.embed(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+
+    async def aembed(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        """Version asynchrone de embed_batch : le calcul est déporté dans le pool de threads."""
+        return await run_in_threadpool(self.embed_batch, texts, batch_size)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Backend MLflow (pyfunc) ---------------------------------------------------------------|
+class MlflowEmbeddingBackend(EmbeddingBackend):
+    """Modèle pyfunc chargé depuis le registre MLflow, dans le processus de l'API."""
+
+    name = "mlflow"
+
+    def __init__(self, pyfunc_model):
+        self.model = pyfunc_model
+
+    def embed(self, texts):
+        # Le wrapper pyfunc moyenne aussi les tokens de padding : un texte par appel pour garder des embeddings identiques
+        return np.vstack([np.asarray(self.model.predict([text]), dtype=np.float32) for text in texts])
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Backend PyTorch configurable ----------------------------------------------------------|
+class TorchEmbeddingBackend(EmbeddingBackend):
+    """Modèle PyTorch du wrapper pyfunc exécuté avec le mode d'inférence configuré (voir torch_inference.py)."""
+
+    name = "torch"
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+
+    def embed(self, texts):
+        return np.asarray(self.embedder.predict(texts), dtype=np.float32)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Backend ONNX Runtime ------------------------------------------------------------------|
+class OnnxEmbeddingBackend(EmbeddingBackend):
+    """Modèle Solon exporté en ONNX et exécuté avec onnxruntime (dépendance optionnelle)."""
+
+    name = "onnx"
+
+    def __init__(self, tokenizer, model_path=ONNX_MODEL_PATH, intra_op_threads=ONNX_INTRA_OP_THREADS):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("Le backend ONNX nécessite le paquet onnxruntime (pip install onnxruntime).")
+
+        options = onnxruntime.SessionOptions()
+        if intra_op_threads > 0:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = tokenizer
+
+    def embed(self, texts):
+        inputs = self.tokenizer(list(texts), return_tensors="np", padding=True, truncation=True)
+        feeds = {name: value.astype(np.int64) for name, value in inputs.items() if name in self.input_names}
+        last_hidden_state = self.session.run(None, feeds)[0]
+
+        # Moyenne des tokens hors padding, comme le backend PyTorch
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        return (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1, None)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Backend HTTP (service d'embedding distant) --------------------------------------------|
+class HttpEmbeddingBackend(EmbeddingBackend):
+    """
+    Service d'embedding distant (voir embedding_service.py) :
+    POST {"texts": [...]} -> {"embeddings": [[...], ...]}
+    """
+
+    name = "http"
+
+    def __init__(self, url=EMBEDDING_SERVICE_URL, timeout=EMBEDDING_SERVICE_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self.client = httpx.Client(timeout=timeout)
+        self.async_client = httpx.AsyncClient(timeout=timeout)
+
+    def embed(self, texts):
+        response = self.client.post(self.url, json={"texts": list(texts)})
+        response.raise_for_status()
+        return np.asarray(response.json()["embeddings"], dtype=np.float32)
+
+    async def aembed(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        # Appels HTTP natifs asynchrones, sans passer par le pool de threads
+        texts = list(texts)
+        embeddings = []
+        for i in range(0, len(texts), batch_size):
+            response = await self.async_client.post(self.url, json={"texts": texts[i:i + batch_size]})
+            response.raise_for_status()
+            embeddings.extend(response.json()["embeddings"])
+        return np.asarray(embeddings, dtype=np.float32)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -0,0 +1,58 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+from typing import List
+
+# Third-party library imports
+import mlflow
+from mlflow.tracking import MlflowClient
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from transformers import AutoTokenizer
+
+# Local application imports
+from .init_main import get_env_variable, get_latest_model_version, load_embedding_backend, warmup_model
+from .torch_inference import configure_torch_threads
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Service d'embedding séparé de l'API ---------------------------------------------------|
+# Lancement : uvicorn app.embedding_service:app --host 0.0.0.0 --port 8081
+# L'API l'utilise avec EMBEDDING_BACKEND=http et EMBEDDING_SERVICE_URL=http://<hôte>:8081/embed
+app = FastAPI(title="Service d'embedding Solon", version="1.0.0")
+
+# Backend local utilisé par le service : "torch", "onnx" ou "mlflow"
+EMBEDDING_SERVICE_BACKEND = os.getenv("EMBEDDING_SERVICE_BACKEND", "torch")
+
+embedding_backend = None
+
+class EmbedRequest(BaseModel):
+    texts: List[str]
+
+class EmbedResponse(BaseModel):
+    embeddings: List[List[float]]
+
+@app.on_event("startup")
+async def startup_event():
+    global embedding_backend
+    configure_torch_threads()
+    mlflow.set_tracking_uri(get_env_variable("MLFLOW_TRACKING_URI"))
+    latest_version = get_latest_model_version(MlflowClient())
+    tokenizer = AutoTokenizer.from_pretrained("OrdalieTech/Solon-embeddings-large-0.1")
+    embedding_backend = load_embedding_backend(latest_version, tokenizer, backend_name=EMBEDDING_SERVICE_BACKEND)
+    warmup_model(embedding_backend)
+
+@app.post("/embed", response_model=EmbedResponse)
+async def embed(request: EmbedRequest):
+    embeddings = await embedding_backend.aembed(request.texts)
+    return EmbedResponse(embeddings=embeddings.tolist())
+
+@app.get("/health/ready")
+async def health_ready():
+    ready = embedding_backend is not None
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if ready else "not ready"}
+    )
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -0,0 +1,286 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+import json
+import time
+import shutil
+import threading
+try:
+    import fcntl
+except ImportError:
+    # Windows (lancement_api.bat) : pas de flock, un seul worker écrit les snapshots
+    fcntl = None
+
+# Third-party library imports
+import numpy as np
+from sqlalchemy import select
+
+# Local application imports
+from . import models
+from .search_cache import get_generation
+from .ann_engine import embedding_to_numpy
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration du moteur exact ---------------------------------------------------------|
+# Collections servies par la recherche exacte NumPy (identifiants séparés par des virgules, vide = désactivé)
+EXACT_ENGINE_COLLECTIONS = {int(collection_id) for collection_id in os.getenv("EXACT_ENGINE_COLLECTIONS", "").split(",") if collection_id.strip()}
+# Dossier des snapshots .npy, partagé par tous les workers de la machine (un sous-dossier par collection)
+EXACT_SNAPSHOT_DIR = os.getenv("EXACT_SNAPSHOT_DIR", "data/exact")
+# Intervalle minimal (secondes) entre deux vérifications du compteur de génération de la collection en base
+EXACT_SYNC_INTERVAL = float(os.getenv("EXACT_SYNC_INTERVAL", 1.0))
+# Compactage des segments : au-delà de ce nombre de segments ou de cette proportion de lignes supprimées
+EXACT_MAX_SEGMENTS = int(os.getenv("EXACT_MAX_SEGMENTS", 8))
+EXACT_COMPACT_RATIO = float(os.getenv("EXACT_COMPACT_RATIO", 0.2))
+
+EMBEDDING_DIM = 1024
+SYNC_BATCH_SIZE = 1000
+# Version du format des segments : un snapshot d'un autre format est reconstruit depuis la base
+SNAPSHOT_FORMAT = 2
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Snapshot .npy d'une collection --------------------------------------------------------|
+def as_rows(matrix):
+    return np.asarray(matrix, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+
+class Segment:
+    """
+    Matrice d'embeddings (memory-mapped, lecture seule), carrés de leurs normes et chunk_ids d'un segment.
+    Les embeddings sont gardés tels quels (non normalisés) : le classement suit la distance L2, comme pgvector.
+    """
+
+    def __init__(self, directory, name, deleted):
+        self.name = name
+        self.chunk_ids = np.load(os.path.join(directory, f"{name}.chunk_ids.npy"))
+        self.embeddings = np.load(os.path.join(directory, f"{name}.embeddings.npy"), mmap_mode="r")
+        self.squared_norms = np.load(os.path.join(directory, f"{name}.norms.npy"))
+        self.deleted = set(deleted)
+        self.alive = ~np.isin(self.chunk_ids, list(self.deleted))
+
+class CollectionSnapshot:
+    """
+    Snapshot d'une collection sur disque : segments .npy ajoutés à chaque rafraîchissement et chunks supprimés
+    par segment, décrits par meta.json. Les fichiers d'un segment ne sont jamais réécrits : les workers qui
+    les projettent en mémoire partagent le cache de pages du système.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.generation = None
+        self.segments = []
+        self.meta_mtime = None
+        self.lock = threading.Lock()
+        # Sérialise les synchronisations de ce worker avec la base (voir ExactEngine.sync)
+        self.sync_lock = threading.Lock()
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.directory, "meta.json")
+
+    def read_meta(self):
+        if not os.path.exists(self.meta_path):
+            return {"format": SNAPSHOT_FORMAT, "generation": None, "next_segment": 0, "segments": []}
+        with open(self.meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("format") != SNAPSHOT_FORMAT:
+            # Ancien format (embeddings normalisés) : snapshot vide, reconstruit au prochain rafraîchissement
+            return {"format": SNAPSHOT_FORMAT, "generation": None, "next_segment": meta["next_segment"], "segments": []}
+        return meta
+
+    def reload_if_changed(self):
+        """Reprojette les segments si meta.json a été remplacé (par ce worker ou un autre)."""
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self.meta_mtime:
+            return
+        meta = self.read_meta()
+        opened = {segment.name: segment for segment in self.segments}
+        segments = []
+        for entry in meta["segments"]:
+            segment = opened.get(entry["name"])
+            if segment is None or segment.deleted != set(entry["deleted"]):
+                segment = Segment(self.directory, entry["name"], entry["deleted"])
+            segments.append(segment)
+        self.segments, self.generation, self.meta_mtime = segments, meta["generation"], mtime
+
+    def chunk_ids(self):
+        return {int(chunk_id) for segment in self.segments for chunk_id in segment.chunk_ids[segment.alive]}
+
+    def write(self, generation, added_ids, added_embeddings, removed_ids):
+        """Ajoute un segment, marque les chunks supprimés et compacte si nécessaire (verrou inter-workers)."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock, open(os.path.join(self.directory, "lock"), "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            meta = self.read_meta()
+
+            removed_ids, live_ids = set(removed_ids), set()
+            for entry in meta["segments"]:
+                segment_ids = np.load(os.path.join(self.directory, f"{entry['name']}.chunk_ids.npy"))
+                entry["deleted"] = sorted(set(entry["deleted"]) | {int(chunk_id) for chunk_id in segment_ids if chunk_id in removed_ids})
+                live_ids.update(int(chunk_id) for chunk_id in segment_ids)
+                live_ids.difference_update(entry["deleted"])
+
+            # Différence calculée sur un état antérieur (autre requête ou autre worker) : les chunks déjà présents ne sont pas rajoutés
+            keep = [i for i, chunk_id in enumerate(added_ids) if int(chunk_id) not in live_ids]
+            if keep:
+                added_ids = [added_ids[i] for i in keep]
+                meta["segments"].append(self.write_segment(meta, added_ids, as_rows(added_embeddings)[keep]))
+
+            total = sum(len(np.load(os.path.join(self.directory, f"{entry['name']}.chunk_ids.npy"))) for entry in meta["segments"])
+            deleted = sum(len(entry["deleted"]) for entry in meta["segments"])
+            if len(meta["segments"]) > EXACT_MAX_SEGMENTS or (total and deleted / total > EXACT_COMPACT_RATIO):
+                meta["segments"] = self.compact(meta)
+
+            meta["generation"] = generation
+            with open(f"{self.meta_path}.tmp", "w") as meta_file:
+                json.dump(meta, meta_file)
+            os.replace(f"{self.meta_path}.tmp", self.meta_path)
+
+            # Les segments retirés restent lisibles par les workers qui les projettent encore (fichiers supprimés mais ouverts)
+            referenced = {entry["name"] for entry in meta["segments"]}
+            for file_name in os.listdir(self.directory):
+                if file_name.startswith("segment-") and file_name.split(".")[0] not in referenced:
+                    os.remove(os.path.join(self.directory, file_name))
+        self.reload_if_changed()
+
+    def write_segment(self, meta, chunk_ids, embeddings):
+        name = f"segment-{meta['next_segment']:06d}"
+        meta["next_segment"] += 1
+        arrays = (
+            ("chunk_ids", np.asarray(chunk_ids, dtype=np.int64)),
+            ("embeddings", embeddings),
+            ("norms", np.einsum("ij,ij->i", embeddings, embeddings))
+        )
+        for suffix, array in arrays:
+            path = os.path.join(self.directory, f"{name}.{suffix}.npy")
+            with open(f"{path}.tmp", "wb") as array_file:
+                np.save(array_file, array)
+            os.replace(f"{path}.tmp", path)
+        return {"name": name, "deleted": []}
+
+    def compact(self, meta):
+        """Réécrit les lignes vivantes de tous les segments dans un seul segment."""
+        chunk_ids, embeddings = [], []
+        for entry in meta["segments"]:
+            segment = Segment(self.directory, entry["name"], entry["deleted"])
+            chunk_ids.append(segment.chunk_ids[segment.alive])
+            embeddings.append(np.asarray(segment.embeddings[segment.alive]))
+        if not chunk_ids or not sum(len(ids) for ids in chunk_ids):
+            return []
+        return [self.write_segment(meta, np.concatenate(chunk_ids), np.concatenate(embeddings))]
+
+    def search(self, query_embedding, top_n):
+        """
+        Distance L2 exacte sur chaque segment (|x|² - 2 x.q + |q|², un seul produit matriciel), top_n par argpartition :
+        retourne (chunk_ids, distances L2), dans l'ordre du chemin pgvector et de son curseur de pagination.
+        """
+        query = as_rows(query_embedding)[0]
+        query_norm = float(query @ query)
+        candidate_ids, candidate_distances = [], []
+        for segment in self.segments:
+            k = min(top_n, int(segment.alive.sum()))
+            if k == 0:
+                continue
+            distances = segment.squared_norms - 2 * (segment.embeddings @ query) + query_norm
+            distances[~segment.alive] = np.inf
+            best = np.argpartition(distances, k - 1)[:k]
+            candidate_ids.append(segment.chunk_ids[best])
+            candidate_distances.append(distances[best])
+        if not candidate_ids:
+            return [], []
+        chunk_ids, distances = np.concatenate(candidate_ids), np.concatenate(candidate_distances)
+        order = np.argsort(distances, kind="stable")[:top_n]
+        return chunk_ids[order].tolist(), np.sqrt(np.maximum(distances[order], 0)).tolist()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Moteur exact par collection -----------------------------------------------------------|
+class ExactEngine:
+    """
+    Recherche exacte en mémoire pour les collections listées dans EXACT_ENGINE_COLLECTIONS (jusqu'à ~200k chunks).
+
+    Même contrat que AnnEngine (voir ann_engine.py) : PostgreSQL reste la source de vérité et le snapshot
+    suit le compteur de génération de la collection.
+    """
+    name = "numpy"
+
+    def __init__(self, collection_ids=EXACT_ENGINE_COLLECTIONS, snapshot_dir=EXACT_SNAPSHOT_DIR, sync_interval=EXACT_SYNC_INTERVAL):
+        self.collection_ids = set(collection_ids)
+        self.snapshot_dir = snapshot_dir
+        self.sync_interval = sync_interval
+        self.snapshots = {}
+        self.checked_at = {}
+        self.lock = threading.Lock()
+
+    def enabled_for(self, collection_id):
+        return collection_id in self.collection_ids
+
+    def snapshot(self, collection_id):
+        with self.lock:
+            if collection_id not in self.snapshots:
+                self.snapshots[collection_id] = CollectionSnapshot(os.path.join(self.snapshot_dir, f"collection-{collection_id}"))
+            return self.snapshots[collection_id]
+
+    def load(self, db):
+        """Démarrage : reprend les snapshots existants et rattrape les écritures faites depuis."""
+        for collection_id in self.collection_ids:
+            snapshot = self.sync(db, collection_id, force=True)
+            print(f"\033[92mSnapshot exact de la collection {collection_id} prêt ({len(snapshot.chunk_ids())} chunks).\033[0m")
+
+    def sync(self, db, collection_id, force=False):
+        """
+        Rafraîchit le snapshot si la génération de la collection en base a changé (au plus une vérification par sync_interval).
+        Vérification et application sous sync_lock ; write() ignore en plus les chunks déjà ajoutés par un autre worker.
+        """
+        snapshot = self.snapshot(collection_id)
+        with snapshot.sync_lock:
+            snapshot.reload_if_changed()
+
+            now = time.time()
+            if not force and now - self.checked_at.get(collection_id, 0.0) < self.sync_interval:
+                return snapshot
+            self.checked_at[collection_id] = now
+
+            # Lire la génération avant les chunks : une écriture concurrente sera rattrapée à la prochaine vérification
+            generation = get_generation(db, collection_id)
+            if generation == snapshot.generation and not force:
+                return snapshot
+
+            db_chunk_ids = set(db.scalars(
+                select(models.Chunk.chunk_id).where(
+                    models.Chunk.collection_id == collection_id, models.Chunk.embedding_solon.isnot(None)
+                )
+            ))
+            snapshot_ids = snapshot.chunk_ids()
+            removed = snapshot_ids - db_chunk_ids
+            added = sorted(db_chunk_ids - snapshot_ids)
+            if not added and not removed and generation == snapshot.generation:
+                return snapshot
+
+            added_ids, added_embeddings = [], []
+            for i in range(0, len(added), SYNC_BATCH_SIZE):
+                rows = db.execute(
+                    select(models.Chunk.chunk_id, models.Chunk.embedding_solon).where(
+                        models.Chunk.chunk_id.in_(added[i:i + SYNC_BATCH_SIZE])
+                    )
+                ).fetchall()
+                added_ids.extend(row.chunk_id for row in rows)
+                added_embeddings.extend(embedding_to_numpy(row.embedding_solon) for row in rows)
+
+            snapshot.write(generation, added_ids, added_embeddings, removed)
+        return snapshot
+
+    def search(self, db, collection_id, query_embedding, top_n):
+        return self.sync(db, collection_id).search(query_embedding, top_n)
+
+    def drop(self, collection_id):
+        """Supprime le snapshot d'une collection supprimée."""
+        with self.lock:
+            self.snapshots.pop(collection_id, None)
+            self.checked_at.pop(collection_id, None)
+        shutil.rmtree(os.path.join(self.snapshot_dir, f"collection-{collection_id}"), ignore_errors=True)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
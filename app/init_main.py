@@ -2,10 +2,11 @@
 # Standard library imports
 import os
 import sys
+import time
 from subprocess import call
 
 # Third-party library imports
-from sqlalchemy import inspect
+from sqlalchemy import inspect, text
 from minio import Minio
 from minio.commonconfig import REPLACE
 from dotenv import load_dotenv
@@ -16,6 +17,11 @@ import mlflow
 
 # Local application imports
 from . import database
+from .models import EMBEDDING_STORAGE
+from .torch_inference import TorchEmbedder, configure_torch_threads
+from .embedding_backends import (
+    EMBEDDING_BACKEND, MlflowEmbeddingBackend, TorchEmbeddingBackend, OnnxEmbeddingBackend, HttpEmbeddingBackend
+)
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
 
 
@@ -47,6 +53,10 @@ def initialize_services():
     AWS_SECRET_ACCESS_KEY = get_env_variable("AWS_SECRET_ACCESS_KEY")
     MLFLOW_S3_ENDPOINT_URL = get_env_variable("MLFLOW_S3_ENDPOINT_URL")
 
+    # Fixer les threads torch avant tout calcul (les threads inter-op ne sont plus modifiables ensuite)
+    print("\n\033[94mConfiguration des threads torch...\033[0m")
+    configure_torch_threads()
+
     # Initialiser le client Minio
     print("\n\033[94mInitialisation du client Minio...\033[0m")
     minio_client = Minio(
@@ -68,7 +78,7 @@ def initialize_services():
         print("\033[93mEssayer d'installer le modèle via le script dans le dossier install_models\033[0m")
         sys.exit(1)
 
-    # Charger le modèle Solon depuis MLflow
+    # Initialiser MLflow
     print("\n\033[94mInitialisation de MLflow avec l'URI de suivi...\033[0m")
     mlflow.set_tracking_uri(MLFLOW_TRACKING_URI)
     print(f"\033[92mMLflow URI de suivi défini sur {MLFLOW_TRACKING_URI}.\033[0m")
@@ -78,23 +88,42 @@ def initialize_services():
     mlflow.set_experiment("Solon-embeddings")
     print(f"\033[92mExpérience configurée sur {MLFLOW_TRACKING_URI}.\033[0m")
 
-    # Nom du modèle enregistré
-    model_name_solon = "solon-embeddings-large-model"
-
     # Créer une instance de MlflowClient
     print("\033[94mCréation du client MLflow...\033[0m")
     client = MlflowClient()
 
-    # Récupérer toutes les versions du modèle
-    print(f"\n\033[94mRécupération des versions du modèle {model_name_solon}...\033[0m")
-    model_versions = client.get_latest_versions(model_name_solon)
+    # Récupérer la dernière version du modèle
+    latest_version = get_latest_model_version(client)
+
+    # Charger le tokenizer
+    print("\n\033[94mChargement du tokenizer...\033[0m")
+    tokenizer = AutoTokenizer.from_pretrained("OrdalieTech/Solon-embeddings-large-0.1")
+    print("\033[92mTokenizer chargé avec succès.\033[0m")
+
+    # Charger le backend d'embedding choisi par EMBEDDING_BACKEND
+    embedding_backend = load_embedding_backend(latest_version, tokenizer)
+
+    return minio_client, client, embedding_backend, tokenizer, latest_version
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Chargement du modèle et du backend d'embedding ----------------------------------------|
+# Nom du modèle enregistré
+MODEL_NAME_SOLON = "solon-embeddings-large-model"
+
+def get_latest_model_version(client):
+    """Retourne la dernière version du modèle Solon enregistrée dans MLflow."""
+    print(f"\n\033[94mRécupération des versions du modèle {MODEL_NAME_SOLON}...\033[0m")
+    model_versions = client.get_latest_versions(MODEL_NAME_SOLON)
 
     # Filtrer la dernière version du modèle en fonction de l'ordre de version
     latest_version = max([int(version.version) for version in model_versions])
-    print(f"\033[92mLa dernière version du modèle {model_name_solon} est : {latest_version}.\033[0m")
+    print(f"\033[92mLa dernière version du modèle {MODEL_NAME_SOLON} est : {latest_version}.\033[0m")
+    return latest_version
 
-    # Charger le modèle depuis MLflow
-    solon_model_uri = f"models:/solon-embeddings-large-model/{latest_version}"
+def load_solon_model(latest_version):
+    """Charge le modèle pyfunc Solon depuis le registre MLflow."""
+    solon_model_uri = f"models:/{MODEL_NAME_SOLON}/{latest_version}"
     print(f"\n\033[94mChargement du modèle depuis {solon_model_uri}...\033[0m")
     solon_model = mlflow.pyfunc.load_model(solon_model_uri)
     if solon_model:
@@ -102,17 +131,33 @@ def initialize_services():
     else:
         print("\033[91mErreur lors du chargement du modèle.\033[0m")
         sys.exit(1)
-
-    # Charger le tokenizer
-    print("\n\033[94mChargement du tokenizer...\033[0m")
-    tokenizer = AutoTokenizer.from_pretrained("OrdalieTech/Solon-embeddings-large-0.1")
-    print("\033[92mTokenizer chargé avec succès.\033[0m")
-
-    return minio_client, client, solon_model, tokenizer, latest_version
+    return solon_model
+
+def load_embedding_backend(latest_version, tokenizer, backend_name=EMBEDDING_BACKEND):
+    """Instancie le backend d'embedding : "mlflow", "torch", "onnx" ou "http"."""
+    print(f"\n\033[94mInitialisation du backend d'embedding {backend_name}...\033[0m")
+    if backend_name == "http":
+        # Le modèle est servi par un service séparé, aucun poids n'est chargé dans l'API
+        embedding_backend = HttpEmbeddingBackend()
+        print(f"\033[92mService d'embedding distant : {embedding_backend.url}\033[0m")
+    elif backend_name == "onnx":
+        embedding_backend = OnnxEmbeddingBackend(tokenizer)
+    elif backend_name == "torch":
+        # Utiliser directement le modèle PyTorch du wrapper avec le mode d'inférence configuré
+        embedder = TorchEmbedder.from_pyfunc(load_solon_model(latest_version))
+        print(f"\033[92mInférence PyTorch : précision {embedder.precision}, mode {embedder.grad_mode}, attention {embedder.attention}.\033[0m")
+        embedding_backend = TorchEmbeddingBackend(embedder)
+    elif backend_name == "mlflow":
+        embedding_backend = MlflowEmbeddingBackend(load_solon_model(latest_version))
+    else:
+        print(f"\033[91mErreur : backend d'embedding inconnu '{backend_name}'.\033[0m")
+        sys.exit(1)
+    print(f"\033[92mBackend d'embedding {embedding_backend.name} initialisé.\033[0m")
+    return embedding_backend
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
 
 
-# ------------------------------------------------------ Migration des tables si nécessaire ----------------------------------------------------|
+# ------------------------------------------------------ Migration des tables ------------------------------------------------------------------|
 def check_tables_exist(engine):
     inspector = inspect(engine)
     required_tables = ['documents', 'chunks', 'collections', 'users', 'roles']
@@ -120,11 +165,64 @@ def check_tables_exist(engine):
     return all(table in existing_tables for table in required_tables)
 
 def mig_tables():
+    """
+    Applique les migrations en attente à chaque démarrage : une base existante reçoit aussi les colonnes
+    et index ajoutés depuis sa création (alembic upgrade head ne fait rien si la base est à jour).
+    """
     engine = database.engine
     if not check_tables_exist(engine):
         print("\n\033[94mTables non trouvées, exécution de la migration...\033[0m")
-        call(["alembic", "upgrade", "head"])
     else:
-        print("\n\033[92mLes tables existent déjà, migration non nécessaire.\033[0m")
+        print("\n\033[94mLes tables existent déjà, application des migrations en attente...\033[0m")
+    if call(["alembic", "upgrade", "head"]) != 0:
+        print("\033[91mErreur : échec de alembic upgrade head, le schéma de la base ne correspond pas aux modèles.\033[0m")
+        sys.exit(1)
+    print("\033[92mSchéma de la base à jour.\033[0m")
+    check_embedding_storage(engine)
     return engine
+
+def check_embedding_storage(engine):
+    """
+    Arrête le démarrage si le type de chunks.embedding_solon en base (vector ou halfvec) ne correspond pas
+    à EMBEDDING_STORAGE : les modèles liraient et écriraient les embeddings avec le mauvais type.
+    """
+    if engine.dialect.name != "postgresql":
+        return
+    with engine.connect() as connection:
+        current_type = connection.execute(
+            text(
+                """
+                SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                WHERE attrelid = 'chunks'::regclass AND attname = 'embedding_solon'
+                """
+            )
+        ).scalar()
+    if current_type.split("(")[0] != EMBEDDING_STORAGE:
+        print(f"\033[91mErreur : chunks.embedding_solon est de type {current_type} en base, "
+              f"mais EMBEDDING_STORAGE={EMBEDDING_STORAGE}. Relancer l'API avec la valeur utilisée pour la migration.\033[0m")
+        sys.exit(1)
+    print(f"\033[92mStockage des embeddings : {current_type}.\033[0m")
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Préchauffage du modèle ----------------------------------------------------------------|
+# Tailles de batch utilisées pour le préchauffage (séparées par des virgules)
+WARMUP_BATCH_SIZES = [int(size) for size in os.getenv("WARMUP_BATCH_SIZES", "1,8,32").split(",") if size.strip()]
+
+# Textes représentatifs : une requête courte de /search et un chunk complet de /upload_document (400 mots)
+WARMUP_QUERY = "Quels sont les horaires d'ouverture du service client ?"
+WARMUP_CHUNK = " ".join(["Le document décrit les procédures internes applicables aux collections et aux utilisateurs."] * 33)
+
+def warmup_model(embedding_backend):
+    """
+    Préchauffe le modèle d'embedding pour que la première requête ne paie pas le chargement paresseux
+    des poids, le premier appel au tokenizer et la croissance de l'allocateur.
+    """
+    print("\n\033[94mPréchauffage du modèle d'embedding...\033[0m")
+    for batch_size in WARMUP_BATCH_SIZES:
+        for label, text in (("requête", WARMUP_QUERY), ("chunk", WARMUP_CHUNK)):
+            start_time = time.time()
+            embedding_backend.embed([text] * batch_size)
+            print(f"\033[96mBatch {label} de taille {batch_size} : {time.time() - start_time:.2f} secondes\033[0m")
+    print("\033[92mPréchauffage du modèle terminé.\033[0m")
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
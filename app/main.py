@@ -2,9 +2,13 @@
 # Standard library imports
 import os
 import io
+import asyncio
 import re
 import sys
+import json
 import time
+import random
+import threading
 from datetime import datetime, timezone
 from subprocess import call
 from typing import List, Optional
@@ -13,12 +17,13 @@ from typing import List, Optional
 import pandas as pd
 import numpy as np
 import torch
-from sklearn.metrics.pairwise import cosine_similarity
-from sqlalchemy import inspect, select
+from sqlalchemy import inspect, select, text, or_
 from sqlalchemy.orm import Session
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Form, Request, Query
 from fastapi.templating import Jinja2Templates
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from minio import Minio
 from minio.commonconfig import REPLACE, CopySource
 from dotenv import load_dotenv
@@ -36,7 +41,25 @@ from prometheus_fastapi_instrumentator import Instrumentator
 # Local application imports
 from . import models, schemas, database
 from .auth import get_current_user, auth_router, check_permission, get_password_hash
-from .init_main import initialize_services, mig_tables, get_env_variable
+from .init_main import initialize_services, mig_tables, get_env_variable, warmup_model
+from .search import (
+    build_batch_search_statement, build_collections_search_statement, build_lexical_statement, build_chunks_statement,
+    build_document_search_statement, build_similar_documents_statement, document_embedding, reciprocal_rank_fusion,
+    binary_quantize, apply_search_settings, index_scan_size, index_used,
+    search_fingerprint, encode_search_cursor, decode_search_cursor,
+    HYBRID_CANDIDATE_FACTOR, DOCUMENT_CANDIDATE_FACTOR, SEARCH_MAX_DEPTH, SEARCH_STREAM_YIELD_PER
+)
+from .vector_index import build_vector_index, current_vector_index, drop_collection_vector_indexes, VECTOR_INDEX_TYPE
+from .search_metrics import SearchMetricsLogger, StageTimer
+from .search_cache import (
+    SearchResultCache, search_cache_key, get_generation, bump_generations, SEARCH_CACHE_ENABLED, SEARCH_CACHE_SIZE,
+    QUERY_EMBEDDING_CACHE_SIZE, SemanticResultCache, semantic_cache_scope, SEMANTIC_CACHE_ENABLED
+)
+from .ann_engine import AnnEngine, recall_at_k, ANN_COMPARE_SAMPLE_RATE
+from .exact_engine import ExactEngine
+from .collection_routing import shift_document_centroid, route_collections, ROUTING_COMPARE_SAMPLE_RATE
+from .search_planner import SearchPlanner, SEARCH_PLANNER_ENABLED
+from .dedup import find_near_duplicates, load_chunk_embeddings, lsh_band_rows, signature_bytes, DEDUP_POLICY
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
 
 # ------------------------------------------------------ Configuration des warnings ------------------------------------------------------------|
@@ -92,23 +115,77 @@ print("\033[92mRépertoire des templates configuré.\033[0m")
 # Déclarer les variables globales
 minio_client = None
 client = None
-solon_model = None
+embedding_backend = None
 tokenizer = None
 engine = None
 latest_version = None
+model_warmed_up = False
+# Métriques de qualité de la recherche, envoyées à MLflow par un thread de fond (voir search_metrics.py)
+search_metrics = SearchMetricsLogger()
+# Index HNSW en mémoire des collections listées dans ANN_ENGINE_COLLECTIONS (voir ann_engine.py)
+ann_engine = AnnEngine()
+# Recherche exacte NumPy sur des snapshots .npy des collections listées dans EXACT_ENGINE_COLLECTIONS (voir exact_engine.py)
+exact_engine = ExactEngine()
+vector_engines = (ann_engine, exact_engine)
+
+def vector_engine_for(collection_id):
+    """Moteur en mémoire activé pour la collection, None pour le chemin pgvector."""
+    return next((vector_engine for vector_engine in vector_engines if vector_engine.enabled_for(collection_id)), None)
+
+async def sync_vector_engines(db, *collection_ids):
+    """Mise à jour incrémentale des moteurs en mémoire après une écriture sur ces collections."""
+    for collection_id in collection_ids:
+        vector_engine = vector_engine_for(collection_id)
+        if vector_engine is not None:
+            await run_in_threadpool(vector_engine.sync, db, collection_id, True)
+
+def warm_up_model():
+    """Préchauffage du modèle (thread de fond) : le modèle n'est déclaré prêt qu'une fois le préchauffage réussi."""
+    global model_warmed_up
+    try:
+        warmup_model(embedding_backend)
+    except Exception as e:
+        print(f"\033[91mErreur lors du préchauffage du modèle : {e}\033[0m")
+        return
+    model_warmed_up = True
 
 @app.on_event("startup")
 async def startup_event():
-    global minio_client, client, solon_model, tokenizer, engine, latest_version
+    global minio_client, client, embedding_backend, tokenizer, engine, latest_version, model_warmed_up
     print("\n\033[94mDébut de l'initialisation des services...\033[0m")
-    minio_client, client, solon_model, tokenizer, latest_version = initialize_services()
+    minio_client, client, embedding_backend, tokenizer, latest_version = initialize_services()
     print("\033[92mServices initialisés avec succès.\033[0m")
 
     print("\033[94mVérification des tables de la base de données...\033[0m")
     engine = mig_tables()
     print("\033[92mVérification des tables terminée.\033[0m")
 
+    # Exposer l'index vectoriel en place dans les métriques
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as connection:
+            update_vector_index_metrics(*current_vector_index(connection))
+
+    # Démarrer l'envoi des métriques de recherche à MLflow en arrière-plan
+    search_metrics.start(client)
+
+    # Charger les snapshots des moteurs en mémoire et rattraper les écritures faites depuis
+    for vector_engine in vector_engines:
+        if vector_engine.collection_ids:
+            with Session(bind=engine) as db:
+                vector_engine.load(db)
+
+    # Préchauffer le modèle en arrière-plan : l'API démarre, /health/ready reste à false jusqu'à la fin du préchauffage
+    model_warmed_up = False
+    threading.Thread(target=warm_up_model, name="model-warmup", daemon=True).start()
+
     print("\n\033[94mInitialisation finished... -----------------------------------------------------------------------------------------------------\033[0m\n")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Envoyer la dernière fenêtre de métriques de recherche avant l'arrêt
+    search_metrics.stop()
+    # Snapshot des index en mémoire pour un redémarrage rapide
+    ann_engine.snapshot_all()
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
 
 
@@ -119,6 +196,33 @@ from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 @app.get("/metrics", tags=["Monitoring"], summary="Métriques de l'application", description="Exposition des métriques Prometheus pour le monitoring.")
 async def custom_metrics():
     return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/health/live", tags=["Monitoring"], summary="Liveness", description="Indique que le processus de l'API répond.")
+async def health_live():
+    return {"status": "alive"}
+
+@app.get("/health/ready", tags=["Monitoring"], summary="Readiness", description="Indique que l'API peut recevoir du trafic : modèle préchauffé, base de données et MinIO joignables.")
+async def health_ready(db: Session = Depends(database.get_db)):
+    checks = {"model": model_warmed_up}
+
+    # Vérifier la connexion à la base de données
+    try:
+        db.execute(text("SELECT 1"))
+        checks["database"] = True
+    except Exception:
+        checks["database"] = False
+
+    # Vérifier la connexion à MinIO (bucket des artefacts MLflow)
+    try:
+        checks["minio"] = minio_client is not None and minio_client.bucket_exists("mlflow")
+    except Exception:
+        checks["minio"] = False
+
+    ready = all(checks.values())
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"status": "ready" if ready else "not ready", "checks": checks}
+    )
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
 
 
@@ -510,6 +614,10 @@ async def update_collection(
     # Mettre à jour les dates de création pour refléter la dernière mise à jour
     collection.derniere_modification = datetime.now(timezone.utc)
 
+    # Un renommage change la collection désignée par filtre_par_collection : invalider le cache de recherche
+    if collection_update.name and collection_update.name != old_name:
+        bump_generations(db, collection.collection_id)
+
     db.commit()
     db.refresh(collection)
 
@@ -559,10 +667,16 @@ async def delete_collection(
             detail=f"Failed to delete bucket from MinIO: {str(e)}"
         )
 
-    # Supprimer les documents associés et les chunks de la base de données
+    # Supprimer les chunks, les index vectoriels partiels et les documents associés de la base de données
+    db.query(models.Chunk).filter(models.Chunk.collection_id == collection_id).delete(synchronize_session=False)
+    if db.get_bind().dialect.name == "postgresql":
+        drop_collection_vector_indexes(db, collection_id)
     db.query(models.Document).filter(models.Document.collection_id == collection_id).delete(synchronize_session=False)
     db.delete(collection)
+    bump_generations(db, collection_id)
     db.commit()
+    for vector_engine in vector_engines:
+        vector_engine.drop(collection_id)
 
     return {"detail": "Collection, associated documents, and MinIO bucket deleted successfully"}
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -579,6 +693,7 @@ documents_uploaded = Counter('documents_uploaded_total', 'Total number of docume
 chunks_created = Counter('chunks_created_total', 'Total number of chunks created')
 upload_file_size = Histogram('upload_file_size_bytes', 'Size of uploaded files')
 upload_processing_time = Histogram('upload_processing_time_seconds', 'Time spent processing document upload')
+near_duplicate_chunks = Counter('near_duplicate_chunks_total', 'Near-duplicate chunks detected at upload', ['policy'])
 
 # Fonction pour découper le texte en chunks de 400 mots
 def cutting_text(text, max_length=400):
@@ -686,6 +801,16 @@ async def upload_document(
     # Diviser le texte en chunks de 500 mots
     chunks = cutting_text(text)
 
+    # Quasi-doublons (MinHash/LSH) des chunks déjà présents dans la collection ou plus haut dans le document
+    signatures, duplicates = [None] * len(chunks), [None] * len(chunks)
+    if DEDUP_POLICY != "off":
+        signatures, duplicates = find_near_duplicates(db, collection_id, chunks)
+        near_duplicate_chunks.labels(policy=DEDUP_POLICY).inc(sum(duplicate is not None for duplicate in duplicates))
+        if DEDUP_POLICY == "skip":
+            # Les quasi-doublons ne sont pas stockés : seuls les originaux restent (aucun ne renvoie à un chunk écarté)
+            kept = [i for i, duplicate in enumerate(duplicates) if duplicate is None]
+            chunks, signatures, duplicates = [chunks[i] for i in kept], [signatures[i] for i in kept], [None] * len(kept)
+
     # Calcul du nombre de chunks après l'upload
     number_of_chunks = len(chunks)
     estimated_time = number_of_chunks * 2.25
@@ -712,24 +837,56 @@ async def upload_document(
     db.commit()
     db.refresh(new_document)
 
-    # Calcul des embeddings pour chaque chunk et enregistrement dans la base de données
-    for chunk_text in chunks:
-        embedding_solon = solon_model.predict([chunk_text])[0]  # Calculer l'embedding pour chaque chunk
-
+    # Calcul des embeddings par batchs, sans bloquer la boucle d'événements (politique "link" : seulement ceux des originaux)
+    to_embed = [i for i, duplicate in enumerate(duplicates) if duplicate is None or DEDUP_POLICY != "link"]
+    embeddings_solon = [None] * len(chunks)
+    for i, embedding_solon in zip(to_embed, await embedding_backend.aembed([chunks[i] for i in to_embed])):
+        embeddings_solon[i] = embedding_solon
+    if len(to_embed) < len(chunks):
+        # Les quasi-doublons liés reprennent l'embedding de leur original (déjà en base ou calculé ci-dessus)
+        stored_embeddings = load_chunk_embeddings(db, [duplicate[1] for duplicate in duplicates if duplicate and duplicate[0] == "chunk"])
+        for i, duplicate in enumerate(duplicates):
+            if embeddings_solon[i] is None:
+                embeddings_solon[i] = stored_embeddings.get(duplicate[1]) if duplicate[0] == "chunk" else embeddings_solon[duplicate[1]]
+
+    # Enregistrement des chunks dans la base de données
+    chunk_ids = []
+    for chunk_text, embedding_solon, signature, duplicate in zip(chunks, embeddings_solon, signatures, duplicates):
         # Créer l'entrée du chunk dans la base de données
         new_chunk = models.Chunk(
             document_id=new_document.document_id,
+            collection_id=collection_id,  # Copie de la collection du document (recherche filtrée sans jointure)
             chunk_text=chunk_text,
             taille_chunk=len(chunk_text),
             embedding_solon=embedding_solon,  # Stocker l'embedding
+            embedding_solon_bin=binary_quantize(embedding_solon),  # Copie quantifiée sur 1 bit pour le préfiltre Hamming
+            minhash=signature_bytes(signature) if signature is not None else None,
+            duplicate_of=(duplicate[1] if duplicate[0] == "chunk" else chunk_ids[duplicate[1]]) if duplicate else None,
             created_at=datetime.now(timezone.utc)
         )
         db.add(new_chunk)
         db.commit()
+        chunk_ids.append(new_chunk.chunk_id)
+
+        # Seuls les originaux entrent dans l'index LSH de la collection
+        if signature is not None and duplicate is None:
+            db.add_all(lsh_band_rows(new_chunk.chunk_id, signature))
+            db.commit()
 
         # Incrémenter le compteur pour chaque chunk créé
         chunks_created.inc()
 
+    # Embedding du document (moyenne normalisée de ses chunks) pour la recherche de documents similaires
+    new_document.embedding_solon = document_embedding(embeddings_solon)
+
+    # Ajouter les chunks au centroïde de la collection et invalider les résultats de recherche en cache
+    shift_document_centroid(db, new_document.document_id, collection_id, 1)
+    bump_generations(db, collection_id)
+    db.commit()
+
+    # Mise à jour incrémentale du moteur en mémoire de la collection
+    await sync_vector_engines(db, collection_id)
+
     # Fin du chronométrage
     end_time = time.time()
     execution_time = end_time - start_time
@@ -844,6 +1001,49 @@ async def get_document_by_id(
 
 
 
+# ------------------------------------------------------ Documents similaires ------------------------------------------------------------------|
+@app.get(
+    "/documents/{document_id}/similar",
+    response_model=schemas.SimilarDocumentsResponse,
+    summary="Documents similaires à un document",
+    description="Endpoint qui renvoie les documents les plus proches d'un document (embeddings de documents, un seul parcours d'index)",
+    tags=["Gestion des documents"]
+)
+async def get_similar_documents(
+    document_id: int,
+    top_n: int = Query(5, ge=1, le=schemas.SEARCH_MAX_TOP_N),
+    meme_collection: bool = False,
+    db: Session = Depends(database.get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    # Vérifier les permissions
+    check_permission(current_user, "author_get_doc")
+
+    document = db.query(models.Document).filter(models.Document.document_id == document_id).first()
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Document with ID {document_id} not found."
+        )
+
+    # Un seul parcours de l'index HNSW de documents (aucun résultat si le document n'a pas encore d'embedding)
+    stmt = build_similar_documents_statement(document_id, top_n, document.collection_id if meme_collection else None)
+    results = [
+        schemas.SimilarDocument(
+            document_id=row.document_id,
+            title=row.title,
+            collection_id=row.collection_id,
+            similarity=float(row.similarity)
+        )
+        for row in db.execute(stmt)
+    ]
+    return schemas.SimilarDocumentsResponse(document_id=document_id, results=results)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+
+
+
 # ------------------------------------------------------ Récupération de la liste des documents d'une collection -------------------------------|
 @app.get(
     "/collections/{collection_name}/documents",
@@ -942,20 +1142,314 @@ async def delete_document(
     # Supprimer le fichier dans MinIO
     delete_file_in_minio(bucket_name, document.title_document)
 
-    # Supprimer les chunks associés
+    # Retirer les chunks du centroïde de la collection, puis les supprimer
+    shift_document_centroid(db, document_id, document.collection_id, -1)
     db.query(models.Chunk).filter(models.Chunk.document_id == document_id).delete()
 
     # Supprimer le document dans la base de données
+    collection_id = document.collection_id
     db.delete(document)
+    bump_generations(db, collection_id)
     db.commit()
 
+    await sync_vector_engines(db, collection_id)
+
     return {"detail": f"Document with id {document_id} and its chunks have been deleted successfully"}
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
 
 
 
 
+
+# ------------------------------------------------------ Endpoint pour déplacer un document ----------------------------------------------------|
+@app.patch(
+    "/documents/{document_id}/move",
+    response_model=schemas.Document,
+    summary="Déplacer un document vers une autre collection",
+    description="Endpoint qui permet de déplacer un document (fichier MinIO et chunks) vers une autre collection",
+    tags=["Gestion des documents"]
+)
+async def move_document(
+    document_id: int,
+    document_move: schemas.DocumentMove,
+    db: Session = Depends(database.get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    # Vérifier les permissions
+    check_permission(current_user, "author_patch_doc")
+
+    # Récupérer le document et les collections source et destination
+    document = db.query(models.Document).filter(models.Document.document_id == document_id).first()
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Document with id {document_id} not found"
+        )
+
+    source_collection = db.query(models.Collection).filter(models.Collection.collection_id == document.collection_id).first()
+    target_collection = db.query(models.Collection).filter(models.Collection.collection_id == document_move.collection_id).first()
+    if not target_collection:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Collection with id {document_move.collection_id} not found"
+        )
+
+    # Vérifier qu'un document du même nom n'existe pas déjà dans la collection de destination
+    existing_document = db.query(models.Document).filter_by(
+        collection_id=target_collection.collection_id, title_document=document.title_document
+    ).first()
+    if existing_document and existing_document.document_id != document_id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Document with title '{document.title_document}' already exists in collection '{target_collection.name}'."
+        )
+
+    # Déplacer le fichier dans MinIO
+    source_bucket = f"collection-{source_collection.collection_id}-{source_collection.name.replace(' ', '-').replace('_', '-')}"
+    target_bucket = f"collection-{target_collection.collection_id}-{target_collection.name.replace(' ', '-').replace('_', '-')}"
+    if source_bucket != target_bucket:
+        try:
+            minio_client.copy_object(
+                bucket_name=target_bucket,
+                object_name=document.title_document,
+                source=CopySource(source_bucket, document.title_document)
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to copy file in MinIO: {str(e)}"
+            )
+        delete_file_in_minio(source_bucket, document.title_document)
+
+    # Mettre à jour les centroïdes, le document et la copie de collection_id portée par ses chunks
+    shift_document_centroid(db, document_id, source_collection.collection_id, -1)
+    shift_document_centroid(db, document_id, target_collection.collection_id, 1)
+    document.collection_id = target_collection.collection_id
+    document.minio_link = f"/browser/{target_bucket}/{document.title_document}"
+    db.query(models.Chunk).filter(models.Chunk.document_id == document_id).update(
+        {models.Chunk.collection_id: target_collection.collection_id}, synchronize_session=False
+    )
+    bump_generations(db, source_collection.collection_id, target_collection.collection_id)
+    db.commit()
+    db.refresh(document)
+
+    await sync_vector_engines(db, source_collection.collection_id, target_collection.collection_id)
+
+    return schemas.Document(
+        document_id=document.document_id,
+        collection_id=document.collection_id,
+        collection_name=target_collection.name,
+        title=document.title,
+        title_document=document.title_document,
+        minio_link=document.minio_link,
+        date_de_creation=document.date_de_creation,
+        created_at=document.created_at,
+        posted_by=document.posted_by,
+        number_of_chunks=document.num_of_chunks
+    )
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+
+
+# ------------------------------------------------------ Reconstruction de l'index vectoriel ---------------------------------------------------|
+from prometheus_client import Gauge
+
+# Métriques de l'index vectoriel de chunks.embedding_solon
+vector_index_type = Gauge('vector_index_type', 'Vector index in place on chunks.embedding_solon (1 = active)', ['index_type'])
+vector_index_lists = Gauge('vector_index_lists', 'Number of IVFFlat lists of the vector index (0 for HNSW)')
+vector_index_build_duration = Histogram('vector_index_build_duration_seconds', 'Time spent building the vector index')
+
+def update_vector_index_metrics(index_type, lists):
+    for name in ("hnsw", "ivfflat"):
+        vector_index_type.labels(index_type=name).set(1 if name == index_type else 0)
+    vector_index_lists.set(lists or 0)
+
+@app.post(
+    "/admin/vector_index/rebuild",
+    response_model=schemas.VectorIndexRebuildResponse,
+    summary="Reconstruire l'index vectoriel des chunks",
+    description="Endpoint qui permet aux admins de reconstruire l'index vectoriel (HNSW ou IVFFlat) après un chargement massif : recalcule les centroïdes IVFFlat ou change de type d'index. Avec collection_id, construit l'index partiel de cette collection.",
+    tags=["Administration"]
+)
+async def rebuild_vector_index(
+    request: schemas.VectorIndexRebuildRequest,
+    db: Session = Depends(database.get_db),
+    current_user: dict = Depends(get_current_user)
+):
+
+    # Vérifier les permissions (réservé aux administrateurs)
+    check_permission(current_user, "author_post_user")
+
+    if db.get_bind().dialect.name != "postgresql":
+        raise HTTPException(status_code=400, detail="Vector indexes are only available on PostgreSQL")
+
+    # La construction peut durer plusieurs minutes : elle est déportée dans le pool de threads
+    index_type = request.index_type or current_vector_index(db)[0] or VECTOR_INDEX_TYPE
+    # Construction concurrente en autocommit : la transaction de la session doit être terminée pour ne pas la bloquer
+    db.commit()
+    result = await run_in_threadpool(build_vector_index, db.get_bind(), index_type, request.lists, collection_id=request.collection_id)
+
+    vector_index_build_duration.observe(result["duration"])
+    if request.collection_id is None:
+        update_vector_index_metrics(result["index_type"], result["lists"])
+
+    return schemas.VectorIndexRebuildResponse(**result)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+
+
 # ------------------------------------------------------ Récupération du top n embedding -------------------------------------------------------|
+# Cache de résultats de /search (désactivé par défaut, voir search_cache.py)
+search_cache = SearchResultCache(SEARCH_CACHE_SIZE) if SEARCH_CACHE_ENABLED else None
+search_cache_hits = Counter('search_cache_hits_total', 'Number of /search responses served from the result cache')
+search_cache_misses = Counter('search_cache_misses_total', 'Number of /search requests not found in the result cache')
+search_cache_entries = Gauge('search_cache_entries', 'Number of responses held in the /search result cache')
+# Cache sémantique de /search (désactivé par défaut) : taux de succès, seuil appliqué et similarité de la requête en cache la plus proche
+semantic_cache = SemanticResultCache() if SEMANTIC_CACHE_ENABLED else None
+semantic_cache_hits = Counter('semantic_cache_hits_total', 'Number of /search responses served from the semantic cache')
+semantic_cache_misses = Counter('semantic_cache_misses_total', 'Number of /search requests not found in the semantic cache')
+semantic_cache_threshold = Gauge('semantic_cache_threshold', 'Minimum cosine similarity to reuse a cached /search response')
+semantic_cache_similarity = Histogram(
+    'semantic_cache_similarity', 'Cosine similarity between a query and the closest cached query of the same scope',
+    buckets=(0.8, 0.9, 0.95, 0.97, 0.98, 0.99, 0.995, 1.0)
+)
+if semantic_cache is not None:
+    semantic_cache_threshold.set(semantic_cache.threshold)
+# Durée de chaque étape de /search (aussi renvoyée dans l'en-tête Server-Timing)
+search_stage_duration = Histogram('search_stage_duration_seconds', 'Time spent in each stage of /search', ['stage'])
+# Embeddings des dernières requêtes : les pages suivantes d'une recherche ne repassent pas par le modèle
+query_embedding_cache = SearchResultCache(QUERY_EMBEDDING_CACHE_SIZE)
+# Latence des moteurs de recherche vectorielle et rappel du moteur ANN en mémoire, comparés au chemin pgvector
+search_engine_latency = Histogram('search_engine_latency_seconds', 'Time spent in the vector search engine', ['engine'])
+# Routage par centroïde (échantillon rejoué sans routage) : part des résultats globaux retrouvés et temps SQL économisé
+search_routing_recall = Histogram(
+    'search_routing_recall', 'Share of the unrouted top-n found by the centroid-routed search (sampled)',
+    buckets=(0.5, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+)
+search_routing_latency_saved = Histogram(
+    'search_routing_latency_saved_seconds', 'SQL time saved by centroid routing compared to the unrouted search (sampled)'
+)
+# Stratégie choisie par le planificateur (parcours exact, ANN, post-filtrage) et temps SQL de chaque stratégie
+search_planner = SearchPlanner() if SEARCH_PLANNER_ENABLED else None
+search_strategy = Counter('search_strategy_total', 'Number of /search requests per planned strategy', ['strategy'])
+search_strategy_latency = Histogram('search_strategy_latency_seconds', 'Time spent in the vector search per planned strategy', ['strategy'])
+ann_engine_recall = Histogram(
+    'ann_engine_recall', 'Recall@k of the in-process ANN engine against pgvector (sampled)',
+    buckets=(0.5, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)
+)
+
+async def embed_query(query):
+    """Embedding d'une requête, mis en cache par version du modèle."""
+    cache_key = (latest_version, query)
+    query_embedding = query_embedding_cache.get(cache_key)
+    if query_embedding is None:
+        query_embedding = (await embedding_backend.aembed([query]))[0]
+        query_embedding_cache.put(cache_key, query_embedding)
+    return query_embedding
+
+def resolve_collections(db, collection_filter):
+    """Résout le filtre de /search (un nom, ou une liste de noms et d'identifiants) en {collection_id: nom} en une requête."""
+    entries = collection_filter if isinstance(collection_filter, list) else [collection_filter]
+    names = [entry for entry in entries if isinstance(entry, str)]
+    ids = [entry for entry in entries if isinstance(entry, int)]
+    collections = db.query(models.Collection.collection_id, models.Collection.name).filter(
+        or_(models.Collection.name.in_(names), models.Collection.collection_id.in_(ids))
+    ).all()
+    return {collection.collection_id: collection.name for collection in collections}
+
+def start_stage_timer():
+    """Dépendance déclarée avant l'authentification : le chronomètre démarre avant elle."""
+    return StageTimer()
+
+def stage_timing_headers(timer):
+    """Enregistre les durées des étapes dans Prometheus et retourne l'en-tête Server-Timing correspondant."""
+    for stage, duration in timer.durations.items():
+        search_stage_duration.labels(stage=stage).observe(duration)
+    return {"Server-Timing": timer.server_timing()}
+
+def chunk_result(chunk, score, collection_names):
+    return schemas.ChunkResult(
+        chunk_id=chunk.chunk_id,
+        document_id=chunk.document_id,
+        chunk_text=chunk.chunk_text,
+        distance=chunk.distance,
+        similarity=chunk.similarity,
+        score=score,
+        collection_selectionnee=collection_names.get(chunk.collection_id, "Aucune collection")
+    )
+
+def record_search_metrics(cos_similarities, include_collection_name):
+    # Vérifier si on est en mode test
+    source = "Script de recherche dans main.py"
+    if os.getenv("TEST_ENVIRONMENT") == "pytest":
+        source = "Script de test pytest test_search.py"
+
+    # Déposer les métriques dans la file : l'envoi à MLflow est fait en arrière-plan, par fenêtre agrégée
+    search_metrics.record(cos_similarities, {
+        "source": source,
+        "model_version": f"solon-embeddings-large-model v{latest_version}",
+        "collection_choisie": str(include_collection_name)
+    })
+
+def next_search_cursor(request, fingerprint, returned, page_size, last_chunk):
+    """Curseur de la page suivante, tant que la page est pleine et que la profondeur maximale n'est pas atteinte."""
+    if request.search_mode == "vector" and page_size == request.top_n and returned + request.top_n < SEARCH_MAX_DEPTH:
+        return encode_search_cursor(fingerprint, last_chunk.distance, last_chunk.chunk_id, returned + request.top_n)
+    return None
+
+def search_index_rows(request, returned):
+    """Lignes que l'index vectoriel doit renvoyer pour cette page de /search (pages précédentes comprises)."""
+    return index_scan_size(returned + request.top_n, request.search_mode, request.binary_candidates)
+
+def stream_search_results(bind, stmt, request, collection_names, fingerprint, returned, search_settings=None,
+                          include_collection_name=False, timer=None, strategy=None):
+    """
+    Réponse NDJSON de /search : un ChunkResult par ligne, envoyé dès sa lecture sur un curseur serveur,
+    puis une dernière ligne {"next_cursor": ...} s'il y a une page suivante. Le générateur est parcouru dans
+    le pool de threads par Starlette, avec sa propre session (celle de la requête est fermée avant l'envoi).
+    search_settings : paramètres de apply_search_settings retenus par le planificateur (par défaut ceux de la requête).
+    timer : chronomètre de la requête, dont l'en-tête Server-Timing est déjà parti ; les étapes sql et metrics,
+    mesurées pendant le flux, ne sont enregistrées que dans Prometheus, avec la latence du moteur et de la stratégie.
+    """
+    search_settings = search_settings or {"ef_search": request.ef_search, "probes": request.probes}
+    cos_similarities, last_chunk = [], None
+    with Session(bind=bind) as session:
+        apply_search_settings(session, search_index_rows(request, returned), **search_settings)
+        rows = session.execute(stmt.execution_options(stream_results=True, yield_per=SEARCH_STREAM_YIELD_PER))
+        for chunk in rows:
+            cos_similarities.append(chunk.similarity)
+            last_chunk = chunk
+            yield chunk_result(chunk, None, collection_names).model_dump_json() + "\n"
+    if timer is not None:
+        timer.mark("sql")
+        search_engine_latency.labels(engine="pgvector").observe(timer.durations["sql"])
+        if strategy is not None:
+            search_strategy_latency.labels(strategy=strategy).observe(timer.durations["sql"])
+
+    next_cursor = next_search_cursor(request, fingerprint, returned, len(cos_similarities), last_chunk)
+    if next_cursor is not None:
+        yield json.dumps({"next_cursor": next_cursor}) + "\n"
+    record_search_metrics(cos_similarities, include_collection_name)
+    if timer is not None:
+        timer.mark("metrics")
+        for stage in ("sql", "metrics"):
+            search_stage_duration.labels(stage=stage).observe(timer.durations[stage])
+
+def semantic_cached_response(cached):
+    """
+    Réponse du cache sémantique pour la requête courante, sans curseur : les résultats en cache ont été classés pour
+    l'embedding d'une autre requête, un curseur ne continuerait ni cette page ni le classement de la requête courante.
+    """
+    return cached.model_copy(update={"next_cursor": None}).model_dump_json()
+
+def run_search_statement(bind, stmt, top_n, ef_search=None, probes=None):
+    """Exécute une requête de recherche dans sa propre session (branches parallèles de la recherche hybride)."""
+    with Session(bind=bind) as session:
+        apply_search_settings(session, top_n, ef_search, probes)
+        return session.execute(stmt).fetchall()
+
 @app.post(
     "/search",
     response_model=schemas.SearchResponse,
@@ -965,86 +1459,367 @@ async def delete_document(
 )
 async def search_similar_chunks(
     request: schemas.SearchRequest,
+    http_request: Request,
+    timer: StageTimer = Depends(start_stage_timer),
     db: Session = Depends(database.get_db),
     current_user: dict = Depends(get_current_user)
 ):
     
+    # Vérifier les permissions
+    check_permission(current_user, "author_get_user")
+    timer.mark("auth")
+
+    # Réponse en flux NDJSON si le client la demande (Accept: application/x-ndjson)
+    stream = "application/x-ndjson" in http_request.headers.get("accept", "")
+
+    # Résoudre les collections filtrées en identifiants (filtre direct sur chunks.collection_id)
+    include_collection_name = bool(request.filtre_par_collection and request.filtre_par_collection != "string")
+    collection_names, collection_ids, collection_id = {}, None, None
+    if include_collection_name:
+        collection_names = resolve_collections(db, request.filtre_par_collection)
+        if not collection_names:
+            content = schemas.SearchResponse(results=[]).model_dump_json()
+            timer.mark("response")
+            return Response(content=content, media_type="application/json", headers=stage_timing_headers(timer))
+        collection_ids = sorted(collection_names)
+        # Une seule collection : index partiel et moteurs en mémoire de la collection utilisables
+        collection_id = collection_ids[0] if len(collection_ids) == 1 else None
+
+    # Pagination par curseur : reprise après le dernier résultat de la page précédente (mode vectoriel uniquement)
+    fingerprint = search_fingerprint(request)
+    after, returned = None, 0
+    if request.cursor:
+        if request.search_mode != "vector":
+            raise HTTPException(status_code=400, detail="Cursor pagination is only available in vector search mode")
+        try:
+            after, returned = decode_search_cursor(request.cursor, fingerprint)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    # Cache de résultats (réponses déjà sérialisées) : la clé contient la génération des données interrogées, bumpée à chaque écriture
+    cache_key, generation = None, None
+    if (search_cache is not None or semantic_cache is not None) and not request.debug and not stream:
+        if collection_ids and len(collection_ids) > 1:
+            generation = [get_generation(db, filtered_collection_id) for filtered_collection_id in collection_ids]
+        else:
+            generation = get_generation(db, collection_id)
+    if search_cache is not None and generation is not None:
+        cache_key = search_cache_key(request, generation)
+        cached_response = search_cache.get(cache_key)
+        if cached_response is not None:
+            search_cache_hits.inc()
+            timer.mark("prepare")
+            return Response(content=cached_response, media_type="application/json", headers=stage_timing_headers(timer))
+        search_cache_misses.inc()
+    timer.mark("prepare")
+
+    # Calculer l'embedding de la requête (réutilisé d'une page à l'autre)
+    query_embedding = await embed_query(request.query)
+    timer.mark("embedding")
+
+    # Cache sémantique : réponse d'une requête récente d'embedding quasi identique, mêmes paramètres et mêmes données
+    # (première page uniquement ; le mode "hybrid" dépend des mots exacts de la requête)
+    semantic_scope = None
+    if semantic_cache is not None and generation is not None and not request.cursor and request.search_mode != "hybrid":
+        semantic_scope = semantic_cache_scope(request, generation)
+        cached_response, similarity = semantic_cache.get(semantic_scope, query_embedding)
+        if similarity is not None:
+            semantic_cache_similarity.observe(similarity)
+        if cached_response is not None:
+            semantic_cache_hits.inc()
+            content = semantic_cached_response(cached_response)
+            timer.mark("semantic_cache")
+            return Response(content=content, media_type="application/json", headers=stage_timing_headers(timer))
+        semantic_cache_misses.inc()
+        timer.mark("semantic_cache")
+
+    # Routage : recherche sans filtre limitée aux collections dont le centroïde est le plus proche de la requête
+    routed = False
+    if request.routing_top_k and not include_collection_name:
+        routed_names = route_collections(db, query_embedding, request.routing_top_k)
+        if routed_names:
+            routed = True
+            collection_names, collection_ids = routed_names, sorted(routed_names)
+            collection_id = collection_ids[0] if len(collection_ids) == 1 else None
+        timer.mark("routing")
+
+    # Moteur en mémoire de la collection (première page du mode vectoriel filtré sur une collection)
+    vector_engine = None
+    if request.search_mode == "vector" and after is None and collection_id is not None:
+        vector_engine = vector_engine_for(collection_id)
+
+    # Stratégie de la recherche pgvector selon le nombre de chunks interrogés et la sélectivité du filtre
+    plan = None
+    search_settings = {"ef_search": request.ef_search, "probes": request.probes}
+    if search_planner is not None and request.search_mode == "vector" and vector_engine is None:
+        plan = search_planner.plan(db, returned + request.top_n, collection_ids, request.ef_search, request.probes)
+        search_settings = {"ef_search": plan["ef_search"], "probes": plan["probes"]}
+        search_strategy.labels(strategy=plan["strategy"]).inc()
+        timer.mark("planning")
+
+    # Régler ef_search (HNSW) et probes (IVFFlat) pour la transaction de cette requête :
+    # l'index doit parcourir au moins les résultats des pages précédentes et ceux de cette page (candidats du préfiltre en mode "binary")
+    index_settings = apply_search_settings(db, search_index_rows(request, returned), **search_settings)
+
+    engine_name = "pgvector"
+    if request.search_mode == "hybrid":
+        # Branches vectorielle et plein texte exécutées en parallèle, chacune dans sa session, puis fusion RRF
+        candidates = request.hybrid_candidates or request.top_n * HYBRID_CANDIDATE_FACTOR
+        stmt = build_collections_search_statement(query_embedding, candidates, collection_ids)
+        lexical_stmt = build_lexical_statement(request.query, query_embedding, candidates, collection_ids=collection_ids)
+        vector_chunks, lexical_chunks = await asyncio.gather(
+            run_in_threadpool(run_search_statement, db.get_bind(), stmt, candidates, request.ef_search, request.probes),
+            run_in_threadpool(run_search_statement, db.get_bind(), lexical_stmt, candidates)
+        )
+        scored_chunks = reciprocal_rank_fusion(
+            [(vector_chunks, request.vector_weight), (lexical_chunks, request.lexical_weight)],
+            request.top_n,
+            k=request.rrf_k
+        )
+    else:
+        # Rechercher les chunks les plus proches dans la base de données
+        stmt = build_collections_search_statement(
+            query_embedding,
+            request.top_n,
+            collection_ids,
+            search_mode=request.search_mode,
+            binary_candidates=request.binary_candidates,
+            after=after,
+            returned=returned,
+            exact=plan is not None and plan["exact"]
+        )
+        start_time = time.perf_counter()
+        if stream and vector_engine is None:
+            # Les résultats sont envoyés au fil de la lecture des lignes, sans construire la réponse complète
+            # Server-Timing partiel : les étapes suivantes (sql, metrics) sont mesurées pendant le flux, après l'envoi des en-têtes
+            return StreamingResponse(
+                stream_search_results(
+                    db.get_bind(), stmt, request, collection_names, fingerprint, returned, search_settings,
+                    include_collection_name=include_collection_name, timer=timer, strategy=plan["strategy"] if plan else None
+                ),
+                media_type="application/x-ndjson",
+                headers=stage_timing_headers(timer)
+            )
+        if vector_engine is not None:
+            # Candidats du moteur en mémoire, relus par clé primaire dans PostgreSQL (source de vérité)
+            engine_name = vector_engine.name
+            chunk_ids, _ = await run_in_threadpool(vector_engine.search, db, collection_id, query_embedding, request.top_n)
+            scored_chunks = [(chunk, None) for chunk in db.execute(build_chunks_statement(query_embedding, chunk_ids)).fetchall()]
+        else:
+            scored_chunks = [(chunk, None) for chunk in db.execute(stmt).fetchall()]
+        search_engine_latency.labels(engine=engine_name).observe(time.perf_counter() - start_time)
+        if plan is not None:
+            search_strategy_latency.labels(strategy=plan["strategy"]).observe(time.perf_counter() - start_time)
+
+        # Échantillon de recherches rejouées sur pgvector pour mesurer le rappel du moteur en mémoire
+        if engine_name == "hnswlib" and random.random() < ANN_COMPARE_SAMPLE_RATE:
+            start_time = time.perf_counter()
+            reference_ids = [chunk.chunk_id for chunk in db.execute(stmt).fetchall()]
+            search_engine_latency.labels(engine="pgvector").observe(time.perf_counter() - start_time)
+            ann_engine_recall.observe(recall_at_k(reference_ids, [chunk.chunk_id for chunk, _ in scored_chunks]))
+
+    timer.mark("sql")
+
+    # Échantillon de recherches routées rejouées sans routage : précision du routage et temps SQL économisé
+    if routed and request.search_mode != "hybrid" and random.random() < ROUTING_COMPARE_SAMPLE_RATE:
+        start_time = time.perf_counter()
+        global_stmt = build_collections_search_statement(
+            query_embedding, request.top_n, None,
+            search_mode=request.search_mode, binary_candidates=request.binary_candidates, after=after, returned=returned
+        )
+        global_ids = [chunk.chunk_id for chunk in db.execute(global_stmt).fetchall()]
+        search_routing_latency_saved.observe(time.perf_counter() - start_time - timer.durations["sql"])
+        search_routing_recall.observe(recall_at_k(global_ids, [chunk.chunk_id for chunk, _ in scored_chunks]))
+        timer.mark("routing_check")
+
+    # Préparer la réponse
+    results = [chunk_result(chunk, score, collection_names) for chunk, score in scored_chunks]
+
+    # Diagnostic : le plan passe-t-il par l'index vectoriel ?
+    debug = None
+    if request.debug:
+        debug = schemas.SearchDebug(
+            index_utilise=index_used(db, stmt) if engine_name == "pgvector" else None,
+            ef_search=index_settings.get("hnsw.ef_search"),
+            probes=index_settings.get("ivfflat.probes"),
+            moteur=engine_name,
+            collections_routees=collection_ids if routed else None,
+            strategie=plan["strategy"] if plan else None,
+            surechantillonnage=plan["overfetch"] if plan else None
+        )
+
+    next_cursor = next_search_cursor(request, fingerprint, returned, len(results), scored_chunks[-1][0] if scored_chunks else None)
+    timer.mark("postprocessing")
+
+    # Métriques de qualité : similarités cosinus calculées dans la requête SQL
+    record_search_metrics([chunk.similarity for chunk, _ in scored_chunks], include_collection_name)
+    timer.mark("metrics")
+
+    if stream:
+        # Recherche hybride ou moteur en mémoire : résultats déjà calculés, renvoyés au même format NDJSON
+        lines = [result.model_dump_json() + "\n" for result in results]
+        if next_cursor is not None:
+            lines.append(json.dumps({"next_cursor": next_cursor}) + "\n")
+        timer.mark("response")
+        return StreamingResponse(iter(lines), media_type="application/x-ndjson", headers=stage_timing_headers(timer))
+
+    # Sérialisation faite ici (et non par FastAPI) pour être chronométrée et mise en cache telle quelle
+    response = schemas.SearchResponse(results=results, debug=debug, next_cursor=next_cursor)
+    content = response.model_dump_json()
+    if semantic_scope is not None:
+        semantic_cache.put(semantic_scope, query_embedding, response)
+    if cache_key is not None:
+        search_cache.put(cache_key, content)
+        search_cache_entries.set(len(search_cache))
+    timer.mark("response")
+
+    return Response(content=content, media_type="application/json", headers=stage_timing_headers(timer))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+
+
+# ------------------------------------------------------ Recherche groupée ---------------------------------------------------------------------|
+@app.post(
+    "/search/batch",
+    response_model=schemas.BatchSearchResponse,
+    summary="Recherche groupée pour plusieurs requêtes",
+    description="Endpoint pour rechercher les chunks les plus proches de plusieurs requêtes en un seul appel : un seul batch de modèle et une seule requête SQL (mode vectoriel)",
+    tags=["Recherche"]
+)
+async def search_similar_chunks_batch(
+    request: schemas.BatchSearchRequest,
+    db: Session = Depends(database.get_db),
+    current_user: dict = Depends(get_current_user)
+):
+
     # Vérifier les permissions
     check_permission(current_user, "author_get_user")
 
-    # Calculer l'embedding de la requête
-    query_embedding = solon_model.predict([request.query])[0]
+    # Résoudre tous les noms de collections filtrées en une seule requête
+    def collection_filter(query):
+        return query.filtre_par_collection if query.filtre_par_collection and query.filtre_par_collection != "string" else None
+
+    collection_names = {collection_filter(query) for query in request.queries} - {None}
+    collection_ids = {}
+    if collection_names:
+        collection_ids = dict(
+            db.query(models.Collection.name, models.Collection.collection_id)
+            .filter(models.Collection.name.in_(collection_names))
+            .all()
+        )
 
-    # Rechercher les chunks les plus proches dans la base de données
-    if request.filtre_par_collection and request.filtre_par_collection != "string":
-        # Requête pour un `collection_name` spécifique
-        stmt = select(
-            models.Chunk.chunk_id,
-            models.Chunk.chunk_text,
-            models.Chunk.document_id,
-            models.Collection.name.label("collection_name"),  # Récupérer le nom de la collection
-            models.Chunk.embedding_solon,
-            models.Chunk.embedding_solon.l2_distance(query_embedding).label("distance")
-        ).join(
-            models.Document, models.Chunk.document_id == models.Document.document_id
-        ).join(
-            models.Collection, models.Document.collection_id == models.Collection.collection_id
-        ).where(
-            models.Collection.name == request.filtre_par_collection
-        ).order_by("distance").limit(request.top_n)
-        include_collection_name = True
-    else:
-        # Requête sans `collection_name`, recherchant dans tous les chunks
-        stmt = select(
-            models.Chunk.chunk_id,
-            models.Chunk.chunk_text,
-            models.Chunk.document_id,
-            models.Chunk.embedding_solon,
-            models.Chunk.embedding_solon.l2_distance(query_embedding).label("distance")
-        ).join(
-            models.Document, models.Chunk.document_id == models.Document.document_id
-        ).order_by("distance").limit(request.top_n)
-        include_collection_name = False
-
-    similar_chunks = db.execute(stmt).fetchall()
-
-    # Calculer les similarités cosinus entre la requête et les embeddings des chunks
-    chunks_embeddings = [chunk.embedding_solon for chunk in similar_chunks]
-    cos_similarities = cosine_similarity([query_embedding], chunks_embeddings)
-
-    # Calculer la moyenne des similarités cosinus
-    mean_cos_similarity = np.mean(cos_similarities)
+    # Calculer les embeddings de toutes les requêtes en un seul batch
+    query_embeddings = await embedding_backend.aembed([query.query for query in request.queries])
 
-    # Vérifier si on est en mode test
-    source = "Script de recherche dans main.py"
+    # Une seule requête SQL pour toutes les recherches (les collections inconnues ne renvoient aucun résultat)
+    batch = [
+        (query_index, query_embedding, query.top_n, collection_ids.get(collection_filter(query)))
+        for query_index, (query, query_embedding) in enumerate(zip(request.queries, query_embeddings))
+        if collection_filter(query) is None or collection_filter(query) in collection_ids
+    ]
+    rows = []
+    if batch:
+        apply_search_settings(db, max(query.top_n for query in request.queries), request.ef_search, request.probes)
+        rows = db.execute(build_batch_search_statement(batch)).fetchall()
+
+    # Regrouper les résultats par requête, triés par distance
+    grouped = {query_index: [] for query_index in range(len(request.queries))}
+    for row in sorted(rows, key=lambda row: row.distance):
+        grouped[row.query_index].append(row)
+
+    source = "Script de recherche groupée dans main.py"
     if os.getenv("TEST_ENVIRONMENT") == "pytest":
         source = "Script de test pytest test_search.py"
 
-    # Enregistrer les métriques dans MLflow
-    with mlflow.start_run(experiment_id=client.get_experiment_by_name("Solon-embeddings").experiment_id) as run:
-        mlflow.log_param("model_name", "OrdalieTech/Solon-embeddings-large-0.1")
-        mlflow.log_param("source", source)
-        mlflow.log_param("model_version", f"solon-embeddings-large-model v{latest_version}")
-        mlflow.log_param("collection_choisie", str(include_collection_name))
-        mlflow.log_metric("mean_cos_similarity", mean_cos_similarity)
-        
-        # Enregistrer chaque similarité individuelle
-        for i, sim in enumerate(cos_similarities[0]):
-            mlflow.log_metric(f"cos_similarity_top_{i+1}", sim)
+    results = []
+    for query_index, query in enumerate(request.queries):
+        collection_name = collection_filter(query)
+
+        # Déposer les métriques de chaque requête dans la file (envoi à MLflow en arrière-plan)
+        search_metrics.record([chunk.similarity for chunk in grouped[query_index]], {
+            "source": source,
+            "model_version": f"solon-embeddings-large-model v{latest_version}",
+            "collection_choisie": str(collection_name is not None)
+        })
+
+        results.append(schemas.BatchSearchResult(
+            query=query.query,
+            results=[
+                schemas.ChunkResult(
+                    chunk_id=chunk.chunk_id,
+                    document_id=chunk.document_id,
+                    chunk_text=chunk.chunk_text,
+                    distance=chunk.distance,
+                    similarity=chunk.similarity,
+                    collection_selectionnee=collection_name or "Aucune collection"
+                )
+                for chunk in grouped[query_index]
+            ]
+        ))
+
+    return schemas.BatchSearchResponse(results=results)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+
 
-    # Préparer la réponse
-    results = [
-        schemas.ChunkResult(
-            chunk_id=chunk.chunk_id,
-            document_id=chunk.document_id,
-            chunk_text=chunk.chunk_text,
-            distance=chunk.distance,
-            collection_selectionnee=chunk.collection_name if include_collection_name else "Aucune collection"
-        )
-        for chunk in similar_chunks
-    ]
 
-    return schemas.SearchResponse(results=results)
+# ------------------------------------------------------ Recherche de documents ----------------------------------------------------------------|
+@app.post(
+    "/search/documents",
+    response_model=schemas.DocumentSearchResponse,
+    summary="Recherche les documents les plus proches d'une requête",
+    description="Endpoint pour rechercher les meilleurs documents : score agrégé de leurs chunks (meilleur chunk ou moyenne des top k) et meilleurs passages, calculés en SQL",
+    tags=["Recherche"]
+)
+async def search_documents(
+    request: schemas.DocumentSearchRequest,
+    db: Session = Depends(database.get_db),
+    current_user: dict = Depends(get_current_user)
+):
+
+    # Vérifier les permissions
+    check_permission(current_user, "author_get_user")
+
+    # Résoudre les collections filtrées en identifiants
+    collection_names, collection_ids = {}, None
+    if request.filtre_par_collection and request.filtre_par_collection != "string":
+        collection_names = resolve_collections(db, request.filtre_par_collection)
+        if not collection_names:
+            return schemas.DocumentSearchResponse(results=[])
+        collection_ids = sorted(collection_names)
+
+    # Embedding de la requête (en cache : la recherche peut être relancée à chaque frappe)
+    query_embedding = await embed_query(request.query)
+
+    # Candidats de l'index vectoriel, agrégés par document dans la même requête SQL
+    candidates = request.candidates or request.top_n * DOCUMENT_CANDIDATE_FACTOR
+    apply_search_settings(db, candidates, request.ef_search, request.probes)
+    rows = db.execute(build_document_search_statement(
+        query_embedding,
+        request.top_n,
+        candidates,
+        collection_ids,
+        aggregation=request.aggregation,
+        top_k=request.top_k,
+        passages=request.passages
+    )).fetchall()
+
+    # Les lignes arrivent triées par document puis par passage
+    documents = {}
+    for row in rows:
+        if row.document_id not in documents:
+            documents[row.document_id] = schemas.DocumentSearchResult(
+                document_id=row.document_id,
+                title=row.title,
+                collection_id=row.collection_id,
+                score=row.document_score,
+                passages=[]
+            )
+        documents[row.document_id].passages.append(chunk_result(row, None, collection_names))
+
+    return schemas.DocumentSearchResponse(results=list(documents.values()))
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
 
 
@@ -1,8 +1,14 @@
-from sqlalchemy import Column, Integer, String, Boolean, Text, TIMESTAMP, ForeignKey, Date
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Text, TIMESTAMP, ForeignKey, Date, Index, FetchedValue, LargeBinary
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from .database import Base
 from datetime import datetime
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import Vector, HALFVEC, BIT
+import os
+
+# Type de stockage des embeddings : "vector" (float32, 4 Ko par vecteur) ou "halfvec" (float16, 2 Ko par vecteur)
+EMBEDDING_STORAGE = os.getenv("EMBEDDING_STORAGE", "vector")
+EmbeddingType = HALFVEC if EMBEDDING_STORAGE == "halfvec" else Vector
 
 
 class User(Base):
@@ -53,6 +59,9 @@ class Collection(Base):
     date_de_creation = Column(Date)
     derniere_modification = Column(TIMESTAMP, default=datetime.utcnow)
     etat_bucket = Column(String(300))
+    # Centroïde de la collection (routage de /search) : somme des embeddings de ses chunks, tenue à jour à chaque écriture
+    embedding_sum = deferred(Column(Vector(dim=1024), nullable=True))
+    chunk_count = Column(Integer, nullable=False, default=0)
 
     user = relationship("User", back_populates="collections")
     documents = relationship("Document", back_populates="collection", cascade="all, delete-orphan")
@@ -69,6 +78,8 @@ class Document(Base):
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
     posted_by = Column(String(30), nullable=False)
     num_of_chunks = Column(Integer, nullable=False, default=0)  # Nouvelle colonne ajoutée
+    # Moyenne normalisée des embeddings des chunks, mise à jour à l'ingestion (documents similaires)
+    embedding_solon = deferred(Column(Vector(dim=1024), nullable=True))
 
     collection = relationship("Collection", back_populates="documents")
     chunks = relationship("Chunk", back_populates="document", cascade="all, delete-orphan")
@@ -79,11 +90,39 @@ class Chunk(Base):
 
     chunk_id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("documents.document_id"), nullable=False)
+    collection_id = Column(Integer, ForeignKey("collections.collection_id"), nullable=True)  # Copie de documents.collection_id (recherche filtrée sans jointure)
     chunk_text = Column(Text, nullable=False)
     taille_chunk = Column(Integer, nullable=False)
-    embedding_cohere = Column(Vector(dim=1024), nullable=True)
-    embedding_solon = Column(Vector(dim=1024), nullable=True)
-    embedding_bge = Column(Vector(dim=1024), nullable=True)
+    embedding_cohere = Column(EmbeddingType(dim=1024), nullable=True)
+    embedding_solon = Column(EmbeddingType(dim=1024), nullable=True)
+    embedding_bge = Column(EmbeddingType(dim=1024), nullable=True)
+    embedding_solon_bin = Column(BIT(1024), nullable=True)  # Embedding Solon quantifié sur 1 bit (préfiltre Hamming)
+    # Texte indexé pour la recherche plein texte (configuration french), calculé par PostgreSQL à l'insertion (colonne générée, migration 08)
+    chunk_tsv = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True, server_default=FetchedValue()))
+    # Signature MinHash du texte (détection des quasi-doublons, voir dedup.py) et chunk original dont celui-ci est un quasi-doublon
+    minhash = deferred(Column(LargeBinary, nullable=True))
+    duplicate_of = Column(Integer, ForeignKey("chunks.chunk_id", ondelete="SET NULL"), nullable=True)
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
 
     document = relationship("Document", back_populates="chunks")
+
+    __table_args__ = (
+        Index("ix_chunks_collection_id_document_id", "collection_id", "document_id"),
+    )
+
+
+class SearchGeneration(Base):
+    __tablename__ = "search_generations"
+
+    # Portée du compteur : "global" (toutes les collections) ou "collection:<collection_id>"
+    scope = Column(String(50), primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)  # Incrémenté à chaque écriture, invalide le cache de /search
+
+
+class ChunkLshBand(Base):
+    __tablename__ = "chunk_lsh_bands"
+
+    # Index LSH des chunks originaux : une ligne par bande de la signature MinHash
+    chunk_id = Column(Integer, ForeignKey("chunks.chunk_id", ondelete="CASCADE"), primary_key=True)
+    band = Column(Integer, primary_key=True)
+    band_key = Column(BigInteger, nullable=False, index=True)
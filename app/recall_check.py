@@ -0,0 +1,72 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import argparse
+
+# Third-party library imports
+import numpy as np
+from sqlalchemy import select
+
+# Local application imports
+from . import models, database
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Calcul du rappel ----------------------------------------------------------------------|
+def exact_top_k(corpus, queries, top_k):
+    """Retourne les indices des top_k plus proches voisins (distance L2) de chaque requête, par recherche exacte."""
+    distances = (
+        np.sum(queries ** 2, axis=1, keepdims=True)
+        - 2 * queries @ corpus.T
+        + np.sum(corpus ** 2, axis=1)
+    )
+    return np.argsort(distances, axis=1)[:, :top_k]
+
+def halfvec_recall(corpus, queries, top_k=10):
+    """
+    Mesure le rappel@k obtenu en stockant le corpus et les requêtes en float16 (halfvec)
+    par rapport à la recherche exacte en float32.
+    """
+    reference = exact_top_k(corpus, queries, top_k)
+    corpus_half = corpus.astype(np.float16).astype(np.float32)
+    queries_half = queries.astype(np.float16).astype(np.float32)
+    candidate = exact_top_k(corpus_half, queries_half, top_k)
+
+    hits = [len(set(ref) & set(cand)) for ref, cand in zip(reference, candidate)]
+    return float(np.sum(hits)) / (len(queries) * top_k)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Vérification sur la base ---------------------------------------------------------------|
+def main():
+    parser = argparse.ArgumentParser(description="Vérifie le rappel de la recherche avant de passer en stockage halfvec.")
+    parser.add_argument("--queries", type=int, default=200, help="Nombre de chunks tirés au hasard utilisés comme requêtes")
+    parser.add_argument("--top-k", type=int, default=10, help="Nombre de voisins comparés")
+    args = parser.parse_args()
+
+    if models.EMBEDDING_STORAGE == "halfvec":
+        print("\033[93mLes embeddings sont déjà stockés en halfvec : lancer la vérification avec EMBEDDING_STORAGE=vector.\033[0m")
+        return
+
+    db = database.SessionLocal()
+    try:
+        rows = db.execute(
+            select(models.Chunk.embedding_solon).where(models.Chunk.embedding_solon.isnot(None))
+        ).scalars().all()
+    finally:
+        db.close()
+
+    corpus = np.asarray([np.asarray(row, dtype=np.float32) for row in rows], dtype=np.float32)
+    if len(corpus) == 0:
+        print("\033[93mAucun embedding trouvé dans la table chunks.\033[0m")
+        return
+
+    rng = np.random.default_rng(0)
+    queries = corpus[rng.choice(len(corpus), size=min(args.queries, len(corpus)), replace=False)]
+
+    recall = halfvec_recall(corpus, queries, top_k=min(args.top_k, len(corpus)))
+    print(f"\033[92mRappel@{args.top_k} halfvec vs float32 sur {len(queries)} requêtes : {recall:.4f}\033[0m")
+
+
+if __name__ == "__main__":
+    main()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
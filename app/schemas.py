@@ -1,7 +1,19 @@
 # schemas.py
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Union
 from datetime import datetime
+import os
+
+from .search import BINARY_RERANK_FACTOR, HYBRID_CANDIDATE_FACTOR
+
+# Nombre maximum de requêtes dans une recherche groupée (/search/batch)
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", 50))
+# Nombre maximum de résultats par page de /search (les suivants s'obtiennent avec next_cursor)
+SEARCH_MAX_TOP_N = int(os.getenv("SEARCH_MAX_TOP_N", 100))
+# Nombre maximum de candidats du préfiltre Hamming (mode "binary")
+SEARCH_MAX_BINARY_CANDIDATES = SEARCH_MAX_TOP_N * BINARY_RERANK_FACTOR
+# Nombre maximum de candidats par branche de la recherche hybride (mode "hybrid")
+SEARCH_MAX_HYBRID_CANDIDATES = SEARCH_MAX_TOP_N * HYBRID_CANDIDATE_FACTOR
 
 # ---- Gestion des utilisateurs ----------------------|
 class UserCreate(BaseModel):
@@ -85,6 +97,9 @@ class Token(BaseModel):
 
 
 # ---- Gestion de l'upload ---------------------------|
+class DocumentMove(BaseModel):
+    collection_id: int  # Collection de destination
+
 class DocumentCreate(BaseModel):
     collection_id: int
     collection_name: str
@@ -114,6 +129,8 @@ class ChunkResult(BaseModel):
     document_id: int
     chunk_text: str
     distance: float
+    similarity: Optional[float] = None  # Similarité cosinus avec la requête
+    score: Optional[float] = None  # Score de fusion RRF (mode "hybrid")
     collection_selectionnee: Optional[str] = "Aucune collection"  # Message par défaut
 
     class Config:
@@ -123,14 +140,114 @@ class ChunkResult(BaseModel):
     class Config:
         from_attributes = True
 
+# Informations de diagnostic renvoyées quand la requête demande debug=True
+class SearchDebug(BaseModel):
+    index_utilise: Optional[bool] = None  # Le plan passe par un index vectoriel (None hors PostgreSQL)
+    ef_search: Optional[int] = None  # Valeur de hnsw.ef_search appliquée à la requête
+    probes: Optional[int] = None  # Valeur de ivfflat.probes appliquée à la requête
+    moteur: Optional[str] = None  # Moteur ayant servi la recherche vectorielle : pgvector, hnswlib ou numpy
+    collections_routees: Optional[List[int]] = None  # Collections retenues par le routage par centroïde
+    strategie: Optional[str] = None  # Stratégie du planificateur : exact, ann ou postfilter
+    surechantillonnage: Optional[int] = None  # Stratégie "postfilter" : facteur appliqué à ef_search et probes
+
 class SearchResponse(BaseModel):
     results: List[ChunkResult]
+    debug: Optional[SearchDebug] = None
+    next_cursor: Optional[str] = None  # Curseur de la page suivante, None s'il n'y en a pas
 
 # Schéma de la requête de recherche
 class SearchRequest(BaseModel):
     query: str
-    top_n: Optional[int] = 5
+    top_n: int = Field(5, ge=1, le=SEARCH_MAX_TOP_N)  # Taille de la page de résultats
+    cursor: Optional[str] = None  # next_cursor de la page précédente (mode "vector")
+    filtre_par_collection: Optional[Union[str, List[Union[int, str]]]] = None  # Nom de la collection, ou liste de noms et d'identifiants
+    routing_top_k: Optional[int] = Field(None, ge=1)  # Sans filtre : chercher seulement dans les K collections au centroïde le plus proche
+    search_mode: Literal["vector", "binary", "hybrid"] = "vector"  # "binary" : préfiltre Hamming puis reclassement exact, "hybrid" : plein texte + vecteur
+    binary_candidates: Optional[int] = Field(None, ge=1, le=SEARCH_MAX_BINARY_CANDIDATES)  # Nombre de candidats du préfiltre Hamming (par défaut top_n * BINARY_RERANK_FACTOR)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)  # hnsw.ef_search pour cette requête (par défaut HNSW_EF_SEARCH)
+    probes: Optional[int] = Field(None, ge=1)  # ivfflat.probes pour cette requête (par défaut IVFFLAT_PROBES)
+    vector_weight: float = Field(1.0, ge=0)  # Mode "hybrid" : poids du classement vectoriel dans la fusion RRF
+    lexical_weight: float = Field(1.0, ge=0)  # Mode "hybrid" : poids du classement plein texte dans la fusion RRF
+    rrf_k: int = Field(60, ge=1)  # Mode "hybrid" : constante k de la fusion RRF (score = poids / (k + rang))
+    hybrid_candidates: Optional[int] = Field(None, ge=1, le=SEARCH_MAX_HYBRID_CANDIDATES)  # Mode "hybrid" : candidats par branche (par défaut top_n * HYBRID_CANDIDATE_FACTOR)
+    debug: bool = False  # Renvoie le plan utilisé (index vectoriel ou parcours séquentiel)
+# ----------------------------------------------------|
+
+
+
+# ---- Recherche groupée -----------------------------|
+# Une requête d'une recherche groupée
+class BatchSearchQuery(BaseModel):
+    query: str
+    top_n: int = Field(5, ge=1, le=SEARCH_MAX_TOP_N)
     filtre_par_collection: Optional[str] = None  # Nom de la collection, si spécifique
+
+# Schéma de la requête de recherche groupée (mode vectoriel uniquement)
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchSearchQuery] = Field(..., min_length=1, max_length=SEARCH_BATCH_MAX_QUERIES)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)  # hnsw.ef_search commun à toutes les requêtes
+    probes: Optional[int] = Field(None, ge=1)  # ivfflat.probes commun à toutes les requêtes
+
+# Résultats d'une requête, dans l'ordre de la recherche groupée
+class BatchSearchResult(BaseModel):
+    query: str
+    results: List[ChunkResult]
+
+class BatchSearchResponse(BaseModel):
+    results: List[BatchSearchResult]
+# ----------------------------------------------------|
+
+
+
+# ---- Recherche de documents ------------------------|
+# Recherche des meilleurs documents (score agrégé de leurs chunks)
+class DocumentSearchRequest(BaseModel):
+    query: str
+    top_n: int = Field(5, ge=1, le=SEARCH_MAX_TOP_N)  # Nombre de documents
+    filtre_par_collection: Optional[Union[str, List[Union[int, str]]]] = None  # Nom de la collection, ou liste de noms et d'identifiants
+    aggregation: Literal["max", "mean_top_k"] = "max"  # Score du document : meilleur chunk, ou moyenne des top_k meilleurs chunks
+    top_k: int = Field(3, ge=1)  # Mode "mean_top_k" : nombre de chunks moyennés
+    passages: int = Field(2, ge=1, le=10)  # Meilleurs passages renvoyés par document
+    candidates: Optional[int] = Field(None, ge=1, le=1000)  # Chunks candidats (par défaut top_n * DOCUMENT_CANDIDATE_FACTOR)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1)
+
+class DocumentSearchResult(BaseModel):
+    document_id: int
+    title: str
+    collection_id: Optional[int] = None
+    score: float  # Score agrégé du document
+    passages: List[ChunkResult]
+
+class DocumentSearchResponse(BaseModel):
+    results: List[DocumentSearchResult]
+
+# Documents les plus proches d'un document (embeddings de documents)
+class SimilarDocument(BaseModel):
+    document_id: int
+    title: str
+    collection_id: int
+    similarity: float  # Similarité cosinus entre les embeddings des deux documents
+
+class SimilarDocumentsResponse(BaseModel):
+    document_id: int
+    results: List[SimilarDocument]
+# ----------------------------------------------------|
+
+
+
+# ---- Index vectoriel -------------------------------|
+# Schéma de la requête de reconstruction de l'index vectoriel
+class VectorIndexRebuildRequest(BaseModel):
+    index_type: Optional[Literal["hnsw", "ivfflat"]] = None  # Par défaut : type de l'index en place
+    lists: Optional[int] = Field(None, ge=1)  # Listes IVFFlat (par défaut IVFFLAT_LISTS ou calculé sur le nombre de chunks)
+    collection_id: Optional[int] = None  # Index partiel limité aux chunks de cette collection
+
+class VectorIndexRebuildResponse(BaseModel):
+    index_type: str
+    lists: Optional[int] = None
+    duration: float
+    collection_id: Optional[int] = None
 # ----------------------------------------------------|
 
 
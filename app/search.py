@@ -0,0 +1,350 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+import json
+import base64
+import hashlib
+
+# Third-party library imports
+import numpy as np
+from sqlalchemy import select, func, bindparam, text, literal, union_all, tuple_, case
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.ext.compiler import compiles
+
+# Local application imports
+from . import models
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration de la recherche ---------------------------------------------------------|
+# Nombre de candidats remontés par le préfiltre Hamming, exprimé en multiple de top_n
+BINARY_RERANK_FACTOR = int(os.getenv("BINARY_RERANK_FACTOR", 10))
+# Taille de la liste de candidats parcourue par l'index HNSW à la recherche (compromis rappel / latence)
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 40))
+# Nombre de listes IVFFlat parcourues à la recherche (compromis rappel / latence, voir app/vector_index.py)
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", 10))
+# Recherche hybride : candidats remontés par chaque branche (plein texte et vectorielle), en multiple de top_n
+HYBRID_CANDIDATE_FACTOR = int(os.getenv("HYBRID_CANDIDATE_FACTOR", 4))
+# Configuration plein texte PostgreSQL, identique à celle de la colonne générée chunks.chunk_tsv (migration 08)
+TEXT_SEARCH_CONFIG = "french"
+# Préfixe des index vectoriels de la table chunks (HNSW float, HNSW binaire...)
+VECTOR_INDEX_PREFIX = "ix_chunks_embedding_solon"
+# Profondeur maximale d'une pagination par curseur : au-delà, ef_search (1000 au plus) ne garantit plus les pages suivantes
+SEARCH_MAX_DEPTH = int(os.getenv("SEARCH_MAX_DEPTH", 1000))
+# Réponse NDJSON de /search : lignes lues par lot sur le curseur serveur avant d'être envoyées
+SEARCH_STREAM_YIELD_PER = int(os.getenv("SEARCH_STREAM_YIELD_PER", 10))
+# Recherche de documents : chunks candidats remontés par l'index vectoriel, en multiple du nombre de documents demandés
+DOCUMENT_CANDIDATE_FACTOR = int(os.getenv("DOCUMENT_CANDIDATE_FACTOR", 10))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Quantification binaire des embeddings -------------------------------------------------|
+def binary_quantize(embedding):
+    """Quantifie un embedding en chaîne de bits : 1 si la composante est positive, 0 sinon (même règle que binary_quantize de pgvector)."""
+    return "".join(np.where(np.asarray(embedding, dtype=np.float32) > 0, "1", "0"))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Construction de la requête de recherche -----------------------------------------------|
+def result_columns(query_embedding, param_name="query_embedding"):
+    """
+    Colonnes renvoyées par les requêtes de recherche. Distance et similarité sont calculées par la base :
+    aucun embedding n'est renvoyé à l'API (l'embedding de la requête n'est envoyé qu'une fois, comme paramètre partagé).
+    """
+    query_param = bindparam(param_name, query_embedding, type_=models.EmbeddingType(1024))
+    return [
+        models.Chunk.chunk_id,
+        models.Chunk.chunk_text,
+        models.Chunk.document_id,
+        models.Chunk.collection_id,
+        models.Chunk.embedding_solon.l2_distance(query_param).label("distance"),
+        (1 - models.Chunk.embedding_solon.cosine_distance(query_param)).label("similarity")
+    ]
+
+def binary_prefilter_size(top_n, binary_candidates=None):
+    """Nombre de candidats remontés par le préfiltre Hamming du mode "binary"."""
+    return binary_candidates or top_n * BINARY_RERANK_FACTOR
+
+def index_scan_size(top_n, search_mode="vector", binary_candidates=None):
+    """
+    Nombre de lignes que l'index vectoriel doit pouvoir renvoyer (minimum de hnsw.ef_search, voir apply_search_settings) :
+    top_n, ou les candidats du préfiltre Hamming en mode "binary", sans quoi le reclassement ne verrait qu'une partie des candidats.
+    """
+    if search_mode == "binary":
+        return max(top_n, binary_prefilter_size(top_n, binary_candidates))
+    return top_n
+
+def build_search_statement(query_embedding, top_n, collection_id=None, search_mode="vector", binary_candidates=None,
+                           param_name="query_embedding", after=None, returned=0, exact=False):
+    """
+    Construit la requête SQL des chunks les plus proches de l'embedding de la requête.
+
+    - mode "vector" : tri direct sur la distance L2 des embeddings float.
+    - mode "binary" : préfiltre des candidats par distance de Hamming sur embedding_solon_bin,
+      puis reclassement exact de ces candidats sur la distance L2 des embeddings float.
+
+    Le filtre par collection porte sur chunks.collection_id : aucune jointure, et l'index partiel
+    de la collection (voir vector_index.py) peut être utilisé s'il existe.
+
+    La sous-requête servie par l'index vectoriel ne trie que sur la distance (ORDER BY distance LIMIT n : un tri
+    secondaire empêcherait le parcours ordonné de l'index). Le tri secondaire sur chunk_id, qui départage les distances
+    égales pour que les pages ne se chevauchent pas, est appliqué par la requête englobante.
+
+    after : (distance, chunk_id) du dernier résultat de la page précédente (pagination par curseur), filtré par la
+    requête englobante ; la sous-requête remonte alors les returned résultats déjà renvoyés en plus de ceux de la page.
+
+    exact : tri sur distance + 0, une expression que les index vectoriels ne savent pas servir : le planificateur
+    parcourt les chunks filtrés (index B-tree sur collection_id) et trie exactement, sans toucher aux autres index.
+    """
+    columns = result_columns(query_embedding, param_name)
+    stmt = select(*columns)
+
+    if search_mode == "binary":
+        # Préfiltre : les candidats les plus proches en distance de Hamming (index HNSW bit_hamming_ops)
+        candidates = select(models.Chunk.chunk_id).where(models.Chunk.embedding_solon_bin.isnot(None))
+        if collection_id is not None:
+            candidates = candidates.where(models.Chunk.collection_id == collection_id)
+        candidates = candidates.order_by(
+            models.Chunk.embedding_solon_bin.hamming_distance(binary_quantize(query_embedding))
+        ).limit(binary_prefilter_size(top_n, binary_candidates)).subquery()
+
+        stmt = stmt.join(candidates, models.Chunk.chunk_id == candidates.c.chunk_id)
+
+    if collection_id is not None:
+        # Requête pour une collection spécifique
+        stmt = stmt.where(models.Chunk.collection_id == collection_id)
+
+    distance = next(column for column in columns if column.name == "distance")
+    nearest = stmt.order_by(distance.element + 0 if exact else "distance").limit(top_n + (returned if after is not None else 0))
+    nearest = nearest.subquery("nearest")
+
+    stmt = select(nearest)
+    if after is not None:
+        # Pagination par clé : la page suivante reprend après le dernier résultat, sans OFFSET
+        stmt = stmt.where(tuple_(nearest.c.distance, nearest.c.chunk_id) > tuple_(*after))
+    return stmt.order_by(nearest.c.distance, nearest.c.chunk_id).limit(top_n)
+
+def build_collections_search_statement(query_embedding, top_n, collection_ids=None, **options):
+    """
+    Recherche restreinte à plusieurs collections en une seule requête : une branche par collection (chacune triée
+    et limitée, donc servie par l'index vectoriel ou l'index partiel de la collection), fusionnées par UNION ALL
+    puis re-triées pour obtenir le top-n global. Sans collection ou avec une seule, équivaut à build_search_statement.
+    """
+    if not collection_ids or len(collection_ids) == 1:
+        collection_id = collection_ids[0] if collection_ids else None
+        return build_search_statement(query_embedding, top_n, collection_id=collection_id, **options)
+
+    merged = union_all(*[
+        build_search_statement(query_embedding, top_n, collection_id=collection_id, **options)
+        for collection_id in collection_ids
+    ]).subquery("per_collection")
+    return select(merged).order_by(merged.c.distance, merged.c.chunk_id).limit(top_n)
+
+def build_chunks_statement(query_embedding, chunk_ids):
+    """Relit par clé primaire les candidats d'un moteur externe (voir ann_engine.py), avec distance et similarité exactes."""
+    return select(*result_columns(query_embedding)).where(models.Chunk.chunk_id.in_(chunk_ids)).order_by("distance")
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Pagination par curseur ----------------------------------------------------------------|
+def search_fingerprint(request):
+    """
+    Empreinte de la recherche portée par le curseur : tous les paramètres de la requête (hors curseur et debug),
+    y compris ceux qui changent le classement (top_n, routing_top_k, ef_search, probes, candidats).
+    Un curseur ne peut pas être rejoué sur une autre requête ni avec d'autres paramètres.
+    """
+    parameters = request.model_dump(exclude={"cursor", "debug"})
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode()).hexdigest()[:16]
+
+def encode_search_cursor(fingerprint, distance, chunk_id, returned):
+    """Curseur opaque : distance et chunk_id du dernier résultat, et nombre de résultats déjà renvoyés."""
+    payload = {"f": fingerprint, "d": distance, "c": chunk_id, "n": returned}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+def decode_search_cursor(cursor, fingerprint):
+    """Retourne ((distance, chunk_id), nombre de résultats déjà renvoyés) ; ValueError si le curseur est invalide."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        after, returned = (float(payload["d"]), int(payload["c"])), int(payload["n"])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if payload.get("f") != fingerprint:
+        raise ValueError("Cursor does not match this search")
+    return after, returned
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Recherche groupée ---------------------------------------------------------------------|
+def build_batch_search_statement(queries):
+    """
+    Construit une seule requête SQL pour plusieurs recherches vectorielles : un UNION ALL de sous-requêtes
+    (chacune avec son ORDER BY / LIMIT, donc servie par l'index vectoriel), marquées par la colonne query_index.
+
+    queries : liste de (query_index, query_embedding, top_n, collection_id).
+    """
+    statements = [
+        build_search_statement(
+            query_embedding, top_n, collection_id=collection_id, param_name=f"query_embedding_{query_index}"
+        ).add_columns(literal(query_index).label("query_index"))
+        for query_index, query_embedding, top_n, collection_id in queries
+    ]
+    return union_all(*statements)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Recherche de documents ----------------------------------------------------------------|
+def build_document_search_statement(query_embedding, top_n, candidates, collection_ids=None, aggregation="max", top_k=3, passages=2):
+    """
+    Recherche de documents calculée entièrement en SQL sur les chunks candidats de l'index vectoriel :
+    - rang de chaque chunk dans son document (row_number par document_id) ;
+    - score du document (fenêtre par document_id) : meilleure similarité ("max") ou moyenne des top_k meilleurs chunks ("mean_top_k") ;
+    - rang du document (dense_rank sur le score), filtré sur top_n documents et `passages` meilleurs chunks par document.
+    Une ligne par passage retenu, triée par rang de document puis de passage, avec le titre du document.
+    """
+    candidate_chunks = build_collections_search_statement(query_embedding, candidates, collection_ids).subquery("candidates")
+    ranked = select(
+        candidate_chunks,
+        func.row_number().over(
+            partition_by=candidate_chunks.c.document_id, order_by=(candidate_chunks.c.distance, candidate_chunks.c.chunk_id)
+        ).label("passage_rank")
+    ).subquery("ranked")
+
+    if aggregation == "mean_top_k":
+        document_score = func.avg(case((ranked.c.passage_rank <= top_k, ranked.c.similarity)))
+    else:
+        document_score = func.max(ranked.c.similarity)
+    scored = select(ranked, document_score.over(partition_by=ranked.c.document_id).label("document_score")).subquery("scored")
+
+    documents = select(
+        scored,
+        func.dense_rank().over(order_by=(scored.c.document_score.desc(), scored.c.document_id)).label("document_rank")
+    ).subquery("documents_ranked")
+
+    return (
+        select(documents, models.Document.title)
+        .join(models.Document, models.Document.document_id == documents.c.document_id)
+        .where(documents.c.document_rank <= top_n, documents.c.passage_rank <= passages)
+        .order_by(documents.c.document_rank, documents.c.passage_rank)
+    )
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Documents similaires ------------------------------------------------------------------|
+def document_embedding(embeddings):
+    """Embedding d'un document : moyenne normalisée (norme L2 = 1) des embeddings de ses chunks, None sans chunk."""
+    if not len(embeddings):
+        return None
+    mean = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1).mean(axis=0)
+    norm = np.linalg.norm(mean)
+    return (mean / norm if norm else mean).tolist()
+
+def build_similar_documents_statement(document_id, top_n, collection_id=None):
+    """
+    Documents les plus proches d'un document (distance cosinus entre embeddings de documents) : l'embedding
+    de référence est lu en sous-requête, le tri par distance suivi de LIMIT utilise l'index HNSW de documents.
+    """
+    reference = select(models.Document.embedding_solon).where(models.Document.document_id == document_id).scalar_subquery()
+    distance = models.Document.embedding_solon.cosine_distance(reference)
+    stmt = select(
+        models.Document.document_id,
+        models.Document.title,
+        models.Document.collection_id,
+        (1 - distance).label("similarity")
+    ).where(models.Document.document_id != document_id, models.Document.embedding_solon.isnot(None))
+    if collection_id is not None:
+        stmt = stmt.where(models.Document.collection_id == collection_id)
+    return stmt.order_by(distance).limit(top_n)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Recherche hybride (plein texte + vecteur) ---------------------------------------------|
+def build_lexical_statement(query_text, query_embedding, limit, collection_id=None, collection_ids=None):
+    """
+    Construit la branche plein texte de la recherche hybride : chunks dont chunk_tsv correspond à la requête
+    (websearch_to_tsquery, index GIN), triés par ts_rank_cd décroissant.
+    """
+    tsquery = func.websearch_to_tsquery(TEXT_SEARCH_CONFIG, query_text)
+    stmt = select(
+        *result_columns(query_embedding),
+        func.ts_rank_cd(models.Chunk.chunk_tsv, tsquery).label("rank")
+    ).where(models.Chunk.chunk_tsv.op("@@")(tsquery))
+
+    if collection_id is not None:
+        stmt = stmt.where(models.Chunk.collection_id == collection_id)
+    elif collection_ids:
+        stmt = stmt.where(models.Chunk.collection_id.in_(collection_ids))
+
+    return stmt.order_by(text("rank DESC")).limit(limit)
+
+def reciprocal_rank_fusion(rankings, top_n, k=60):
+    """
+    Fusionne plusieurs classements par Reciprocal Rank Fusion.
+
+    rankings : liste de (lignes triées, poids). Chaque chunk reçoit la somme des poids / (k + rang) des classements
+    où il apparaît. Retourne les top_n couples (ligne, score) par score décroissant.
+    """
+    scores = {}
+    rows = {}
+    for ranked_rows, weight in rankings:
+        for rank, row in enumerate(ranked_rows, start=1):
+            scores[row.chunk_id] = scores.get(row.chunk_id, 0.0) + weight / (k + rank)
+            rows.setdefault(row.chunk_id, row)
+
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_n]
+    return [(rows[chunk_id], score) for chunk_id, score in fused]
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Paramètres des index vectoriels -------------------------------------------------------|
+def apply_search_settings(db, top_n, ef_search=None, probes=None):
+    """
+    Fixe hnsw.ef_search et ivfflat.probes pour la transaction en cours (PostgreSQL uniquement) :
+    seul le paramètre de l'index en place est utilisé par le planificateur.
+    ef_search ne peut pas être inférieur à top_n, sinon l'index renverrait moins de résultats que demandé (maximum pgvector : 1000).
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return {}
+
+    settings = {
+        "hnsw.ef_search": min(max(ef_search or HNSW_EF_SEARCH, top_n), 1000),
+        "ivfflat.probes": probes or IVFFLAT_PROBES,
+    }
+    # set_config(..., true) équivaut à SET LOCAL et accepte un paramètre lié
+    for name, value in settings.items():
+        db.execute(select(func.set_config(name, str(value), True)))
+    return settings
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Utilisation de l'index ----------------------------------------------------------------|
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) d'une requête SQLAlchemy, avec les mêmes paramètres liés que la requête elle-même."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+def plan_index_names(plan):
+    """Retourne les noms des index parcourus par un plan EXPLAIN (FORMAT JSON)."""
+    names = []
+    if plan.get("Index Name"):
+        names.append(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        names += plan_index_names(child)
+    return names
+
+def index_used(db, stmt):
+    """Indique si le plan de la requête de recherche passe par un index vectoriel (None hors PostgreSQL)."""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+
+    plan = db.execute(Explain(stmt)).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return any(name.startswith(VECTOR_INDEX_PREFIX) for name in plan_index_names(plan[0]["Plan"]))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
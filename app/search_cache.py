@@ -0,0 +1,151 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+import json
+import threading
+from collections import OrderedDict
+
+# Third-party library imports
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# Local application imports
+from . import models
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration du cache ----------------------------------------------------------------|
+# Cache de résultats de /search, désactivé par défaut
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "false").lower() == "true"
+# Nombre maximum de réponses conservées (les moins récemment utilisées sont évincées)
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 1024))
+# Embeddings des dernières requêtes, réutilisés par les pages suivantes d'une même recherche
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", 256))
+# Cache sémantique de /search (désactivé par défaut) : réponses réutilisées pour des requêtes d'embeddings quasi identiques
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+# Nombre maximum d'embeddings de requêtes conservés et similarité cosinus minimale pour réutiliser une réponse
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", 512))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.97))
+
+GLOBAL_SCOPE = "global"
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Compteurs de génération ---------------------------------------------------------------|
+def collection_scope(collection_id):
+    return f"collection:{collection_id}"
+
+def get_generation(db, collection_id=None):
+    """
+    Génération courante des données interrogées : celle de la collection pour une recherche filtrée,
+    la génération globale sinon. Les compteurs sont en base pour être partagés par tous les workers.
+    """
+    scope = collection_scope(collection_id) if collection_id is not None else GLOBAL_SCOPE
+    generation = db.query(models.SearchGeneration.generation).filter(models.SearchGeneration.scope == scope).scalar()
+    return generation or 0
+
+def bump_generations(db, *collection_ids):
+    """
+    Incrémente le compteur global et ceux des collections modifiées : toutes les réponses en cache
+    qui en dépendent deviennent inaccessibles. À appeler avant le commit de l'écriture.
+    Un seul INSERT ... ON CONFLICT DO UPDATE : deux écritures concurrentes sur une collection sans compteur
+    ne peuvent pas insérer la même portée deux fois.
+    """
+    scopes = [GLOBAL_SCOPE] + [collection_scope(collection_id) for collection_id in sorted(set(collection_ids))]
+    dialect_insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    statement = dialect_insert(models.SearchGeneration).values([{"scope": scope, "generation": 1} for scope in scopes])
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[models.SearchGeneration.scope],
+        set_={"generation": models.SearchGeneration.generation + 1}
+    ))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Cache LRU des réponses ----------------------------------------------------------------|
+def search_cache_key(request, generation):
+    """Clé de cache : tous les paramètres de la requête (hors debug) et la génération des données interrogées."""
+    return json.dumps(request.model_dump(exclude={"debug"}), sort_keys=True) + f"#{generation}"
+
+class SearchResultCache:
+    """Cache LRU borné (réponses de /search, embeddings de requêtes), partagé par les requêtes du worker."""
+
+    def __init__(self, max_size=SEARCH_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Cache sémantique des réponses ---------------------------------------------------------|
+def semantic_cache_scope(request, generation):
+    """Portée d'une entrée : paramètres de la requête hors texte (et hors debug, curseur) et génération des données interrogées."""
+    return json.dumps(request.model_dump(exclude={"debug", "query", "cursor"}), sort_keys=True) + f"#{generation}"
+
+class SemanticResultCache:
+    """
+    Réponses de /search indexées par l'embedding normalisé de leur requête : une requête dont l'embedding a une similarité
+    cosinus d'au moins `threshold` avec celui d'une requête en cache de même portée reçoit sa réponse. Les embeddings
+    sont gardés dans une matrice (max_size, dim) parcourue par un produit matriciel ; l'entrée la moins récemment
+    utilisée est remplacée quand le cache est plein. Les écritures changent la génération, donc la portée : les
+    réponses devenues obsolètes ne sont plus jamais trouvées et sont évincées en premier.
+    """
+
+    def __init__(self, max_size=SEMANTIC_CACHE_SIZE, threshold=SEMANTIC_CACHE_THRESHOLD, dim=1024):
+        self.threshold = threshold
+        self.embeddings = np.zeros((max_size, dim), dtype=np.float32)
+        self.scopes = [None] * max_size
+        self.values = [None] * max_size
+        self.last_used = np.zeros(max_size, dtype=np.int64)  # 0 : emplacement libre
+        self.clock = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def normalize(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def get(self, scope, embedding):
+        """Retourne (réponse ou None, meilleure similarité dans la portée ou None si la portée est vide)."""
+        query = self.normalize(embedding)
+        with self.lock:
+            slots = [slot for slot, slot_scope in enumerate(self.scopes) if slot_scope == scope]
+            if not slots:
+                return None, None
+            similarities = self.embeddings[slots] @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                return None, similarity
+            self.clock += 1
+            self.last_used[slots[best]] = self.clock
+            return self.values[slots[best]], similarity
+
+    def put(self, scope, embedding, value):
+        with self.lock:
+            slot = int(np.argmin(self.last_used))
+            self.clock += 1
+            self.embeddings[slot] = self.normalize(embedding)
+            self.scopes[slot], self.values[slot], self.last_used[slot] = scope, value, self.clock
+
+    def __len__(self):
+        return int(np.count_nonzero(self.last_used))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
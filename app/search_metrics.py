@@ -0,0 +1,172 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+import time
+import queue
+import random
+import threading
+from collections import defaultdict
+
+# Third-party library imports
+import numpy as np
+from mlflow.entities import Metric, Param
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration des métriques de recherche ----------------------------------------------|
+# Durée (en secondes) de la fenêtre d'agrégation : un run MLflow par fenêtre et par combinaison de paramètres
+SEARCH_METRICS_WINDOW = float(os.getenv("SEARCH_METRICS_WINDOW", 60))
+# Proportion des recherches prises en compte (1.0 = toutes)
+SEARCH_METRICS_SAMPLE_RATE = float(os.getenv("SEARCH_METRICS_SAMPLE_RATE", 1.0))
+# Taille maximale de la file : au-delà, les mesures sont ignorées plutôt que de ralentir /search
+SEARCH_METRICS_QUEUE_SIZE = int(os.getenv("SEARCH_METRICS_QUEUE_SIZE", 10000))
+
+MODEL_NAME = "OrdalieTech/Solon-embeddings-large-0.1"
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Agrégation d'une fenêtre --------------------------------------------------------------|
+def aggregate_window(records):
+    """
+    Agrège les similarités d'une fenêtre : nombre de recherches, moyenne / min / max de la similarité moyenne
+    et similarité moyenne à chaque rang (cos_similarity_top_i).
+    """
+    means = [float(np.mean(similarities)) for similarities in records if len(similarities)]
+    if not means:
+        return {}
+
+    metrics = {
+        "search_count": float(len(records)),
+        "mean_cos_similarity": float(np.mean(means)),
+        "min_cos_similarity": float(np.min(means)),
+        "max_cos_similarity": float(np.max(means)),
+    }
+
+    by_rank = defaultdict(list)
+    for similarities in records:
+        for i, similarity in enumerate(similarities):
+            by_rank[i].append(float(similarity))
+    for i, values in by_rank.items():
+        metrics[f"cos_similarity_top_{i+1}"] = float(np.mean(values))
+    return metrics
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Journalisation asynchrone dans MLflow -------------------------------------------------|
+class SearchMetricsLogger:
+    """
+    Les recherches déposent leurs similarités dans une file en mémoire (record ne fait aucun appel réseau).
+    Un thread de fond agrège la file par fenêtre de temps et envoie un run MLflow par fenêtre avec log_batch.
+    """
+
+    def __init__(self, experiment_name="Solon-embeddings", window=SEARCH_METRICS_WINDOW,
+                 sample_rate=SEARCH_METRICS_SAMPLE_RATE, queue_size=SEARCH_METRICS_QUEUE_SIZE):
+        self.experiment_name = experiment_name
+        self.window = window
+        self.sample_rate = sample_rate
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.client = None
+        self.experiment_id = None
+        self.dropped = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def record(self, similarities, params):
+        """Dépose les similarités d'une recherche et ses paramètres (source, version du modèle...) dans la file."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        try:
+            self.queue.put_nowait((tuple(sorted(params.items())), [float(s) for s in similarities]))
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self, client):
+        """Démarre le thread de fond avec le client MLflow initialisé au démarrage de l'API."""
+        self.client = client
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="search-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Arrête le thread de fond après un dernier envoi de la fenêtre en cours."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.window + 10)
+
+    def get_experiment_id(self):
+        """Identifiant de l'expérience, recherché une seule fois puis mis en cache."""
+        if self.experiment_id is None:
+            experiment = self.client.get_experiment_by_name(self.experiment_name)
+            self.experiment_id = experiment.experiment_id if experiment else self.client.create_experiment(self.experiment_name)
+        return self.experiment_id
+
+    def drain(self):
+        """Vide la file et regroupe les mesures par combinaison de paramètres."""
+        groups = defaultdict(list)
+        while True:
+            try:
+                params, similarities = self.queue.get_nowait()
+            except queue.Empty:
+                return groups
+            groups[params].append(similarities)
+
+    def flush(self):
+        """Agrège la file et envoie un run MLflow par groupe de paramètres (un seul appel log_batch par run)."""
+        groups = self.drain()
+        if not groups:
+            return
+
+        experiment_id = self.get_experiment_id()
+        timestamp = int(time.time() * 1000)
+        for params, records in groups.items():
+            metrics = aggregate_window(records)
+            if not metrics:
+                continue
+            run = self.client.create_run(experiment_id)
+            run_params = dict(params, model_name=MODEL_NAME, window_seconds=self.window, sample_rate=self.sample_rate)
+            self.client.log_batch(
+                run.info.run_id,
+                metrics=[Metric(key, value, timestamp, 0) for key, value in metrics.items()],
+                params=[Param(key, str(value)) for key, value in run_params.items()]
+            )
+            self.client.set_terminated(run.info.run_id)
+
+    def _run(self):
+        while not self._stop_event.wait(self.window):
+            self._safe_flush()
+        self._safe_flush()
+
+    def _safe_flush(self):
+        # Une indisponibilité de MLflow ne doit jamais arrêter le thread : les mesures de la fenêtre sont perdues
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"\033[93mÉchec de l'envoi des métriques de recherche à MLflow : {e}\033[0m")
+        if self.dropped:
+            print(f"\033[93m{self.dropped} mesures de recherche ignorées (file pleine).\033[0m")
+            self.dropped = 0
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Chronométrage des étapes de /search ---------------------------------------------------|
+class StageTimer:
+    """
+    Durée de chaque étape d'une recherche : mark(étape) clôt l'étape en cours (depuis le mark précédent,
+    ou depuis la création du chronomètre) sous ce nom.
+    """
+
+    def __init__(self):
+        self.started_at = self.last_mark = time.perf_counter()
+        self.durations = {}
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.durations[stage] = self.durations.get(stage, 0.0) + now - self.last_mark
+        self.last_mark = now
+
+    def server_timing(self):
+        """Valeur de l'en-tête Server-Timing (durées en millisecondes), avec le total."""
+        entries = [f"{stage};dur={duration * 1000:.1f}" for stage, duration in self.durations.items()]
+        entries.append(f"total;dur={(self.last_mark - self.started_at) * 1000:.1f}")
+        return ", ".join(entries)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -0,0 +1,110 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+import re
+import math
+import time
+import threading
+
+# Third-party library imports
+from sqlalchemy import select, text
+
+# Local application imports
+from . import models
+from .search import HNSW_EF_SEARCH, IVFFLAT_PROBES
+from .vector_index import VECTOR_INDEX_NAMES
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration du planificateur --------------------------------------------------------|
+# Choix de la stratégie de chaque recherche vectorielle pgvector selon la taille des collections interrogées (désactivé par défaut)
+SEARCH_PLANNER_ENABLED = os.getenv("SEARCH_PLANNER_ENABLED", "false").lower() == "true"
+# En dessous de ce nombre de chunks interrogés, parcours exact (rappel de 100 %, l'index n'apporte rien)
+PLANNER_EXACT_MAX_CHUNKS = int(os.getenv("PLANNER_EXACT_MAX_CHUNKS", 10000))
+# Recherche ANN sans filtre : hnsw.ef_search d'au moins top_n * PLANNER_EF_FACTOR
+PLANNER_EF_FACTOR = int(os.getenv("PLANNER_EF_FACTOR", 2))
+# Post-filtrage : marge appliquée au sur-échantillonnage 1 / sélectivité du filtre
+PLANNER_OVERFETCH_MARGIN = float(os.getenv("PLANNER_OVERFETCH_MARGIN", 1.5))
+# Durée (secondes) pendant laquelle les nombres de chunks et les index partiels lus en base sont réutilisés
+PLANNER_STATS_TTL = float(os.getenv("PLANNER_STATS_TTL", 10.0))
+
+# Valeur maximale de hnsw.ef_search acceptée par pgvector
+MAX_EF_SEARCH = 1000
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Planification des recherches ----------------------------------------------------------|
+class SearchPlanner:
+    """
+    Choisit la stratégie de chaque recherche vectorielle à partir des nombres de chunks des collections
+    (collections.chunk_count, tenu à jour par upload, suppression et déplacement) et de la sélectivité du filtre :
+
+    - "exact" : peu de chunks interrogés, tri exact sur une expression que l'index vectoriel ne sert pas ;
+    - "ann" : index HNSW ou IVFFlat global (ou index partiels des collections filtrées), ef_search réglé sur top_n ;
+    - "postfilter" : filtre sur des collections sans index partiel, appliqué après le parcours de l'index global,
+      qui est sur-échantillonné (ef_search et probes multipliés par 1 / sélectivité) pour trouver top_n résultats.
+      Si le sur-échantillonnage dépasse la limite de hnsw.ef_search, le sous-ensemble filtré est parcouru exactement.
+    """
+
+    def __init__(self, ttl=PLANNER_STATS_TTL):
+        self.ttl = ttl
+        self.chunk_counts = {}
+        self.partial_indexes = set()
+        self.loaded_at = None
+        self.lock = threading.Lock()
+
+    def stats(self, db):
+        """Nombres de chunks par collection et collections dotées d'un index vectoriel partiel (relus au plus une fois par ttl)."""
+        with self.lock:
+            if self.loaded_at is not None and time.time() - self.loaded_at < self.ttl:
+                return self.chunk_counts, self.partial_indexes
+        chunk_counts = {row.collection_id: row.chunk_count for row in db.execute(
+            select(models.Collection.collection_id, models.Collection.chunk_count)
+        )}
+        partial_indexes = set()
+        if db.get_bind().dialect.name == "postgresql":
+            pattern = re.compile(rf"^(?:{'|'.join(VECTOR_INDEX_NAMES.values())})_c(\d+)$")
+            for relname in db.scalars(text("SELECT relname FROM pg_class WHERE relkind = 'i' AND relname LIKE 'ix_chunks_embedding_solon_%'")):
+                match = pattern.match(relname)
+                if match:
+                    partial_indexes.add(int(match.group(1)))
+        with self.lock:
+            self.chunk_counts, self.partial_indexes, self.loaded_at = chunk_counts, partial_indexes, time.time()
+        return chunk_counts, partial_indexes
+
+    def plan(self, db, top_n, collection_ids=None, ef_search=None, probes=None):
+        """
+        Retourne {"strategy", "ef_search", "probes", "exact", "overfetch"} pour une recherche de top_n résultats.
+        ef_search et probes fournis par la requête remplacent les valeurs calculées, pas la stratégie.
+        """
+        chunk_counts, partial_indexes = self.stats(db)
+        total = sum(chunk_counts.values())
+        scanned = sum(chunk_counts.get(collection_id, 0) for collection_id in collection_ids) if collection_ids else total
+
+        if scanned <= PLANNER_EXACT_MAX_CHUNKS:
+            return {"strategy": "exact", "ef_search": None, "probes": None, "exact": True, "overfetch": None}
+
+        # Collections filtrées servies par l'index global : la plus petite fixe le sur-échantillonnage (une branche par collection)
+        postfiltered = [collection_id for collection_id in collection_ids or [] if collection_id not in partial_indexes]
+        if not postfiltered or not total:
+            return {
+                "strategy": "ann",
+                "ef_search": ef_search or max(HNSW_EF_SEARCH, top_n * PLANNER_EF_FACTOR),
+                "probes": probes or IVFFLAT_PROBES,
+                "exact": False,
+                "overfetch": None
+            }
+
+        selectivity = max(min(chunk_counts.get(collection_id, 0) for collection_id in postfiltered), 1) / total
+        overfetch = math.ceil(PLANNER_OVERFETCH_MARGIN / selectivity)
+        if top_n * overfetch > MAX_EF_SEARCH:
+            # Filtre trop sélectif pour l'index global : parcours exact des chunks filtrés (index B-tree sur collection_id)
+            return {"strategy": "exact", "ef_search": None, "probes": None, "exact": True, "overfetch": None}
+        return {
+            "strategy": "postfilter",
+            "ef_search": ef_search or max(HNSW_EF_SEARCH, top_n * overfetch),
+            "probes": probes or IVFFLAT_PROBES * overfetch,
+            "exact": False,
+            "overfetch": overfetch
+        }
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -0,0 +1,174 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+import time
+import argparse
+from contextlib import ExitStack
+
+# Third-party library imports
+import numpy as np
+import torch
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration de l'inférence PyTorch --------------------------------------------------|
+# Précision de calcul : "fp32" ou "bf16" (autocast CPU, uniquement si le processeur le supporte)
+TORCH_PRECISION = os.getenv("TORCH_PRECISION", "fp32")
+# Mode sans gradient : "no_grad" (comportement du wrapper pyfunc) ou "inference_mode"
+TORCH_GRAD_MODE = os.getenv("TORCH_GRAD_MODE", "no_grad")
+# Implémentation de l'attention de transformers : "eager" ou "sdpa" (torch scaled_dot_product_attention)
+TORCH_ATTENTION = os.getenv("TORCH_ATTENTION", "eager")
+# Nombre de threads intra-op et inter-op (0 = valeur par défaut de torch)
+TORCH_INTRA_OP_THREADS = int(os.getenv("TORCH_INTRA_OP_THREADS", 0))
+TORCH_INTER_OP_THREADS = int(os.getenv("TORCH_INTER_OP_THREADS", 0))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Threads et support matériel -----------------------------------------------------------|
+def configure_torch_threads(intra_op_threads=TORCH_INTRA_OP_THREADS, inter_op_threads=TORCH_INTER_OP_THREADS):
+    """Fixe le nombre de threads de torch. À appeler avant tout calcul : les threads inter-op ne sont plus modifiables ensuite."""
+    if intra_op_threads > 0:
+        torch.set_num_threads(intra_op_threads)
+    if inter_op_threads > 0:
+        try:
+            torch.set_num_interop_threads(inter_op_threads)
+        except RuntimeError as e:
+            print(f"\033[93mImpossible de fixer les threads inter-op : {str(e)}\033[0m")
+    print(f"\033[92mThreads torch : intra-op = {torch.get_num_threads()}, inter-op = {torch.get_num_interop_threads()}\033[0m")
+
+def cpu_supports_bf16():
+    """Indique si le processeur dispose d'instructions bf16 natives (AVX512-BF16 ou AMX)."""
+    try:
+        with open("/proc/cpuinfo") as cpuinfo:
+            flags = cpuinfo.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Attention SDPA ------------------------------------------------------------------------|
+def attention_implementation(model):
+    """Implémentation d'attention retenue par transformers pour le modèle ("eager", "sdpa"...)."""
+    return model.config._attn_implementation
+
+def with_attention_implementation(model, attention):
+    """
+    Retourne le modèle avec l'implémentation d'attention demandée. transformers choisit les couches d'attention
+    à la construction (attn_implementation) : un modèle déjà chargé autrement est reconstruit depuis sa configuration,
+    puis reçoit ses poids.
+    """
+    if attention_implementation(model) == attention:
+        return model
+    from transformers import AutoModel
+
+    rebuilt = AutoModel.from_config(model.config, attn_implementation=attention, torch_dtype=model.dtype)
+    rebuilt.load_state_dict(model.state_dict())
+    return rebuilt
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Embedder PyTorch ----------------------------------------------------------------------|
+class TorchEmbedder:
+    """
+    Calcule les embeddings Solon directement avec le modèle PyTorch du wrapper pyfunc MLflow,
+    avec un mode de précision, de gradient et d'attention configurable.
+    """
+
+    def __init__(self, model, tokenizer, precision=TORCH_PRECISION, grad_mode=TORCH_GRAD_MODE, attention=TORCH_ATTENTION):
+        self.model = with_attention_implementation(model, attention).eval()
+        self.tokenizer = tokenizer
+        self.grad_mode = grad_mode
+
+        if precision == "bf16" and not cpu_supports_bf16():
+            print("\033[93mLe processeur ne supporte pas bf16 nativement, inférence en fp32.\033[0m")
+            precision = "fp32"
+        self.precision = precision
+
+        self.attention = attention_implementation(self.model)
+        print(f"\033[92mAttention du modèle : {self.attention}.\033[0m")
+
+    @classmethod
+    def from_pyfunc(cls, pyfunc_model, **kwargs):
+        """Construit l'embedder à partir du modèle pyfunc chargé depuis MLflow (PyTorchModelWrapper)."""
+        python_model = pyfunc_model.unwrap_python_model()
+        return cls(python_model.model, python_model.tokenizer, **kwargs)
+
+    def predict(self, texts):
+        inputs = self.tokenizer(list(texts), return_tensors="pt", padding=True, truncation=True)
+
+        with ExitStack() as stack:
+            stack.enter_context(torch.inference_mode() if self.grad_mode == "inference_mode" else torch.no_grad())
+            if self.precision == "bf16":
+                stack.enter_context(torch.autocast("cpu", dtype=torch.bfloat16))
+            outputs = self.model(**inputs)
+
+        # Moyenne des tokens hors padding : identique au wrapper pyfunc pour un texte seul, correcte en batch
+        mask = inputs["attention_mask"].unsqueeze(-1).to(torch.float32)
+        hidden_states = outputs.last_hidden_state.to(torch.float32)
+        embeddings = (hidden_states * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return embeddings.numpy()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Parité et débit par mode --------------------------------------------------------------|
+INFERENCE_MODES = {
+    "fp32_no_grad": {"precision": "fp32", "grad_mode": "no_grad", "attention": "eager"},
+    "fp32_inference_mode": {"precision": "fp32", "grad_mode": "inference_mode", "attention": "eager"},
+    "fp32_sdpa": {"precision": "fp32", "grad_mode": "inference_mode", "attention": "sdpa"},
+    "bf16_inference_mode": {"precision": "bf16", "grad_mode": "inference_mode", "attention": "eager"},
+    "bf16_sdpa": {"precision": "bf16", "grad_mode": "inference_mode", "attention": "sdpa"},
+}
+
+def parity_check(reference, candidate):
+    """Similarité cosinus minimale et moyenne entre les embeddings de référence (fp32) et ceux d'un mode."""
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    similarities = np.sum(reference * candidate, axis=1)
+    return float(similarities.min()), float(similarities.mean())
+
+def benchmark_modes(model_name, texts, batch_size=8, repeats=3):
+    """Compare chaque mode d'inférence au fp32 de référence (parité) et mesure son débit en textes par seconde."""
+    from transformers import AutoTokenizer, AutoModel
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    # Référence : wrapper pyfunc (fp32, no_grad), un texte à la fois
+    reference_embedder = TorchEmbedder(
+        AutoModel.from_pretrained(model_name, attn_implementation="eager"), tokenizer, **INFERENCE_MODES["fp32_no_grad"]
+    )
+    reference = np.vstack([reference_embedder.predict([text]) for text in texts])
+
+    results = {}
+    for mode, options in INFERENCE_MODES.items():
+        # Charger le modèle avec l'implémentation d'attention du mode
+        embedder = TorchEmbedder(AutoModel.from_pretrained(model_name, attn_implementation=options["attention"]), tokenizer, **options)
+        embedder.predict(batches[0])  # Préchauffage
+
+        start_time = time.time()
+        for _ in range(repeats):
+            embeddings = np.vstack([embedder.predict(batch) for batch in batches])
+        throughput = len(texts) * repeats / (time.time() - start_time)
+
+        min_similarity, mean_similarity = parity_check(reference, embeddings)
+        results[mode] = {"min_cos": min_similarity, "mean_cos": mean_similarity, "texts_per_second": throughput}
+        print(f"\033[96m{mode:<22} cos min = {min_similarity:.5f}  cos moyen = {mean_similarity:.5f}  débit = {throughput:.1f} textes/s\033[0m")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parité et débit des modes d'inférence PyTorch du modèle Solon.")
+    parser.add_argument("--model", default="OrdalieTech/Solon-embeddings-large-0.1")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--texts", type=int, default=64)
+    args = parser.parse_args()
+
+    configure_torch_threads()
+
+    sample_texts = [
+        " ".join(["Le document décrit les procédures internes applicables aux collections."] * (1 + i % 30))
+        for i in range(args.texts)
+    ]
+    benchmark_modes(args.model, sample_texts, batch_size=args.batch_size)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
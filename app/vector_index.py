@@ -0,0 +1,134 @@
+# ------------------------------------------------------ Imports -------------------------------------------------------------------------------|
+# Standard library imports
+import os
+import math
+import time
+
+# Third-party library imports
+from sqlalchemy import text
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Configuration de l'index vectoriel ----------------------------------------------------|
+# Type d'index sur chunks.embedding_solon : "hnsw" (par défaut) ou "ivfflat" (construction plus rapide et moins gourmande)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+# Paramètres de construction HNSW (mêmes valeurs par défaut que la migration 05)
+HNSW_M = int(os.getenv("HNSW_M", 16))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", 64))
+# Nombre de listes IVFFlat (0 = calculé à partir du nombre de chunks)
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", 0))
+
+VECTOR_INDEX_NAMES = {
+    "hnsw": "ix_chunks_embedding_solon_hnsw",
+    "ivfflat": "ix_chunks_embedding_solon_ivfflat",
+}
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Paramètres de construction ------------------------------------------------------------|
+def default_ivfflat_lists(row_count):
+    """Nombre de listes recommandé par pgvector : lignes / 1000 jusqu'à 1M de lignes, racine carrée au-delà."""
+    if row_count > 1_000_000:
+        return int(math.sqrt(row_count))
+    return max(1, row_count // 1000)
+
+def vector_opclass(connection):
+    """Classe d'opérateurs L2 correspondant au type de stockage de la colonne embedding_solon (vector ou halfvec)."""
+    current_type = connection.execute(
+        text(
+            """
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'chunks'::regclass AND attname = 'embedding_solon'
+            """
+        )
+    ).scalar()
+    return "halfvec_l2_ops" if current_type.startswith("halfvec") else "vector_l2_ops"
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Lecture de l'index en place -----------------------------------------------------------|
+def current_vector_index(connection):
+    """
+    Retourne le type et le nombre de listes de l'index vectoriel en place sur chunks.embedding_solon,
+    ou (None, None) s'il n'y en a pas.
+    """
+    row = connection.execute(
+        text(
+            """
+            SELECT am.amname, c.reloptions FROM pg_class c JOIN pg_am am ON am.oid = c.relam
+            WHERE c.relkind = 'i' AND c.relname = ANY(:names)
+            """
+        ),
+        {"names": list(VECTOR_INDEX_NAMES.values())}
+    ).first()
+    if row is None:
+        return None, None
+
+    # reloptions : tableau de chaînes "clé=valeur", par exemple {lists=100}
+    options = dict(option.split("=", 1) for option in (row.reloptions or []))
+    lists = int(options["lists"]) if "lists" in options else None
+    return row.amname, lists
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Construction de l'index ---------------------------------------------------------------|
+def vector_index_name(index_type, collection_id=None):
+    """Nom de l'index vectoriel global, ou de l'index partiel d'une collection (suffixe _c<collection_id>)."""
+    index_name = VECTOR_INDEX_NAMES[index_type]
+    return f"{index_name}_c{int(collection_id)}" if collection_id is not None else index_name
+
+def drop_collection_vector_indexes(connection, collection_id):
+    """Supprime les index vectoriels partiels d'une collection (par exemple à la suppression de la collection)."""
+    for index_type in VECTOR_INDEX_NAMES:
+        connection.execute(text(f"DROP INDEX IF EXISTS {vector_index_name(index_type, collection_id)}"))
+
+def build_vector_index(bind, index_type=VECTOR_INDEX_TYPE, lists=None, m=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION,
+                       collection_id=None):
+    """
+    (Re)construit l'index vectoriel de chunks.embedding_solon, sans bloquer les écritures sur chunks.
+
+    Le nouvel index est construit sous un nom temporaire par CREATE INDEX CONCURRENTLY, puis l'ancien est supprimé
+    par DROP INDEX CONCURRENTLY et le nouveau renommé : chaque étape est exécutée en autocommit sur sa propre
+    connexion (bind est le moteur SQLAlchemy). Aucune transaction ne doit rester ouverte sur la session de l'appelant,
+    CREATE INDEX CONCURRENTLY attendant la fin des transactions en cours. Pour IVFFlat, c'est aussi ce qui recalcule
+    les centroïdes après un chargement massif.
+
+    Avec collection_id, construit un index partiel (WHERE collection_id = ...) utilisé par les recherches
+    filtrées sur cette collection, sans toucher à l'index global.
+    """
+    if index_type not in VECTOR_INDEX_NAMES:
+        raise ValueError(f"Type d'index inconnu : {index_type} (attendu : {', '.join(VECTOR_INDEX_NAMES)})")
+
+    index_name = vector_index_name(index_type, collection_id)
+    where = f" WHERE collection_id = {int(collection_id)}" if collection_id is not None else ""
+
+    with bind.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        opclass = vector_opclass(connection)
+
+        if index_type == "ivfflat":
+            if not lists:
+                count_query = "SELECT count(*) FROM chunks WHERE embedding_solon IS NOT NULL"
+                if collection_id is not None:
+                    count_query += f" AND collection_id = {int(collection_id)}"
+                row_count = connection.execute(text(count_query)).scalar()
+                # IVFFLAT_LISTS s'applique à l'index global, les index partiels suivent la taille de leur collection
+                lists = (IVFFLAT_LISTS if collection_id is None else 0) or default_ivfflat_lists(row_count)
+            options = f"lists = {int(lists)}"
+        else:
+            lists = None
+            options = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+
+        start_time = time.time()
+        # Un index _new invalide peut rester d'une construction concurrente interrompue
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}_new"))
+        connection.execute(text(
+            f"CREATE INDEX CONCURRENTLY {index_name}_new ON chunks USING {index_type} (embedding_solon {opclass}) WITH ({options}){where}"
+        ))
+        for name in VECTOR_INDEX_NAMES:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {vector_index_name(name, collection_id)}"))
+        connection.execute(text(f"ALTER INDEX {index_name}_new RENAME TO {index_name}"))
+        duration = time.time() - start_time
+
+    return {"index_type": index_type, "lists": lists, "duration": duration, "collection_id": collection_id}
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
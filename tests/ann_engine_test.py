@@ -0,0 +1,139 @@
+import threading
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from pgvector.utils import HalfVector
+
+from app.ann_engine import AnnEngine, CollectionAnnIndex, recall_at_k, embedding_to_numpy
+from app.search_cache import bump_generations
+
+pytest.importorskip("hnswlib")
+
+
+# ------------------------------------------------------ Utils ---------------------------------------------------------------------------------|
+def make_session():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+def add_chunks(db, collection_id, embeddings, first_id):
+    for offset, embedding in enumerate(embeddings):
+        db.add(models.Chunk(
+            chunk_id=first_id + offset, document_id=1, collection_id=collection_id,
+            chunk_text=f"chunk {first_id + offset}", taille_chunk=8, embedding_solon=embedding
+        ))
+    bump_generations(db, collection_id)
+    db.commit()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de l'index HNSW en mémoire -------------------------------------------------------|
+def test_collection_ann_index_search_and_snapshot(tmp_path):
+    """
+    Vérifie que l'index retrouve le plus proche voisin exact, ignore les chunks supprimés et survit à un snapshot.
+    """
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((200, 1024)).astype(np.float32)
+    index = CollectionAnnIndex.create(capacity=16)
+    index.add(list(range(1, 201)), embeddings)
+
+    chunk_ids, distances = index.search(embeddings[41], 5)
+    assert chunk_ids[0] == 42, "Le chunk identique à la requête doit être le premier résultat."
+    assert distances[0] == pytest.approx(0.0, abs=1e-3), "La distance L2 au chunk identique doit être nulle."
+
+    index.remove([42])
+    assert 42 not in index.search(embeddings[41], 5)[0], "Un chunk supprimé ne doit plus être retourné."
+
+    index.generation = 7
+    index.save(str(tmp_path / "collection-1"))
+    loaded = CollectionAnnIndex.load(str(tmp_path / "collection-1"))
+    assert loaded.generation == 7 and len(loaded.chunk_ids) == 199, "Le snapshot doit conserver la génération et les chunks."
+    assert loaded.search(embeddings[10], 1)[0] == [11], "L'index rechargé doit donner les mêmes résultats."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la synchronisation avec la base -----------------------------------------------|
+def test_ann_engine_sync_follows_generations(tmp_path):
+    """
+    Vérifie que le moteur suit les écritures en base (ajouts, suppressions) via le compteur de génération de la collection.
+    """
+    db = make_session()
+    rng = np.random.default_rng(1)
+    add_chunks(db, 1, rng.standard_normal((20, 1024)), first_id=1)
+    add_chunks(db, 2, rng.standard_normal((5, 1024)), first_id=100)
+
+    ann = AnnEngine(collection_ids={1}, snapshot_dir=str(tmp_path), sync_interval=0)
+    ann.load(db)
+    assert ann.indexes[1].chunk_ids == set(range(1, 21)), "Seuls les chunks de la collection doivent être indexés."
+    assert (tmp_path / "collection-1.bin").exists(), "Un snapshot doit être écrit après la construction."
+
+    new_embedding = rng.standard_normal(1024)
+    add_chunks(db, 1, [new_embedding], first_id=21)
+    db.query(models.Chunk).filter(models.Chunk.chunk_id == 1).delete()
+    bump_generations(db, 1)
+    db.commit()
+
+    chunk_ids, _ = ann.search(db, 1, new_embedding, 3)
+    assert chunk_ids[0] == 21, "Un chunk ajouté en base doit être retrouvé sans reconstruction."
+    assert 1 not in ann.indexes[1].chunk_ids, "Un chunk supprimé en base doit être retiré de l'index."
+
+    ann.drop(1)
+    assert not (tmp_path / "collection-1.bin").exists(), "Le snapshot d'une collection supprimée doit être effacé."
+    assert recall_at_k([1, 2, 3, 4], [1, 2, 3, 9]) == 0.75
+    db.close()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test des synchronisations concurrentes ------------------------------------------------|
+def test_ann_engine_concurrent_sync(tmp_path):
+    """
+    Vérifie que des requêtes concurrentes qui voient la collection périmée n'appliquent qu'une fois la même différence.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'chunks.db'}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+    db = session_factory()
+    rng = np.random.default_rng(3)
+    add_chunks(db, 1, rng.standard_normal((50, 1024)), first_id=1)
+
+    ann = AnnEngine(collection_ids={1}, snapshot_dir=str(tmp_path), sync_interval=0)
+    index = ann.sync(db, 1)
+    add_chunks(db, 1, rng.standard_normal((30, 1024)), first_id=51)
+
+    applied = []
+    original_add = index.add
+    def counting_add(chunk_ids, embeddings):
+        applied.extend(chunk_ids)
+        original_add(chunk_ids, embeddings)
+    index.add = counting_add
+
+    def worker():
+        with session_factory() as session:
+            ann.sync(session, 1)
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(applied) == list(range(51, 81)), "Chaque chunk ajouté doit être appliqué une seule fois."
+    assert index.chunk_ids == set(range(1, 81)), "L'index doit refléter la base après les synchronisations."
+    db.close()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la lecture des embeddings halfvec ---------------------------------------------|
+def test_embedding_to_numpy_halfvec():
+    """
+    Vérifie que les embeddings relus en stockage halfvec (objets HalfVector) sont convertis en float32 pour les moteurs en mémoire.
+    """
+    embedding = np.random.randn(1024).astype(np.float32)
+    halfvec = embedding_to_numpy(HalfVector(embedding.tolist()))
+    assert halfvec.dtype == np.float32 and halfvec.shape == (1024,), "L'embedding halfvec doit être converti en float32."
+    assert np.allclose(halfvec, embedding, atol=1e-2), "La conversion ne doit perdre que la précision du float16."
+    assert np.array_equal(embedding_to_numpy(embedding), embedding), "Un embedding vector doit être renvoyé tel quel."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
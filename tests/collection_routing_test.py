@@ -0,0 +1,35 @@
+import numpy as np
+from sqlalchemy.dialects import postgresql
+
+from app.collection_routing import build_routing_statement, CENTROID_UPDATES
+
+
+# ------------------------------------------------------ Test du routage par centroïde ---------------------------------------------------------|
+def test_routing_statement():
+    """
+    Vérifie que le routage classe les collections non vides par distance cosinus entre la requête et la somme de leurs embeddings.
+    """
+    sql = str(build_routing_statement(np.random.randn(1024).tolist(), 3).compile(dialect=postgresql.dialect()))
+    assert "collections.embedding_sum <=> %(routing_embedding)s" in sql, "Le routage doit trier par distance cosinus au centroïde."
+    assert "collections.chunk_count >" in sql and "LIMIT" in sql, "Seules les K collections non vides doivent être retenues."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la mise à jour incrémentale ---------------------------------------------------|
+def test_centroid_sum_is_scale_invariant():
+    """
+    Vérifie que la somme tenue à jour par ajout et retrait de documents donne la même distance cosinus que le centroïde recalculé.
+    """
+    rng = np.random.default_rng(0)
+    documents = [rng.standard_normal((n, 1024)) for n in (3, 5, 2)]
+    query = rng.standard_normal(1024)
+
+    embedding_sum = sum(document.sum(axis=0) for document in documents) - documents[1].sum(axis=0)
+    centroid = np.vstack([documents[0], documents[2]]).mean(axis=0)
+
+    def cosine(a, b):
+        return a @ b / (np.linalg.norm(a) * np.linalg.norm(b))
+
+    assert np.isclose(cosine(embedding_sum, query), cosine(centroid, query)), "La somme et le centroïde doivent router de la même façon."
+    assert set(CENTROID_UPDATES) == {1, -1}, "L'ajout et le retrait d'un document doivent être pris en charge."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -0,0 +1,55 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.dedup import minhash_signature, estimated_jaccard, lsh_band_keys, lsh_band_rows, find_near_duplicates, signature_bytes
+
+
+# ------------------------------------------------------ Utils ---------------------------------------------------------------------------------|
+BASE_TEXT = " ".join(f"mot{i}" for i in range(200))
+NEAR_DUPLICATE = BASE_TEXT + " pied de page"
+OTHER_TEXT = " ".join(f"terme{i}" for i in range(200))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test des signatures MinHash -----------------------------------------------------------|
+def test_minhash_signature():
+    """
+    Vérifie que la signature estime la similarité de Jaccard et que des textes quasi identiques partagent des bandes LSH.
+    """
+    signature = minhash_signature(BASE_TEXT)
+    assert estimated_jaccard(signature, minhash_signature(BASE_TEXT.upper() + " !")) == 1.0, \
+        "La casse et la ponctuation ne doivent pas changer la signature."
+    assert estimated_jaccard(signature, minhash_signature(NEAR_DUPLICATE)) > 0.9, "Un quasi-doublon doit avoir une similarité élevée."
+    assert estimated_jaccard(signature, minhash_signature(OTHER_TEXT)) < 0.1, "Des textes différents doivent avoir une similarité faible."
+    assert set(lsh_band_keys(signature)) & set(lsh_band_keys(minhash_signature(NEAR_DUPLICATE))), \
+        "Un quasi-doublon doit partager au moins une bande LSH."
+    assert minhash_signature(" ... ") is None, "Un texte vide n'a pas de signature."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la détection à l'upload -------------------------------------------------------|
+def test_find_near_duplicates():
+    """
+    Vérifie que l'index LSH de la collection retrouve un original déjà en base, qu'un doublon interne au document
+    renvoie au chunk précédent, et que les autres collections ne sont pas consultées.
+    """
+    engine = create_engine("sqlite://")
+    models.Chunk.__table__.create(bind=engine)
+    models.ChunkLshBand.__table__.create(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    signature = minhash_signature(BASE_TEXT)
+    db.add(models.Chunk(chunk_id=1, document_id=1, collection_id=1, chunk_text=BASE_TEXT, taille_chunk=len(BASE_TEXT),
+                        minhash=signature_bytes(signature)))
+    db.add_all(lsh_band_rows(1, signature))
+    db.commit()
+
+    signatures, duplicates = find_near_duplicates(db, 1, [NEAR_DUPLICATE, OTHER_TEXT, OTHER_TEXT + " fin"])
+    assert duplicates == [("chunk", 1), None, ("upload", 1)], "Les quasi-doublons doivent renvoyer à leur original."
+    assert all(signature is not None for signature in signatures), "Chaque chunk doit avoir une signature."
+
+    _, duplicates = find_near_duplicates(db, 2, [NEAR_DUPLICATE])
+    assert duplicates == [None], "L'index LSH est propre à chaque collection."
+    db.close()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
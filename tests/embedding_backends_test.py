@@ -0,0 +1,84 @@
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from app.embedding_backends import EmbeddingBackend, HttpEmbeddingBackend
+
+
+# ------------------------------------------------------ Utils ---------------------------------------------------------------------------------|
+def fake_embedding(text):
+    """Embedding déterministe de test : dimension 1024, dépend de la longueur du texte."""
+    return [float(len(text))] * 1024
+
+class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+    """Service d'embedding de test : même protocole que app/embedding_service.py."""
+    requests_received = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        FakeEmbeddingHandler.requests_received.append(body["texts"])
+        payload = json.dumps({"embeddings": [fake_embedding(text) for text in body["texts"]]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def embedding_server():
+    FakeEmbeddingHandler.requests_received = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeEmbeddingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/embed"
+    server.shutdown()
+    server.server_close()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test du backend HTTP ------------------------------------------------------------------|
+def test_http_embedding_backend(embedding_server):
+    """
+    Vérifie que le backend HTTP découpe les textes en batchs et renvoie les embeddings dans l'ordre, en synchrone et en asynchrone.
+    """
+    backend = HttpEmbeddingBackend(url=embedding_server, timeout=5)
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+
+    embeddings = backend.embed_batch(texts, batch_size=2)
+    assert embeddings.shape == (5, 1024), f"Dimensions inattendues : {embeddings.shape}"
+    assert embeddings[:, 0].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0], "Les embeddings ne sont pas dans l'ordre des textes."
+    assert [len(batch) for batch in FakeEmbeddingHandler.requests_received] == [2, 2, 1], "Le découpage en batchs est incorrect."
+
+    embeddings = asyncio.run(backend.aembed(texts, batch_size=4))
+    assert embeddings[:, 0].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0], "Les embeddings asynchrones ne sont pas dans l'ordre des textes."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de l'interface commune -----------------------------------------------------------|
+def test_embedding_backend_batching():
+    """
+    Vérifie que embed_batch et aembed appellent embed par batchs et concatènent les résultats.
+    """
+    class LengthBackend(EmbeddingBackend):
+        def __init__(self):
+            self.calls = []
+
+        def embed(self, texts):
+            self.calls.append(len(texts))
+            return np.asarray([fake_embedding(text) for text in texts], dtype=np.float32)
+
+    backend = LengthBackend()
+    embeddings = asyncio.run(backend.aembed(["x"] * 7, batch_size=3))
+    assert embeddings.shape == (7, 1024), f"Dimensions inattendues : {embeddings.shape}"
+    assert backend.calls == [3, 3, 1], "Le découpage en batchs est incorrect."
+
+    with pytest.raises(TypeError):
+        EmbeddingBackend()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
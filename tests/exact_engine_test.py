@@ -0,0 +1,116 @@
+import json
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.exact_engine import ExactEngine, CollectionSnapshot
+from app.search_cache import bump_generations
+
+
+# ------------------------------------------------------ Utils ---------------------------------------------------------------------------------|
+def make_session():
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    return sessionmaker(bind=engine)()
+
+def add_chunks(db, collection_id, embeddings, first_id):
+    for offset, embedding in enumerate(embeddings):
+        db.add(models.Chunk(
+            chunk_id=first_id + offset, document_id=1, collection_id=collection_id,
+            chunk_text=f"chunk {first_id + offset}", taille_chunk=8, embedding_solon=embedding
+        ))
+    bump_generations(db, collection_id)
+    db.commit()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la recherche exacte -----------------------------------------------------------|
+def test_collection_snapshot_exact_search(tmp_path):
+    """
+    Vérifie que la recherche sur les segments memory-mapped est exacte, ignore les chunks supprimés et compacte les segments.
+    """
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((300, 1024)).astype(np.float32)
+    snapshot = CollectionSnapshot(str(tmp_path / "collection-1"))
+    snapshot.write(1, list(range(1, 201)), embeddings[:200], [])
+    snapshot.write(2, list(range(201, 301)), embeddings[200:], [])
+    assert len(snapshot.segments) == 2, "Chaque rafraîchissement doit ajouter un segment."
+    assert isinstance(snapshot.segments[0].embeddings, np.memmap), "Les embeddings doivent être projetés en mémoire."
+
+    query = rng.standard_normal(1024)
+    l2_distances = np.linalg.norm(embeddings - query, axis=1)
+    expected = (np.argsort(l2_distances)[:10] + 1).tolist()
+    chunk_ids, distances = snapshot.search(query, 10)
+    assert chunk_ids == expected, "Le top-n doit être celui d'une recherche exhaustive en distance L2 (classement de pgvector)."
+    assert np.allclose(distances, l2_distances[np.asarray(expected) - 1], rtol=1e-4), "Les distances L2 renvoyées sont incorrectes."
+
+    scaled = CollectionSnapshot(str(tmp_path / "collection-2"))
+    scaled.write(1, [1, 2], np.stack([query * 3, query * 1.1 + rng.standard_normal(1024) * 0.1]), [])
+    assert scaled.search(query, 1)[0] == [2], "Le classement doit suivre la distance L2 et non le cosinus (embeddings non normalisés)."
+
+    snapshot.write(3, [], [], expected[:1])
+    assert expected[0] not in snapshot.search(query, 10)[0], "Un chunk supprimé ne doit plus être retourné."
+
+    snapshot.write(4, [], [], list(range(1, 100)))
+    assert len(snapshot.segments) == 1, "Au-delà du seuil de suppressions, les segments doivent être compactés."
+    assert snapshot.chunk_ids() == set(range(100, 301)) - {expected[0]}, "Le compactage doit conserver les chunks vivants."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la reprise d'un ancien snapshot -----------------------------------------------|
+def test_exact_snapshot_format_upgrade(tmp_path):
+    """
+    Vérifie qu'un snapshot d'un ancien format (embeddings normalisés) est ignoré puis reconstruit depuis la base.
+    """
+    directory = tmp_path / "collection-1"
+    directory.mkdir()
+    (directory / "meta.json").write_text(json.dumps({"generation": 1, "next_segment": 1, "segments": [{"name": "segment-000000", "deleted": []}]}))
+    db = make_session()
+    add_chunks(db, 1, np.random.default_rng(2).standard_normal((5, 1024)), first_id=1)
+
+    engine = ExactEngine(collection_ids={1}, snapshot_dir=str(tmp_path), sync_interval=0)
+    engine.load(db)
+    snapshot = engine.snapshot(1)
+    assert snapshot.chunk_ids() == set(range(1, 6)), "Le snapshot doit être reconstruit depuis la base."
+    assert [segment.name for segment in snapshot.segments] == ["segment-000001"], "Les noms des anciens segments ne doivent pas être réutilisés."
+    db.close()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test du partage entre workers ---------------------------------------------------------|
+def test_exact_engine_shared_between_workers(tmp_path):
+    """
+    Vérifie qu'un second worker reprend le snapshot écrit par le premier et voit ses rafraîchissements incrémentaux.
+    """
+    db = make_session()
+    rng = np.random.default_rng(1)
+    add_chunks(db, 1, rng.standard_normal((20, 1024)), first_id=1)
+
+    worker_a = ExactEngine(collection_ids={1}, snapshot_dir=str(tmp_path), sync_interval=0)
+    worker_b = ExactEngine(collection_ids={1}, snapshot_dir=str(tmp_path), sync_interval=3600)
+    worker_a.load(db)
+
+    new_embedding = rng.standard_normal(1024)
+    add_chunks(db, 1, [new_embedding], first_id=21)
+    worker_a.sync(db, 1, force=True)
+
+    chunk_ids, _ = worker_b.search(db, 1, new_embedding, 1)
+    assert chunk_ids == [21], "Le second worker doit voir le segment ajouté par le premier sans le recalculer."
+    assert len(worker_b.snapshot(1).segments) == 2, "Le rafraîchissement doit être incrémental."
+
+    # Deux workers qui voient le même état périmé : la différence n'est écrite qu'une fois
+    stale_ids = worker_a.snapshot(1).chunk_ids()
+    add_chunks(db, 1, rng.standard_normal((3, 1024)), first_id=22)
+    worker_a.sync(db, 1, force=True)
+    added = rng.standard_normal((3, 1024))
+    worker_b.snapshot(1).write(worker_a.snapshot(1).generation, [22, 23, 24], added, set())
+    worker_b.snapshot(1).reload_if_changed()
+    live = [int(chunk_id) for segment in worker_b.snapshot(1).segments for chunk_id in segment.chunk_ids[segment.alive]]
+    assert sorted(live) == sorted(stale_ids | {22, 23, 24}), "Un chunk déjà écrit par un autre worker ne doit pas être dupliqué."
+
+    worker_a.drop(1)
+    assert not (tmp_path / "collection-1").exists(), "Le snapshot d'une collection supprimée doit être effacé."
+    db.close()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
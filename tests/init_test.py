@@ -1,6 +1,6 @@
 # init_test.py
 import os
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock
 from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 
@@ -85,17 +85,18 @@ def initialize_test_services():
     mock_mlflow_client = MagicMock()
     print("\033[1;32mMock MLflow client initialisé.\033[0m")
 
-    # Mock modèle Solon
-    mock_solon_model = MagicMock()
-    mock_solon_model.predict.return_value = [list(range(1024))]  # Retourne un vecteur constant pour les tests
-    print("\033[1;32mMock modèle Solon initialisé.\033[0m")
+    # Mock backend d'embedding
+    mock_embedding_backend = MagicMock()
+    mock_embedding_backend.embed.return_value = [list(range(1024))]  # Retourne un vecteur constant pour les tests
+    mock_embedding_backend.aembed = AsyncMock(side_effect=lambda texts: [list(range(1024))] * len(texts))
+    print("\033[1;32mMock backend d'embedding initialisé.\033[0m")
 
     # Mock tokenizer
     mock_tokenizer = MagicMock()
     print("\033[1;32mMock tokenizer initialisé.\033[0m")
     print("\n================================= \033[1;33mInitialisation des tests\033[0m \033[32mPASSED\033[0m ====================================================")
 
-    return mock_minio_client, mock_mlflow_client, mock_solon_model, mock_tokenizer
+    return mock_minio_client, mock_mlflow_client, mock_embedding_backend, mock_tokenizer
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
 
 
@@ -137,7 +138,9 @@ def verify_tables_created():
         "roles", 
         "collections", 
         "documents", 
-        "chunks"
+        "chunks",
+        "search_generations",
+        "chunk_lsh_bands"
     ]
     
     # Vérifie que toutes les tables attendues sont présentes
@@ -161,11 +164,13 @@ def verify_columns_in_table():
                   "author_put_collection", "author_patch_collection", "author_delete_collection", "author_get_user",
                   "author_post_user", "author_put_user", "author_patch_user", "author_delete_user"],
         "collections": ["collection_id", "user_id", "name", "description", "date_de_creation",
-                        "derniere_modification", "etat_bucket"],
+                        "derniere_modification", "etat_bucket", "embedding_sum", "chunk_count"],
         "documents": ["document_id", "collection_id", "title", "title_document", "minio_link", "date_de_creation",
-                      "created_at", "posted_by", "num_of_chunks"],
-        "chunks": ["chunk_id", "document_id", "chunk_text", "taille_chunk", "embedding_cohere", 
-                   "embedding_solon", "embedding_bge", "created_at"]
+                      "created_at", "posted_by", "num_of_chunks", "embedding_solon"],
+        "chunks": ["chunk_id", "document_id", "collection_id", "chunk_text", "taille_chunk", "embedding_cohere", 
+                   "embedding_solon", "embedding_bge", "embedding_solon_bin", "chunk_tsv", "minhash", "duplicate_of", "created_at"],
+        "search_generations": ["scope", "generation"],
+        "chunk_lsh_bands": ["chunk_id", "band", "band_key"]
     }
     
     print("\n|-> \033[1;33mVérification de la présence des colonnes dans les tables\033[0m")
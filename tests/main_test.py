@@ -1,9 +1,10 @@
 import pytest
 from app.main import app
+from app import main as app_main
 from app import models
 from app.database import Base, get_db
 from fastapi.testclient import TestClient
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 import numpy as np
 from sqlalchemy import inspect
 from io import BytesIO
@@ -62,7 +63,7 @@ def test_db():
 @pytest.mark.asyncio
 async def test_search_similar_chunks(test_db):
     # Initialisation des services de test (mocks)
-    minio_client, mlflow_client, solon_model, tokenizer = initialize_test_services()
+    minio_client, mlflow_client, embedding_backend, tokenizer = initialize_test_services()
 
     # Utilisation de la session de la base de données pour le test
     db_session = next(get_test_db())
@@ -99,9 +100,9 @@ async def test_search_similar_chunks(test_db):
 
     # Étape 4 : Recherche du chunk le plus similaire
     print("==> \033[34mÉtape 4\033[0m : Recherche du chunk le plus similaire à une requête...")
-    with patch("app.main.initialize_services", return_value=(minio_client, mlflow_client, solon_model, tokenizer)):
-        with patch("app.main.solon_model", solon_model):  # Patch la variable globale `solon_model`
-            query_embedding = solon_model.predict(["test query"])[0]
+    with patch("app.main.initialize_services", return_value=(minio_client, mlflow_client, embedding_backend, tokenizer)):
+        with patch("app.main.embedding_backend", embedding_backend):  # Patch la variable globale `embedding_backend`
+            query_embedding = embedding_backend.embed(["test query"])[0]
             print(f"Embedding de la requête : {query_embedding[:5]}... [total {len(query_embedding)} valeurs]\n")
             
             chunks = db_session.query(models.Chunk).all()
@@ -686,8 +687,8 @@ def test_delete_collection(test_db):
 
 # ------------------------------------------------------ Test du endpoint /upload_document ----------------------------------------------------|
 @patch("app.main.minio_client")  # Mock du client MinIO pour éviter d'avoir besoin de MinIO réel
-@patch("app.main.solon_model")  # Mock du modèle Solon pour simuler les embeddings
-def test_upload_document(mock_solon_model, mock_minio_client, test_db):
+@patch("app.main.embedding_backend")  # Mock du backend d'embedding pour simuler les embeddings
+def test_upload_document(mock_embedding_backend, mock_minio_client, test_db):
     """
     Teste le point de terminaison /upload_document pour uploader un document dans une collection spécifique.
     """
@@ -706,8 +707,8 @@ def test_upload_document(mock_solon_model, mock_minio_client, test_db):
 
     print(f"Utilisation de la collection existante : ID = {collection_id}, Nom = {collection_name}\n")
 
-    # Mock du retour du modèle Solon
-    mock_solon_model.predict.return_value = [list(range(1024))]  # Retourne un embedding fixe
+    # Mock du retour du backend d'embedding
+    mock_embedding_backend.aembed = AsyncMock(side_effect=lambda texts: [list(range(1024))] * len(texts))  # Retourne un embedding fixe par chunk
 
     # Mock du client MinIO pour éviter les vraies interactions avec le stockage
     mock_minio_client.put_object.return_value = None  # Simule un upload réussi
@@ -896,3 +897,144 @@ def test_delete_document(mock_minio_client, test_db):
 
     print("\n================================= \033[1;33mTEST 18\033[0m \033[32mPASSED\033[0m ======================================================================")
 # ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+
+
+# ------------------------------------------------------ Test des endpoints /health/live et /health/ready ---------------------------------------|
+def test_health_endpoints(test_db):
+    """
+    Teste la liveness et la readiness : la readiness ne passe au vert qu'une fois le modèle préchauffé et MinIO joignable.
+    """
+
+    print("\n\n\n================================= \033[1;33mTEST 19 : test de la liveness et de la readiness\033[0m ====================================")
+
+    # Étape 1 : La liveness répond toujours
+    print("==> \033[34mÉtape 1\033[0m : Vérification de la liveness...")
+    response = client.get("/health/live")
+    assert response.status_code == 200, f"Erreur : statut {response.status_code}"
+    print(f"Liveness : {response.json()}\n")
+
+    # Étape 2 : La readiness est rouge tant que le modèle n'est pas préchauffé
+    print("==> \033[34mÉtape 2\033[0m : Vérification de la readiness avant le préchauffage...")
+    with patch("app.main.model_warmed_up", False), patch("app.main.minio_client") as mock_minio_client:
+        mock_minio_client.bucket_exists.return_value = True
+        response = client.get("/health/ready")
+    assert response.status_code == 503, f"Erreur : statut {response.status_code}"
+    assert response.json()["checks"]["model"] is False, "Le modèle ne doit pas être considéré comme prêt."
+    print(f"Readiness : {response.json()}\n")
+
+    # Étape 3 : La readiness passe au vert une fois le modèle préchauffé (en arrière-plan) et MinIO joignable
+    print("==> \033[34mÉtape 3\033[0m : Vérification de la readiness après le préchauffage...")
+    with patch("app.main.model_warmed_up", False), patch("app.main.warmup_model") as mock_warmup, \
+            patch("app.main.minio_client") as mock_minio_client:
+        mock_minio_client.bucket_exists.return_value = True
+        mock_warmup.side_effect = RuntimeError("modèle indisponible")
+        app_main.warm_up_model()
+        assert client.get("/health/ready").json()["checks"]["model"] is False, "Un préchauffage en échec ne doit pas rendre le modèle prêt."
+        mock_warmup.side_effect = None
+        app_main.warm_up_model()
+        response = client.get("/health/ready")
+    assert response.status_code == 200, f"Erreur : statut {response.status_code}"
+    assert response.json()["status"] == "ready", "L'API devrait être prête."
+    print(f"Readiness : {response.json()}\n")
+
+    print("\n================================= \033[1;33mTEST 19\033[0m \033[32mPASSED\033[0m ======================================================================")
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+
+
+# ------------------------------------------------------ Test du endpoint /documents/{document_id}/move ----------------------------------------|
+@patch("app.main.minio_client")  # Mock du client MinIO pour éviter d'avoir besoin de MinIO réel
+def test_move_document(mock_minio_client, test_db):
+    """
+    Teste le déplacement d'un document : le document et la copie de collection_id portée par ses chunks changent de collection.
+    """
+
+    db_session = next(get_test_db())
+    print("\n\n\n================================= \033[1;33mTEST 20 : test du déplacement d'un document\033[0m =========================================")
+
+    # Étape 1 : Création d'une collection de destination et d'un document avec un chunk dans la collection 2
+    print("==> \033[34mÉtape 1\033[0m : Création des données de test...")
+    target_collection = models.Collection(user_id=1, name="Move Target", description="Collection de destination", etat_bucket="créé")
+    document = models.Document(collection_id=2, title="Moved Document", title_document="moved_document.txt",
+                               minio_link="/browser/collection-2-Second-Collection/moved_document.txt", posted_by="admin", num_of_chunks=1)
+    db_session.add_all([target_collection, document])
+    db_session.commit()
+    db_session.add(models.Chunk(document_id=document.document_id, collection_id=2, chunk_text="chunk", taille_chunk=5))
+    db_session.commit()
+    print(f"Document {document.document_id} à déplacer vers la collection {target_collection.collection_id}.\n")
+
+    # Étape 2 : Déplacement du document
+    print("==> \033[34mÉtape 2\033[0m : Envoi de la requête de déplacement...")
+    token = get_bearer_token()
+    response = client.patch(
+        f"/documents/{document.document_id}/move",
+        json={"collection_id": target_collection.collection_id},
+        headers={"Authorization": token}
+    )
+
+    # Étape 3 : Vérification des résultats
+    print("==> \033[34mÉtape 3\033[0m : Vérification des résultats...\n")
+    assert response.status_code == 200, f"Erreur : statut {response.status_code}"
+    assert response.json()["collection_id"] == target_collection.collection_id, "Le document n'a pas changé de collection."
+    assert mock_minio_client.copy_object.called, "Le fichier doit être copié dans le bucket de destination."
+    db_session.expire_all()
+    chunk = db_session.query(models.Chunk).filter(models.Chunk.document_id == document.document_id).one()
+    assert chunk.collection_id == target_collection.collection_id, "Les chunks doivent suivre leur document."
+    print(f"Document déplacé : {response.json()}\n")
+
+    print("\n================================= \033[1;33mTEST 20\033[0m \033[32mPASSED\033[0m ======================================================================")
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+
+
+
+# ------------------------------------------------------ Test de la réponse NDJSON de /search --------------------------------------------------|
+def test_stream_search_results(test_db):
+    """
+    Teste le générateur de la réponse NDJSON : un résultat par ligne, lu au fil du curseur, puis le curseur de la page suivante.
+    """
+    from sqlalchemy import select, literal
+    from app import schemas
+    from app.main import stream_search_results
+    from app.search_metrics import StageTimer
+
+    db_session = next(get_test_db())
+    print("\n\n\n================================= \033[1;33mTEST 21 : test de la réponse NDJSON de /search\033[0m ======================================")
+
+    # Étape 1 : Chunks et requête de test (distances fixes, les opérateurs pgvector n'existent pas sous SQLite)
+    print("==> \033[34mÉtape 1\033[0m : Préparation des chunks et de la requête...")
+    chunks = [models.Chunk(document_id=1, chunk_text=f"stream chunk {i}", taille_chunk=14) for i in range(3)]
+    db_session.add_all(chunks)
+    db_session.commit()
+    stmt = select(
+        models.Chunk.chunk_id, models.Chunk.chunk_text, models.Chunk.document_id, models.Chunk.collection_id,
+        literal(0.5).label("distance"), literal(0.8).label("similarity")
+    ).where(models.Chunk.chunk_id.in_([chunk.chunk_id for chunk in chunks])).order_by(models.Chunk.chunk_id).limit(2)
+    request = schemas.SearchRequest(query="test query", top_n=2)
+
+    # Étape 2 : Lecture du flux
+    print("==> \033[34mÉtape 2\033[0m : Lecture des lignes NDJSON...")
+    timer = StageTimer()
+    with patch("app.main.search_metrics") as mock_search_metrics:
+        lines = list(stream_search_results(
+            db_session.get_bind(), stmt, request, {1: "routée"}, "fingerprint", 0, include_collection_name=False, timer=timer
+        ))
+
+    # Étape 3 : Vérification des résultats
+    print("==> \033[34mÉtape 3\033[0m : Vérification des résultats...\n")
+    results = [schemas.ChunkResult.model_validate_json(line) for line in lines[:2]]
+    assert [result.similarity for result in results] == [0.8, 0.8], "Chaque ligne doit contenir un ChunkResult."
+    assert all(line.endswith("\n") for line in lines), "Chaque résultat doit être sur sa propre ligne."
+    assert "next_cursor" in lines[2], "La dernière ligne doit contenir le curseur de la page suivante."
+    assert mock_search_metrics.record.called, "Les métriques de recherche doivent être enregistrées à la fin du flux."
+    assert mock_search_metrics.record.call_args[0][1]["collection_choisie"] == "False", \
+        "Une recherche routée ne doit pas être comptée comme filtrée par l'utilisateur."
+    assert {"sql", "metrics"} <= set(timer.durations), "Les étapes du flux doivent être chronométrées à sa fin."
+    print(f"Lignes reçues : {len(lines)}\n")
+
+    print("\n================================= \033[1;33mTEST 21\033[0m \033[32mPASSED\033[0m ======================================================================")
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -0,0 +1,93 @@
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models, schemas
+from app.search_cache import (
+    SearchResultCache, SemanticResultCache, search_cache_key, semantic_cache_scope, get_generation, bump_generations
+)
+
+
+# ------------------------------------------------------ Test du cache LRU ---------------------------------------------------------------------|
+def test_search_result_cache_lru():
+    """
+    Vérifie que le cache est borné et évince la réponse la moins récemment utilisée.
+    """
+    cache = SearchResultCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1, "La réponse 'a' devrait être en cache."
+    cache.put("c", 3)
+
+    assert len(cache) == 2, "Le cache ne doit pas dépasser sa taille maximale."
+    assert cache.get("b") is None, "La réponse la moins récemment utilisée doit être évincée."
+    assert cache.get("a") == 1 and cache.get("c") == 3, "Les réponses récentes doivent rester en cache."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de l'invalidation par génération -------------------------------------------------|
+def test_search_cache_generations():
+    """
+    Vérifie qu'une écriture sur une collection change la clé des recherches filtrées sur cette collection
+    et des recherches globales, sans toucher aux autres collections.
+    """
+    engine = create_engine("sqlite://")
+    models.SearchGeneration.__table__.create(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    request = schemas.SearchRequest(query="horaires du service client", top_n=3, filtre_par_collection="FAQ")
+    key_collection = search_cache_key(request, get_generation(db, 1))
+    key_other = search_cache_key(request, get_generation(db, 2))
+    key_global = search_cache_key(request, get_generation(db))
+
+    bump_generations(db, 1)
+    db.commit()
+
+    assert search_cache_key(request, get_generation(db, 1)) != key_collection, "La collection modifiée doit invalider le cache."
+    assert search_cache_key(request, get_generation(db)) != key_global, "Toute écriture doit invalider les recherches globales."
+    assert search_cache_key(request, get_generation(db, 2)) == key_other, "Les autres collections ne doivent pas être invalidées."
+
+    bump_generations(db, 1, 1)
+    db.commit()
+    assert get_generation(db, 1) == 2 and get_generation(db) == 2, "Un compteur existant doit être incrémenté une seule fois."
+
+    debug_request = request.model_copy(update={"debug": True})
+    assert search_cache_key(debug_request, 0) == search_cache_key(request, 0), "Le mode debug ne doit pas changer la clé."
+    db.close()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test du cache sémantique --------------------------------------------------------------|
+def test_semantic_result_cache():
+    """
+    Vérifie qu'une requête d'embedding quasi identique reçoit la réponse en cache, mais pas une requête éloignée,
+    ni une requête d'une autre portée (autres paramètres ou données modifiées depuis).
+    """
+    rng = np.random.default_rng(0)
+    embedding = rng.standard_normal(1024)
+    close = embedding + 0.05 * rng.standard_normal(1024)
+    far = rng.standard_normal(1024)
+
+    request = schemas.SearchRequest(query="horaires d'ouverture", top_n=3, filtre_par_collection="FAQ")
+    rephrased = request.model_copy(update={"query": "heures d'ouverture"})
+    scope = semantic_cache_scope(request, 4)
+    assert semantic_cache_scope(rephrased, 4) == scope, "Le texte de la requête ne doit pas faire partie de la portée."
+    assert semantic_cache_scope(request, 5) != scope, "Une écriture sur la collection doit changer la portée."
+
+    cache = SemanticResultCache(max_size=2, threshold=0.97)
+    assert cache.get(scope, embedding) == (None, None), "Le cache vide ne doit rien renvoyer."
+    cache.put(scope, embedding, "réponse")
+
+    response, similarity = cache.get(scope, 2 * close)
+    assert response == "réponse" and similarity >= 0.97, "Une requête quasi identique doit réutiliser la réponse."
+    assert cache.get(scope, far)[0] is None, "Une requête éloignée ne doit pas réutiliser la réponse."
+    assert cache.get(semantic_cache_scope(request, 5), embedding) == (None, None), "Les réponses obsolètes ne doivent plus être trouvées."
+
+    cache.put("autre", far, "autre réponse")
+    assert cache.get(scope, embedding)[0] == "réponse"
+    cache.put("autre", -far, "troisième réponse")
+    assert len(cache) == 2, "Le cache ne doit pas dépasser sa taille maximale."
+    assert cache.get(scope, embedding)[0] == "réponse", "L'entrée la moins récemment utilisée doit être évincée."
+    assert cache.get("autre", far)[0] is None and cache.get("autre", -far)[0] == "troisième réponse", \
+        "L'entrée la moins récemment utilisée doit être évincée."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
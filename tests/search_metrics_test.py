@@ -0,0 +1,62 @@
+from unittest.mock import MagicMock, patch
+
+from app.search_metrics import SearchMetricsLogger, StageTimer, aggregate_window
+
+
+# ------------------------------------------------------ Test de l'agrégation par fenêtre ------------------------------------------------------|
+def test_aggregate_window():
+    """
+    Vérifie l'agrégation des similarités d'une fenêtre : moyennes globales et moyenne par rang.
+    """
+    metrics = aggregate_window([[0.9, 0.7], [0.5, 0.3]])
+    assert metrics["search_count"] == 2.0, "Le nombre de recherches est incorrect."
+    assert abs(metrics["mean_cos_similarity"] - 0.6) < 1e-9, "La similarité moyenne est incorrecte."
+    assert abs(metrics["cos_similarity_top_1"] - 0.7) < 1e-9, "La similarité moyenne du rang 1 est incorrecte."
+    assert abs(metrics["cos_similarity_top_2"] - 0.5) < 1e-9, "La similarité moyenne du rang 2 est incorrecte."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de l'envoi groupé à MLflow -------------------------------------------------------|
+def test_search_metrics_logger_flush():
+    """
+    Vérifie que record ne fait aucun appel à MLflow, que flush envoie un seul log_batch par groupe de paramètres
+    et que l'identifiant de l'expérience est mis en cache.
+    """
+    client = MagicMock()
+    client.get_experiment_by_name.return_value.experiment_id = "42"
+    logger = SearchMetricsLogger(window=60, queue_size=3)
+    logger.client = client
+
+    for _ in range(2):
+        logger.record([0.8, 0.6], {"collection_choisie": "False"})
+    logger.record([0.4], {"collection_choisie": "True"})
+    logger.record([0.4], {"collection_choisie": "True"})  # File pleine : mesure ignorée
+    assert client.method_calls == [], "record ne doit faire aucun appel à MLflow."
+    assert logger.dropped == 1, "La mesure excédentaire aurait dû être ignorée."
+
+    logger.flush()
+    logger.record([0.5], {"collection_choisie": "True"})
+    logger.flush()
+
+    assert client.get_experiment_by_name.call_count == 1, "L'identifiant de l'expérience doit être mis en cache."
+    assert client.log_batch.call_count == 3, "Un log_batch par groupe de paramètres et par fenêtre est attendu."
+    assert client.create_run.call_args.args == ("42",), "Le run doit être créé dans l'expérience mise en cache."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test du chronométrage des étapes ------------------------------------------------------|
+def test_stage_timer_server_timing():
+    """
+    Vérifie que chaque mark clôt l'étape en cours et que l'en-tête Server-Timing liste les étapes puis le total, en millisecondes.
+    """
+    timer = StageTimer()
+    timer.started_at = timer.last_mark = 0.0
+
+    with patch("app.search_metrics.time.perf_counter", side_effect=[0.002, 0.0375, 0.0405]):
+        timer.mark("auth")
+        timer.mark("embedding")
+        timer.mark("sql")
+
+    assert list(timer.durations) == ["auth", "embedding", "sql"], "Les étapes doivent être gardées dans l'ordre."
+    assert timer.server_timing() == "auth;dur=2.0, embedding;dur=35.5, sql;dur=3.0, total;dur=40.5", "En-tête Server-Timing incorrect."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -0,0 +1,41 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.search_planner import SearchPlanner
+
+
+# ------------------------------------------------------ Test du choix de stratégie ------------------------------------------------------------|
+def test_search_planner_strategies():
+    """
+    Vérifie le choix de stratégie selon le nombre de chunks interrogés et la sélectivité du filtre :
+    parcours exact pour une petite collection, ANN sans filtre, post-filtrage sur-échantillonné pour un filtre sélectif,
+    et retour au parcours exact quand le sur-échantillonnage dépasserait la limite de hnsw.ef_search.
+    """
+    engine = create_engine("sqlite://")
+    models.Collection.__table__.create(bind=engine)
+    db = sessionmaker(bind=engine)()
+    for collection_id, chunk_count in ((1, 300), (2, 3_000_000), (3, 300_000), (4, 30_000)):
+        db.add(models.Collection(collection_id=collection_id, user_id=1, name=f"collection {collection_id}", chunk_count=chunk_count))
+    db.commit()
+    planner = SearchPlanner()
+
+    plan = planner.plan(db, 10, [1])
+    assert plan["strategy"] == "exact" and plan["exact"], "Une petite collection doit être parcourue exactement."
+
+    plan = planner.plan(db, 10)
+    assert plan["strategy"] == "ann" and plan["ef_search"] >= 20, "Sans filtre, l'index ANN doit servir la recherche."
+
+    plan = planner.plan(db, 10, [3])
+    assert plan["strategy"] == "postfilter", "Un filtre sélectif sans index partiel doit être post-filtré."
+    assert plan["overfetch"] > 1 and plan["ef_search"] >= 10 * plan["overfetch"], "L'index doit être sur-échantillonné."
+    assert planner.plan(db, 10, [3], ef_search=500)["ef_search"] == 500, "L'ef_search de la requête doit être respecté."
+
+    plan = planner.plan(db, 10, [4])
+    assert plan["strategy"] == "exact", "Un filtre trop sélectif pour l'index global doit être parcouru exactement."
+
+    planner.partial_indexes.add(4)
+    plan = planner.plan(db, 10, [4])
+    assert plan["strategy"] == "ann", "Une collection dotée d'un index partiel n'a pas besoin de post-filtrage."
+    db.close()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -0,0 +1,278 @@
+import numpy as np
+from sqlalchemy.dialects import postgresql
+
+from collections import namedtuple
+from types import SimpleNamespace
+
+import pytest
+
+from app import schemas
+from app.search import (
+    binary_quantize, build_search_statement, build_batch_search_statement, build_lexical_statement, reciprocal_rank_fusion, plan_index_names, Explain,
+    build_collections_search_statement, build_document_search_statement, build_similar_documents_statement, document_embedding,
+    search_fingerprint, encode_search_cursor, decode_search_cursor, apply_search_settings, index_scan_size
+)
+from app.recall_check import halfvec_recall
+from app.vector_index import default_ivfflat_lists
+
+
+# ------------------------------------------------------ Utils ---------------------------------------------------------------------------------|
+def compile_postgres(stmt):
+    return str(stmt.compile(dialect=postgresql.dialect()))
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la quantification binaire -----------------------------------------------------|
+def test_binary_quantize():
+    """
+    Vérifie que la quantification binaire suit la règle de pgvector (bit à 1 si la composante est strictement positive).
+    """
+    embedding = np.array([0.5, -0.2, 0.0, 3.0])
+    assert binary_quantize(embedding) == "1001", "La quantification binaire est incorrecte."
+
+    embedding = np.random.randn(1024)
+    bits = binary_quantize(embedding)
+    assert len(bits) == 1024, "La chaîne de bits doit contenir 1024 bits."
+    assert bits.count("1") == int((embedding > 0).sum()), "Le nombre de bits à 1 est incorrect."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test du mode de recherche binaire -----------------------------------------------------|
+def test_build_search_statement_binary_mode():
+    """
+    Vérifie que le mode "binary" préfiltre par distance de Hamming puis reclasse sur la distance L2.
+    """
+    query_embedding = np.random.randn(1024).tolist()
+
+    sql = compile_postgres(build_search_statement(query_embedding, 5, search_mode="binary"))
+    assert "<~>" in sql, "Le préfiltre Hamming est absent de la requête."
+    assert "<->" in sql, "Le reclassement L2 est absent de la requête."
+
+    sql = compile_postgres(build_search_statement(query_embedding, 5))
+    assert "<~>" not in sql, "Le mode vector ne doit pas utiliser le préfiltre Hamming."
+
+    # L'index HNSW doit pouvoir renvoyer tous les candidats du préfiltre (ef_search plafonné à 1000 par pgvector)
+    session = SimpleNamespace(get_bind=lambda: SimpleNamespace(dialect=SimpleNamespace(name="postgresql")), execute=lambda statement: None)
+    assert apply_search_settings(session, index_scan_size(5, "binary"))["hnsw.ef_search"] == 50, \
+        "ef_search doit couvrir top_n * BINARY_RERANK_FACTOR candidats."
+    assert apply_search_settings(session, index_scan_size(5, "binary", 300))["hnsw.ef_search"] == 300, \
+        "ef_search doit couvrir binary_candidates."
+    assert apply_search_settings(session, index_scan_size(5, "binary", 5000))["hnsw.ef_search"] == 1000, \
+        "ef_search ne peut pas dépasser 1000."
+    assert apply_search_settings(session, index_scan_size(5))["hnsw.ef_search"] == 40, "Le mode vector garde l'ef_search par défaut."
+
+    for binary_candidates in (0, -5, schemas.SEARCH_MAX_BINARY_CANDIDATES + 1):
+        with pytest.raises(ValueError):
+            schemas.SearchRequest(query="horaires", search_mode="binary", binary_candidates=binary_candidates)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de l'utilisation de l'index HNSW -------------------------------------------------|
+def test_search_statement_index_friendly():
+    """
+    Vérifie que la recherche trie directement la table chunks, avec ou sans collection (sans jointure, donc compatible avec l'index HNSW)
+    et que le diagnostic EXPLAIN retrouve les index parcourus dans le plan.
+    """
+    query_embedding = np.random.randn(1024).tolist()
+
+    sql = compile_postgres(build_search_statement(query_embedding, 5))
+    assert "JOIN" not in sql, "La recherche sans collection ne doit pas joindre la table documents."
+    assert "ORDER BY distance" in sql and "LIMIT" in sql, "La requête doit trier sur la distance puis limiter."
+    assert "<=>" in sql, "La similarité cosinus doit être calculée par la base."
+    assert "chunks.embedding_solon," not in sql, "Les embeddings des chunks ne doivent pas être renvoyés."
+    assert sql.count("%(query_embedding)s") == 2, "L'embedding de la requête doit être envoyé une seule fois."
+
+    for options in ({}, {"after": (0.4217, 42), "returned": 20}, {"search_mode": "binary"}):
+        sql = compile_postgres(build_search_statement(query_embedding, 5, **options))
+        nearest = sql[sql.index("FROM (SELECT"):sql.index(") AS nearest")]
+        assert "ORDER BY distance \n LIMIT" in nearest and "chunk_id" not in nearest.split("ORDER BY distance")[-1], \
+            "La sous-requête servie par l'index doit trier sur la seule distance (un tri secondaire empêche le parcours de l'index)."
+        assert "ORDER BY nearest.distance, nearest.chunk_id" in sql, "Les distances égales doivent être départagées hors de l'index."
+
+    sql = compile_postgres(build_search_statement(query_embedding, 5, collection_id=3))
+    assert "JOIN" not in sql, "La recherche filtrée par collection ne doit pas faire de jointure."
+    assert "chunks.collection_id = " in sql, "Le filtre doit porter sur chunks.collection_id."
+
+    sql = compile_postgres(build_search_statement(query_embedding, 5, collection_id=3, exact=True))
+    assert "ORDER BY distance" not in sql and "<-> %(query_embedding)s) + " in sql, "Le tri exact doit porter sur une expression hors index."
+
+    sql = compile_postgres(Explain(build_search_statement(query_embedding, 5, collection_id=3)))
+    assert sql.startswith("EXPLAIN (FORMAT JSON) SELECT"), "La requête EXPLAIN est mal formée."
+
+    plan = {
+        "Node Type": "Limit",
+        "Plans": [{"Node Type": "Index Scan", "Index Name": "ix_chunks_embedding_solon_hnsw", "Relation Name": "chunks"}]
+    }
+    assert plan_index_names(plan) == ["ix_chunks_embedding_solon_hnsw"], "L'index HNSW n'est pas retrouvé dans le plan."
+    assert plan_index_names({"Node Type": "Seq Scan", "Relation Name": "chunks"}) == [], "Un parcours séquentiel n'utilise aucun index."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test du nombre de listes IVFFlat ------------------------------------------------------|
+def test_default_ivfflat_lists():
+    """
+    Vérifie le nombre de listes IVFFlat recommandé par pgvector : lignes / 1000 jusqu'à 1M de lignes, racine carrée au-delà.
+    """
+    assert default_ivfflat_lists(0) == 1, "Un index IVFFlat doit avoir au moins une liste."
+    assert default_ivfflat_lists(250_000) == 250, "Le nombre de listes doit valoir lignes / 1000 jusqu'à 1M de lignes."
+    assert default_ivfflat_lists(4_000_000) == 2000, "Le nombre de listes doit valoir la racine carrée au-delà de 1M de lignes."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la recherche hybride ----------------------------------------------------------|
+def test_hybrid_search():
+    """
+    Vérifie la branche plein texte (index GIN sur chunk_tsv) et la fusion RRF pondérée des deux classements.
+    """
+    sql = compile_postgres(build_lexical_statement("référence AB-1234", np.random.randn(1024).tolist(), 20, collection_id=3))
+    assert "websearch_to_tsquery" in sql and "chunks.chunk_tsv @@" in sql, "La branche plein texte doit filtrer sur chunk_tsv."
+    assert "ts_rank_cd" in sql and "ORDER BY rank DESC" in sql, "La branche plein texte doit trier par pertinence."
+    assert "chunks.collection_id = " in sql, "La branche plein texte doit respecter le filtre de collection."
+
+    Row = namedtuple("Row", ["chunk_id"])
+    vector_rows = [Row(1), Row(2), Row(3)]
+    lexical_rows = [Row(3), Row(4)]
+
+    fused = reciprocal_rank_fusion([(vector_rows, 1.0), (lexical_rows, 1.0)], top_n=3, k=60)
+    assert [row.chunk_id for row, _ in fused][:2] == [3, 1], "Un chunk présent dans les deux classements doit passer en tête."
+    assert abs(fused[0][1] - (1 / 63 + 1 / 61)) < 1e-12, "Le score RRF est incorrect."
+
+    fused = reciprocal_rank_fusion([(vector_rows, 0.0), (lexical_rows, 1.0)], top_n=2, k=60)
+    assert [row.chunk_id for row, _ in fused] == [3, 4], "Avec un poids vectoriel nul, seul le classement plein texte compte."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la recherche groupée ----------------------------------------------------------|
+def test_build_batch_search_statement():
+    """
+    Vérifie que la recherche groupée produit une seule requête UNION ALL, avec une sous-requête triée et limitée par requête.
+    """
+    batch = [
+        (0, np.random.randn(1024).tolist(), 5, None),
+        (1, np.random.randn(1024).tolist(), 3, 7),
+        (2, np.random.randn(1024).tolist(), 10, None),
+    ]
+    compiled = build_batch_search_statement(batch).compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+
+    assert sql.count("UNION ALL") == 2, "Les trois recherches doivent être réunies dans une seule requête."
+    assert sql.count("ORDER BY distance \n LIMIT") == 3 and sql.count("LIMIT") == 6, "Chaque recherche doit garder son tri et sa limite."
+    assert sql.count("JOIN") == 0, "La recherche groupée ne doit pas faire de jointure."
+    assert [name for name in compiled.params if name.startswith("query_embedding")] == [
+        "query_embedding_0", "query_embedding_1", "query_embedding_2"
+    ], "Chaque requête doit avoir son propre paramètre d'embedding."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la pagination par curseur -----------------------------------------------------|
+def test_search_cursor_pagination():
+    """
+    Vérifie que le curseur est lié à sa recherche, que la page suivante reprend par clé (sans OFFSET)
+    et que la taille de page est bornée.
+    """
+    request = schemas.SearchRequest(query="horaires", top_n=10, filtre_par_collection="FAQ")
+    fingerprint = search_fingerprint(request)
+    cursor = encode_search_cursor(fingerprint, 0.4217, 42, 20)
+    assert decode_search_cursor(cursor, fingerprint) == ((0.4217, 42), 20), "Le curseur doit restituer la position de la page."
+    assert search_fingerprint(request.model_copy(update={"cursor": cursor, "debug": True})) == fingerprint, \
+        "Le curseur et le mode debug ne font pas partie de l'empreinte."
+
+    for changed in ({"filtre_par_collection": "RH"}, {"top_n": 20}, {"ef_search": 200}, {"probes": 20}, {"routing_top_k": 2}):
+        with pytest.raises(ValueError):
+            decode_search_cursor(cursor, search_fingerprint(request.model_copy(update=changed)))
+    with pytest.raises(ValueError):
+        decode_search_cursor("pas-un-curseur", fingerprint)
+
+    query_embedding = np.random.randn(1024).tolist()
+    compiled = build_search_statement(query_embedding, 10, after=(0.4217, 42), returned=20).compile(dialect=postgresql.dialect())
+    sql = str(compiled)
+    assert "WHERE (nearest.distance, nearest.chunk_id) >" in sql, "La page suivante doit reprendre après (distance, chunk_id)."
+    assert "ORDER BY nearest.distance, nearest.chunk_id" in sql and "OFFSET" not in sql, "La pagination doit se faire par clé, sans OFFSET."
+    assert 30 in compiled.params.values(), "La sous-requête indexée doit couvrir les pages précédentes et la page demandée."
+
+    with pytest.raises(ValueError):
+        schemas.SearchRequest(query="horaires", top_n=5000)
+    with pytest.raises(ValueError):
+        schemas.SearchRequest(query="horaires", search_mode="hybrid", hybrid_candidates=schemas.SEARCH_MAX_HYBRID_CANDIDATES + 1)
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la recherche multi-collections ------------------------------------------------|
+def test_collections_search_statement():
+    """
+    Vérifie que plusieurs collections sont interrogées en une requête (une branche indexée par collection, top-n global)
+    et qu'une seule collection revient à la requête filtrée habituelle.
+    """
+    query_embedding = np.random.randn(1024).tolist()
+
+    sql = compile_postgres(build_collections_search_statement(query_embedding, 5, [1, 2, 3]))
+    assert sql.count("UNION ALL") == 2, "Chaque collection doit avoir sa branche."
+    assert sql.count("chunks.collection_id = ") == 3, "Chaque branche doit filtrer sa collection."
+    assert sql.count("LIMIT") == 7, "Chaque branche et la fusion doivent être limitées à top_n."
+    assert "ORDER BY per_collection.distance, per_collection.chunk_id" in sql, "Le top-n global doit être re-trié par distance."
+    assert "JOIN" not in sql, "La recherche multi-collections ne doit pas faire de jointure."
+
+    single = compile_postgres(build_collections_search_statement(query_embedding, 5, [3]))
+    assert single == compile_postgres(build_search_statement(query_embedding, 5, collection_id=3)), "Une seule collection ne doit rien changer."
+
+    sql = compile_postgres(build_lexical_statement("horaires", query_embedding, 20, collection_ids=[1, 2]))
+    assert "chunks.collection_id IN" in sql, "La branche plein texte doit filtrer sur les collections demandées."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de la recherche de documents -----------------------------------------------------|
+def test_document_search_statement():
+    """
+    Vérifie que l'agrégation par document est faite en SQL (fenêtres par document_id) sur les candidats de l'index vectoriel.
+    """
+    query_embedding = np.random.randn(1024).tolist()
+
+    sql = compile_postgres(build_document_search_statement(query_embedding, 5, 50))
+    assert "row_number() OVER (PARTITION BY candidates.document_id ORDER BY candidates.distance, candidates.chunk_id)" in sql, \
+        "Les passages doivent être classés dans leur document."
+    assert "max(ranked.similarity) OVER (PARTITION BY ranked.document_id)" in sql, "Le score par défaut doit être celui du meilleur chunk."
+    assert "dense_rank() OVER (ORDER BY scored.document_score DESC" in sql, "Les documents doivent être classés par score."
+    assert "ORDER BY distance \n LIMIT" in sql, "Les candidats doivent venir de l'index vectoriel."
+
+    sql = compile_postgres(build_document_search_statement(query_embedding, 5, 50, collection_ids=[1, 2], aggregation="mean_top_k", top_k=3))
+    assert "avg(CASE WHEN (ranked.passage_rank <=" in sql, "Le mode mean_top_k doit moyenner les meilleurs chunks."
+    assert "UNION ALL" in sql, "Le filtre multi-collections doit s'appliquer aux candidats."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test des documents similaires ---------------------------------------------------------|
+def test_similar_documents():
+    """
+    Vérifie que l'embedding d'un document est la moyenne normalisée de ses chunks et que la recherche
+    de documents similaires est un seul tri par distance cosinus (index HNSW de documents).
+    """
+    embeddings = np.random.randn(4, 1024).tolist()
+    embedding = np.asarray(document_embedding(embeddings))
+    assert np.isclose(np.linalg.norm(embedding), 1.0), "L'embedding du document doit être normalisé."
+    assert np.allclose(embedding, np.mean(embeddings, axis=0) / np.linalg.norm(np.mean(embeddings, axis=0)), atol=1e-5), \
+        "L'embedding du document doit être la moyenne de ses chunks."
+    assert document_embedding([]) is None, "Un document sans chunk n'a pas d'embedding."
+
+    sql = compile_postgres(build_similar_documents_statement(7, 5))
+    assert "ORDER BY documents.embedding_solon <=> (SELECT documents.embedding_solon" in sql, "Le tri doit porter sur la distance cosinus."
+    assert "documents.document_id !=" in sql and "LIMIT" in sql, "Le document de référence doit être exclu."
+    assert "documents.collection_id =" not in sql, "Sans filtre, tous les documents sont candidats."
+
+    sql = compile_postgres(build_similar_documents_statement(7, 5, collection_id=2))
+    assert "documents.collection_id =" in sql, "Le filtre de collection doit s'appliquer."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test du rappel halfvec ----------------------------------------------------------------|
+def test_halfvec_recall():
+    """
+    Vérifie que le stockage en float16 conserve un rappel quasi parfait sur des embeddings de dimension 1024.
+    """
+    rng = np.random.default_rng(42)
+    corpus = rng.standard_normal((500, 1024)).astype(np.float32)
+    queries = rng.standard_normal((20, 1024)).astype(np.float32)
+
+    recall = halfvec_recall(corpus, queries, top_k=10)
+    print(f"Rappel@10 halfvec : {recall:.4f}")
+    assert recall >= 0.95, f"Le rappel halfvec est trop faible : {recall}"
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
@@ -0,0 +1,75 @@
+import copy
+
+import pytest
+
+import numpy as np
+import torch
+from transformers import XLMRobertaConfig, XLMRobertaModel
+
+from app.torch_inference import TorchEmbedder, parity_check, cpu_supports_bf16
+
+
+# ------------------------------------------------------ Utils ---------------------------------------------------------------------------------|
+class FakeTokenizer:
+    """Tokenizer de test : un token par mot, padding à droite sur la longueur maximale du batch."""
+
+    def __call__(self, texts, return_tensors="pt", padding=True, truncation=True):
+        lengths = [len(text.split()) for text in texts]
+        max_length = max(lengths)
+        input_ids = torch.full((len(texts), max_length), 1, dtype=torch.long)
+        attention_mask = torch.zeros((len(texts), max_length), dtype=torch.long)
+        for i, text in enumerate(texts):
+            ids = [3 + sum(map(ord, word)) % 90 for word in text.split()]
+            input_ids[i, :len(ids)] = torch.tensor(ids)
+            attention_mask[i, :len(ids)] = 1
+        return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+def tiny_model():
+    torch.manual_seed(0)
+    config = XLMRobertaConfig(vocab_size=100, hidden_size=32, num_hidden_layers=2, num_attention_heads=4, intermediate_size=64)
+    return XLMRobertaModel(config).eval()
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de parité des modes d'inférence --------------------------------------------------|
+def test_inference_modes_parity():
+    """
+    Vérifie que les modes inference_mode et SDPA donnent les mêmes embeddings que le fp32 no_grad,
+    et qu'un batch avec padding donne le même résultat que les textes pris un par un.
+    """
+    model = tiny_model()
+    tokenizer = FakeTokenizer()
+    texts = ["Il fait beau", "Il va faire beau demain matin", "Bonjour"]
+
+    reference_embedder = TorchEmbedder(copy.deepcopy(model), tokenizer, precision="fp32", grad_mode="no_grad", attention="eager")
+    reference = np.vstack([reference_embedder.predict([text]) for text in texts])
+
+    for grad_mode, attention in (("no_grad", "eager"), ("inference_mode", "eager"), ("inference_mode", "sdpa")):
+        embedder = TorchEmbedder(copy.deepcopy(model), tokenizer, precision="fp32", grad_mode=grad_mode, attention=attention)
+        min_similarity, _ = parity_check(reference, embedder.predict(texts))
+        print(f"{grad_mode} / {attention} : cos min = {min_similarity:.6f}")
+        assert min_similarity > 0.9999, f"Le mode {grad_mode} / {attention} s'écarte du fp32 de référence."
+        assert embedder.attention == attention, f"L'attention {attention} n'est pas celle du modèle."
+        assert any(type(module).__name__.endswith("SdpaSelfAttention") for module in embedder.model.modules()) == (attention == "sdpa"), \
+            f"Les couches d'attention ne correspondent pas au mode {attention}."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
+
+
+# ------------------------------------------------------ Test de parité bf16 -------------------------------------------------------------------|
+@pytest.mark.skipif(not cpu_supports_bf16(), reason="Le processeur ne supporte pas bf16 nativement.")
+def test_bf16_parity():
+    """
+    Vérifie que l'inférence bf16 (autocast CPU), en attention eager et SDPA, reste proche du fp32 de référence.
+    """
+    model = tiny_model()
+    tokenizer = FakeTokenizer()
+    texts = ["Il fait beau", "Il va faire beau demain matin", "Bonjour"]
+
+    reference = TorchEmbedder(copy.deepcopy(model), tokenizer, precision="fp32", grad_mode="no_grad", attention="eager").predict(texts)
+    for attention in ("eager", "sdpa"):
+        embedder = TorchEmbedder(copy.deepcopy(model), tokenizer, precision="bf16", grad_mode="inference_mode", attention=attention)
+        assert embedder.precision == "bf16", "Le mode bf16 doit être conservé sur un processeur compatible."
+        min_similarity, _ = parity_check(reference, embedder.predict(texts))
+        print(f"bf16 / {attention} : cos min = {min_similarity:.6f}")
+        assert min_similarity > 0.99, f"Le mode bf16 / {attention} s'écarte du fp32 de référence."
+# ----------------------------------------------------------------------------------------------------------------------------------------------|
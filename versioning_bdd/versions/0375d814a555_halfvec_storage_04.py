@@ -0,0 +1,55 @@
+"""Halfvec storage-04
+
+Revision ID: 0375d814a555
+Revises: 3db5a753ab3e
+Create Date: 2026-10-19 10:03:17.552901+00:00
+
+"""
+from typing import Sequence, Union
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0375d814a555'
+down_revision: Union[str, None] = '3db5a753ab3e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Colonnes d'embeddings concernées par le mode de stockage
+EMBEDDING_COLUMNS = ['embedding_cohere', 'embedding_solon', 'embedding_bge']
+
+
+def set_embedding_storage(storage):
+    """Convertit les colonnes d'embeddings de chunks vers le type pgvector demandé ("vector" ou "halfvec")."""
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    for column in EMBEDDING_COLUMNS:
+        current_type = connection.execute(
+            sa.text(
+                """
+                SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+                WHERE attrelid = 'chunks'::regclass AND attname = :column
+                """
+            ),
+            {"column": column}
+        ).scalar()
+
+        # Ne rien faire si la colonne est déjà dans le bon type
+        if current_type == f"{storage}(1024)":
+            continue
+
+        op.execute(f"ALTER TABLE chunks ALTER COLUMN {column} TYPE {storage}(1024) USING {column}::{storage}(1024)")
+
+
+def upgrade() -> None:
+    # Le mode de stockage suit la même variable d'environnement que app/models.py
+    set_embedding_storage(os.getenv("EMBEDDING_STORAGE", "vector"))
+
+
+def downgrade() -> None:
+    set_embedding_storage("vector")
@@ -0,0 +1,63 @@
+"""Binary embeddings-03
+
+Revision ID: 3db5a753ab3e
+Revises: 45d6328de907
+Create Date: 2026-10-19 09:12:41.204518+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import BIT
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3db5a753ab3e'
+down_revision: Union[str, None] = '45d6328de907'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Version minimale de pgvector pour binary_quantize, bit_hamming_ops, halfvec et l2_normalize (migrations 03, 04, 05 et 11)
+PGVECTOR_MIN_VERSION = (0, 7)
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        # Un volume de données existant garde la version de l'extension créée à l'origine (0.4.1) :
+        # la mettre à jour vers celle installée dans l'image avant d'utiliser les types et fonctions de pgvector 0.7
+        op.execute("ALTER EXTENSION vector UPDATE")
+        version = connection.execute(sa.text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+        if version is None or tuple(int(part) for part in version.split(".")[:2]) < PGVECTOR_MIN_VERSION:
+            raise RuntimeError(
+                f"pgvector >= {'.'.join(map(str, PGVECTOR_MIN_VERSION))} est nécessaire (version installée : {version}), "
+                "voir install_anderson/Dockerfile.postgres."
+            )
+
+    # Copie de embedding_solon quantifiée sur 1 bit par dimension (1024 bits = 128 octets par chunk)
+    op.add_column('chunks', sa.Column('embedding_solon_bin', BIT(1024), nullable=True))
+
+    if connection.dialect.name == 'postgresql':
+        # Remplir la colonne pour les chunks existants (binary_quantize nécessite pgvector >= 0.7)
+        op.execute(
+            """
+            UPDATE chunks SET embedding_solon_bin = binary_quantize(embedding_solon)::bit(1024)
+            WHERE embedding_solon IS NOT NULL
+            """
+        )
+        # Index HNSW sur la distance de Hamming pour le préfiltre des candidats
+        op.execute(
+            """
+            CREATE INDEX IF NOT EXISTS ix_chunks_embedding_solon_bin
+            ON chunks USING hnsw (embedding_solon_bin bit_hamming_ops)
+            """
+        )
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_chunks_embedding_solon_bin")
+    op.drop_column('chunks', 'embedding_solon_bin')
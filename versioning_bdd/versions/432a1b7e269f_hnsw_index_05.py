@@ -0,0 +1,55 @@
+"""Hnsw index-05
+
+Revision ID: 432a1b7e269f
+Revises: 0375d814a555
+Create Date: 2026-10-19 11:12:41.208317+00:00
+
+"""
+from typing import Sequence, Union
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '432a1b7e269f'
+down_revision: Union[str, None] = '0375d814a555'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEX_NAME = 'ix_chunks_embedding_solon_hnsw'
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    # Paramètres de construction : m (connexions par nœud) et ef_construction (candidats explorés à l'insertion)
+    m = int(os.getenv("HNSW_M", 16))
+    ef_construction = int(os.getenv("HNSW_EF_CONSTRUCTION", 64))
+
+    # La classe d'opérateurs dépend du type de stockage de la colonne (migration 04)
+    current_type = connection.execute(
+        sa.text(
+            """
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'chunks'::regclass AND attname = 'embedding_solon'
+            """
+        )
+    ).scalar()
+    opclass = 'halfvec_l2_ops' if current_type.startswith('halfvec') else 'vector_l2_ops'
+
+    op.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON chunks "
+        f"USING hnsw (embedding_solon {opclass}) WITH (m = {m}, ef_construction = {ef_construction})"
+    )
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    op.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
@@ -0,0 +1,47 @@
+"""Chunks collection id-07
+
+Revision ID: 61e3b4e7c88c
+Revises: 8ee4830cfbec
+Create Date: 2026-10-19 12:20:33.915804+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '61e3b4e7c88c'
+down_revision: Union[str, None] = '8ee4830cfbec'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Copie de documents.collection_id sur chaque chunk : la recherche filtrée par collection se fait sans jointure
+    op.add_column('chunks', sa.Column('collection_id', sa.Integer(), nullable=True))
+
+    op.execute(
+        """
+        UPDATE chunks SET collection_id = (
+            SELECT documents.collection_id FROM documents WHERE documents.document_id = chunks.document_id
+        )
+        """
+    )
+
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        op.create_foreign_key(
+            'fk_chunks_collection_id', 'chunks', 'collections', ['collection_id'], ['collection_id']
+        )
+    op.create_index('ix_chunks_collection_id_document_id', 'chunks', ['collection_id', 'document_id'])
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        op.drop_constraint('fk_chunks_collection_id', 'chunks', type_='foreignkey')
+    op.drop_index('ix_chunks_collection_id_document_id', table_name='chunks')
+    # Les index vectoriels partiels par collection (WHERE collection_id = ...) sont supprimés avec la colonne
+    op.drop_column('chunks', 'collection_id')
@@ -0,0 +1,41 @@
+"""Chunks fulltext-08
+
+Revision ID: 6989eb57191c
+Revises: 61e3b4e7c88c
+Create Date: 2026-10-19 13:02:57.480112+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6989eb57191c'
+down_revision: Union[str, None] = '61e3b4e7c88c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        # Colonne générée : remplie par PostgreSQL à chaque insertion ou modification de chunk_text (chunks existants compris)
+        op.execute(
+            """
+            ALTER TABLE chunks ADD COLUMN chunk_tsv tsvector
+            GENERATED ALWAYS AS (to_tsvector('french', chunk_text)) STORED
+            """
+        )
+        # Index GIN pour la branche plein texte de la recherche hybride
+        op.execute("CREATE INDEX IF NOT EXISTS ix_chunks_chunk_tsv ON chunks USING gin (chunk_tsv)")
+    else:
+        op.add_column('chunks', sa.Column('chunk_tsv', sa.Text(), nullable=True))
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_chunks_chunk_tsv")
+    op.drop_column('chunks', 'chunk_tsv')
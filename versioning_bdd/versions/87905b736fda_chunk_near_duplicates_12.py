@@ -0,0 +1,51 @@
+"""Chunk near duplicates-12
+
+Revision ID: 87905b736fda
+Revises: e794bfa0f415
+Create Date: 2026-10-19 16:48:27.931562+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '87905b736fda'
+down_revision: Union[str, None] = 'e794bfa0f415'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Signature MinHash de chaque chunk et lien vers le chunk original d'un quasi-doublon
+    op.add_column('chunks', sa.Column('minhash', sa.LargeBinary(), nullable=True))
+    op.add_column('chunks', sa.Column('duplicate_of', sa.Integer(), nullable=True))
+
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        op.create_foreign_key(
+            'fk_chunks_duplicate_of', 'chunks', 'chunks', ['duplicate_of'], ['chunk_id'], ondelete='SET NULL'
+        )
+
+    # Index LSH : une ligne par bande de la signature des chunks originaux, supprimée avec le chunk
+    op.create_table(
+        'chunk_lsh_bands',
+        sa.Column('chunk_id', sa.Integer(), nullable=False),
+        sa.Column('band', sa.Integer(), nullable=False),
+        sa.Column('band_key', sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['chunk_id'], ['chunks.chunk_id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('chunk_id', 'band')
+    )
+    op.create_index(op.f('ix_chunk_lsh_bands_band_key'), 'chunk_lsh_bands', ['band_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_chunk_lsh_bands_band_key'), table_name='chunk_lsh_bands')
+    op.drop_table('chunk_lsh_bands')
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        op.drop_constraint('fk_chunks_duplicate_of', 'chunks', type_='foreignkey')
+    op.drop_column('chunks', 'duplicate_of')
+    op.drop_column('chunks', 'minhash')
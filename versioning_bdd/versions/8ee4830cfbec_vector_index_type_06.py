@@ -0,0 +1,77 @@
+"""Vector index type-06
+
+Revision ID: 8ee4830cfbec
+Revises: 432a1b7e269f
+Create Date: 2026-10-19 11:48:05.613290+00:00
+
+"""
+from typing import Sequence, Union
+import math
+import os
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8ee4830cfbec'
+down_revision: Union[str, None] = '432a1b7e269f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+HNSW_INDEX_NAME = 'ix_chunks_embedding_solon_hnsw'
+IVFFLAT_INDEX_NAME = 'ix_chunks_embedding_solon_ivfflat'
+
+
+def embedding_opclass(connection):
+    # La classe d'opérateurs dépend du type de stockage de la colonne (migration 04)
+    current_type = connection.execute(
+        sa.text(
+            """
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = 'chunks'::regclass AND attname = 'embedding_solon'
+            """
+        )
+    ).scalar()
+    return 'halfvec_l2_ops' if current_type.startswith('halfvec') else 'vector_l2_ops'
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    # Remplacer l'index HNSW de la migration 05 par un index IVFFlat si VECTOR_INDEX_TYPE=ivfflat
+    if os.getenv("VECTOR_INDEX_TYPE", "hnsw") != 'ivfflat':
+        return
+
+    # Nombre de listes : IVFFLAT_LISTS, ou lignes / 1000 jusqu'à 1M de lignes et racine carrée au-delà (recommandation pgvector)
+    lists = int(os.getenv("IVFFLAT_LISTS", 0))
+    if not lists:
+        row_count = connection.execute(sa.text("SELECT count(*) FROM chunks WHERE embedding_solon IS NOT NULL")).scalar()
+        lists = int(math.sqrt(row_count)) if row_count > 1_000_000 else max(1, row_count // 1000)
+
+    op.execute(
+        f"CREATE INDEX IF NOT EXISTS {IVFFLAT_INDEX_NAME} ON chunks "
+        f"USING ivfflat (embedding_solon {embedding_opclass(connection)}) WITH (lists = {lists})"
+    )
+    op.execute(f"DROP INDEX IF EXISTS {HNSW_INDEX_NAME}")
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    # Revenir à l'index HNSW attendu par la migration 05
+    ivfflat_exists = connection.execute(
+        sa.text("SELECT 1 FROM pg_class WHERE relkind = 'i' AND relname = :name"), {"name": IVFFLAT_INDEX_NAME}
+    ).scalar()
+    if ivfflat_exists:
+        m = int(os.getenv("HNSW_M", 16))
+        ef_construction = int(os.getenv("HNSW_EF_CONSTRUCTION", 64))
+        op.execute(
+            f"CREATE INDEX IF NOT EXISTS {HNSW_INDEX_NAME} ON chunks "
+            f"USING hnsw (embedding_solon {embedding_opclass(connection)}) WITH (m = {m}, ef_construction = {ef_construction})"
+        )
+        op.execute(f"DROP INDEX IF EXISTS {IVFFLAT_INDEX_NAME}")
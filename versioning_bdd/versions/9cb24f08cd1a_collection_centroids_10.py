@@ -0,0 +1,48 @@
+"""Collection centroids-10
+
+Revision ID: 9cb24f08cd1a
+Revises: cf68b6f059cb
+Create Date: 2026-10-19 15:12:40.218734+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9cb24f08cd1a'
+down_revision: Union[str, None] = 'cf68b6f059cb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Somme des embeddings et nombre de chunks de chaque collection : la distance cosinus à la somme est celle au centroïde
+    op.add_column('collections', sa.Column('embedding_sum', Vector(dim=1024), nullable=True))
+    op.add_column('collections', sa.Column('chunk_count', sa.Integer(), nullable=False, server_default='0'))
+
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        # Calcul initial à partir des chunks existants (embeddings halfvec convertis en vector pour la somme)
+        op.execute(
+            """
+            UPDATE collections SET
+                embedding_sum = totals.embedding_sum,
+                chunk_count = totals.chunk_count
+            FROM (
+                SELECT collection_id, sum(embedding_solon::vector) AS embedding_sum, count(*) AS chunk_count
+                FROM chunks
+                WHERE embedding_solon IS NOT NULL AND collection_id IS NOT NULL
+                GROUP BY collection_id
+            ) AS totals
+            WHERE collections.collection_id = totals.collection_id
+            """
+        )
+
+
+def downgrade() -> None:
+    op.drop_column('collections', 'chunk_count')
+    op.drop_column('collections', 'embedding_sum')
@@ -0,0 +1,39 @@
+"""Search generations-09
+
+Revision ID: cf68b6f059cb
+Revises: 6989eb57191c
+Create Date: 2026-10-19 13:41:09.337254+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cf68b6f059cb'
+down_revision: Union[str, None] = '6989eb57191c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Compteurs de génération partagés par tous les workers de l'API : invalidation du cache de résultats de /search
+    op.create_table(
+        'search_generations',
+        sa.Column('scope', sa.String(length=50), nullable=False),
+        sa.Column('generation', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('scope')
+    )
+    op.execute("INSERT INTO search_generations (scope, generation) VALUES ('global', 0)")
+    op.execute(
+        """
+        INSERT INTO search_generations (scope, generation)
+        SELECT 'collection:' || collection_id, 0 FROM collections
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('search_generations')
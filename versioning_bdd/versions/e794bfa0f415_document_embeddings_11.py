@@ -0,0 +1,52 @@
+"""Document embeddings-11
+
+Revision ID: e794bfa0f415
+Revises: 9cb24f08cd1a
+Create Date: 2026-10-19 16:02:11.504127+00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from pgvector.sqlalchemy import Vector
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e794bfa0f415'
+down_revision: Union[str, None] = '9cb24f08cd1a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Embedding de chaque document : moyenne normalisée des embeddings de ses chunks
+    op.add_column('documents', sa.Column('embedding_solon', Vector(dim=1024), nullable=True))
+
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        # Calcul initial à partir des chunks existants (embeddings halfvec convertis en vector pour la moyenne)
+        op.execute(
+            """
+            UPDATE documents SET embedding_solon = l2_normalize(means.embedding_mean)
+            FROM (
+                SELECT document_id, avg(embedding_solon::vector) AS embedding_mean
+                FROM chunks
+                WHERE embedding_solon IS NOT NULL
+                GROUP BY document_id
+            ) AS means
+            WHERE documents.document_id = means.document_id
+            """
+        )
+        # Index HNSW (distance cosinus) pour /documents/{document_id}/similar
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_documents_embedding_solon_hnsw "
+            "ON documents USING hnsw (embedding_solon vector_cosine_ops)"
+        )
+
+
+def downgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_documents_embedding_solon_hnsw")
+    op.drop_column('documents', 'embedding_solon')